@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+import random
+import socket
+import time
+import zlib
+from collections import Counter, namedtuple
+
+from aiohttp import web
+
+
+class CDNConfig(namedtuple('CDNConfig', [
+    'latency', 'jitter', 'error_rate', 'throttle_rate', 'retry_after', 'min_size', 'max_size', 'seed'
+])):
+    """
+    Behaviour of the fake image CDN.
+
+    latency: Base response time in seconds.
+    jitter: Mean of an exponentially distributed extra delay (a long tail like a real CDN).
+    error_rate: Share of requests answered with a 503.
+    throttle_rate: Share of requests answered with a 429 and a Retry-After header of `retry_after` seconds.
+    min_size, max_size: Range of the image sizes in bytes, the size of an image depends only on its URL.
+    """
+
+
+DEFAULT_CDN_CONFIG = CDNConfig(
+    latency=0.05, jitter=0.05, error_rate=0.01, throttle_rate=0.01, retry_after=1,
+    min_size=20_000, max_size=300_000, seed=0
+)
+
+
+class FakeCDN:
+    """An aiohttp server that answers /image/<name> with random bytes of a stable size after a random delay."""
+
+    def __init__(self, config=DEFAULT_CDN_CONFIG):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        # Images are slices of a single random blob, so serving them costs no CPU
+        self.blob = random.Random(config.seed).randbytes(config.max_size)
+        self.stats = Counter()
+
+    def get_size(self, name):
+        return self.config.min_size + zlib.crc32(name.encode()) % (self.config.max_size - self.config.min_size + 1)
+
+    async def handle_image(self, request):
+        config = self.config
+        self.stats['requests'] += 1
+        await asyncio.sleep(config.latency + self.rng.expovariate(1 / config.jitter) if config.jitter else config.latency)
+
+        draw = self.rng.random()
+        if draw < config.throttle_rate:
+            self.stats['429'] += 1
+            return web.Response(status=429, headers={'Retry-After': str(config.retry_after)})
+        if draw < config.throttle_rate + config.error_rate:
+            self.stats['503'] += 1
+            return web.Response(status=503)
+
+        body = self.blob[:self.get_size(request.match_info['name'])]
+        self.stats['200'] += 1
+        self.stats['bytes_served'] += len(body)
+        return web.Response(body=body, content_type='image/jpeg')
+
+    async def handle_stats(self, request):
+        return web.json_response(dict(self.stats))
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_get('/image/{name}', self.handle_image)
+        app.router.add_get('/stats', self.handle_stats)
+        return app
+
+
+def get_free_port(host='127.0.0.1'):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def _serve(config, host, port):
+    web.run_app(FakeCDN(config).create_app(), host=host, port=port, print=None, handle_signals=False)
+
+
+def start_fake_cdn(config=DEFAULT_CDN_CONFIG, host='127.0.0.1', port=None, timeout=10):
+    """
+    Start the fake CDN in a separate process, so it doesn't compete with the downloader for the GIL.
+
+    :return: The server process (terminate it when done) and the base URL of the images.
+    """
+    port = port or get_free_port(host)
+    process = multiprocessing.Process(target=_serve, args=(config, host, port), name="fake-cdn", daemon=True)
+    process.start()
+
+    # Wait until the server accepts connections
+    for _ in range(int(timeout / 0.05)):
+        try:
+            socket.create_connection((host, port), timeout=0.05).close()
+            break
+        except OSError:
+            if not process.is_alive():
+                raise RuntimeError("The fake CDN has failed to start.")
+            time.sleep(0.05)
+    else:
+        process.terminate()
+        raise RuntimeError(f"The fake CDN hasn't started on {host}:{port} in {timeout}s.")
+    return process, f"http://{host}:{port}/image"
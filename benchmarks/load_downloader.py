@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import aiohttp
+
+from core.downloader import Downloader, DOWNLOADS_IN_FLIGHT
+from core.settings import (
+    MAX_CONCURRENT_BATCHES, DOWNLOAD_MAX_ATTEMPTS, DOWNLOAD_BACKOFF_BASE, CIRCUIT_BREAKER_THRESHOLD,
+    CIRCUIT_BREAKER_COOLDOWN
+)
+from core.utilities.enums import CategoryType
+from core.utilities.log import get_logger
+from core.utilities.memory import MemoryBudget, get_rss, get_peak_rss
+from core.utilities.proxy_pool import ProxyPool
+from core.utilities.retry import RetryPolicy, CircuitBreaker, DeadLetterFile
+
+from benchmarks.fake_cdn import CDNConfig, DEFAULT_CDN_CONFIG, start_fake_cdn
+
+
+logger = get_logger(__name__)
+
+
+def percentile(values, quantile):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class InMemoryStorage:
+    """
+    A stand-in of the MinIO client that keeps the sizes of the uploaded objects.
+    An upload blocks for `upload_latency` seconds, like the synchronous MinIO client does.
+    """
+
+    def __init__(self, upload_latency=0.0):
+        self.upload_latency = upload_latency
+        self.buckets = {}
+
+    def create_bucket(self, bucket_name):
+        self.buckets.setdefault(bucket_name, {})
+
+    def upload_image(self, bucket_name, image_key, image_data):
+        if self.upload_latency:
+            time.sleep(self.upload_latency)
+        self.buckets[bucket_name][image_key] = len(image_data)
+
+    def get_stats(self):
+        return {
+            'objects': sum(len(bucket) for bucket in self.buckets.values()),
+            'bytes': sum(sum(bucket.values()) for bucket in self.buckets.values()),
+        }
+
+
+class MeasuredDownloader(Downloader):
+    """A Downloader that records the latency of every image and the bytes held between download and save."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.bytes_in_flight = 0
+
+    async def download_image(self, record, url, counter):
+        # Includes the retries and backoff delays, i.e. the time until the image is there or given up
+        started = time.perf_counter()
+        try:
+            return await super().download_image(record, url, counter)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    async def get_image_records(self, record, url, counter):
+        image_records = await super().get_image_records(record, url, counter)
+        self.bytes_in_flight += sum(len(image_data) for _, image_data in image_records)
+        return image_records
+
+    async def save_image_records(self, image_records):
+        try:
+            await super().save_image_records(image_records)
+        finally:
+            self.bytes_in_flight -= sum(len(image_data) for _, image_data in image_records)
+
+
+def generate_records(base_url, records, photos_per_record):
+    categories = [category.verbose_name for category in CategoryType]
+    return [
+        {
+            'id': record_id,
+            'category': categories[record_id % len(categories)],
+            'photo_URLs': [f"{base_url}/{record_id}-{counter}.jpg" for counter in range(1, photos_per_record + 1)],
+        }
+        for record_id in range(1, records + 1)
+    ]
+
+
+async def sample(downloader, samples, interval):
+    """Sample the bytes in flight, the downloads in flight and the RSS until cancelled."""
+    while True:
+        samples.append((
+            downloader.bytes_in_flight,
+            DOWNLOADS_IN_FLIGHT.values.get((), 0),
+            get_rss(),
+        ))
+        await asyncio.sleep(interval)
+
+
+async def run_load(downloader, sample_interval):
+    samples = []
+    sampler = asyncio.create_task(sample(downloader, samples, sample_interval))
+    started = time.perf_counter()
+    try:
+        await downloader.run()
+    finally:
+        seconds = time.perf_counter() - started
+        sampler.cancel()
+    return seconds, samples
+
+
+async def get_cdn_stats(base_url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(base_url.rsplit('/', 1)[0] + '/stats') as response:
+            return await response.json()
+
+
+def count_dead_letters(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as file:
+        return sum(1 for line in file if line.strip())
+
+
+def make_report(downloader, storage, seconds, samples, dead_letters, cdn_stats, rss_before):
+    latencies = downloader.latencies
+    stored = storage.get_stats()
+    mb = 2 ** 20
+    return {
+        'images': stored['objects'],
+        'failed_images': dead_letters,
+        'seconds': round(seconds, 3),
+        'images_per_second': round(stored['objects'] / seconds, 1),
+        'mb_per_second': round(stored['bytes'] / mb / seconds, 2),
+        'latency_p50': round(percentile(latencies, 0.5), 4) if latencies else None,
+        'latency_p99': round(percentile(latencies, 0.99), 4) if latencies else None,
+        'latency_max': round(max(latencies), 4) if latencies else None,
+        'peak_mb_in_flight': round(max((sample[0] for sample in samples), default=0) / mb, 2),
+        'mean_mb_in_flight': round(sum(sample[0] for sample in samples) / max(len(samples), 1) / mb, 2),
+        'peak_downloads_in_flight': max((sample[1] for sample in samples), default=0),
+        'rss_before_mb': round(rss_before / mb, 1),
+        'rss_peak_mb': round(max(get_peak_rss(), max((sample[2] for sample in samples), default=0)) / mb, 1),
+        'rss_after_mb': round(get_rss() / mb, 1),
+        'cdn': cdn_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load-test the Downloader against a local fake image CDN and an in-memory object store."
+    )
+    parser.add_argument("--records", type=int, default=500)
+    parser.add_argument("--photos", type=int, default=8, help="Photos per record.")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--max-concurrent-batches", type=int, default=MAX_CONCURRENT_BATCHES)
+    parser.add_argument("--latency", type=float, default=DEFAULT_CDN_CONFIG.latency, help="Base CDN latency in seconds.")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_CDN_CONFIG.jitter,
+                        help="Mean extra CDN latency in seconds (exponentially distributed).")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_CDN_CONFIG.error_rate, help="Share of 503s.")
+    parser.add_argument("--throttle-rate", type=float, default=DEFAULT_CDN_CONFIG.throttle_rate, help="Share of 429s.")
+    parser.add_argument("--retry-after", type=int, default=DEFAULT_CDN_CONFIG.retry_after,
+                        help="Retry-After of the 429s in seconds.")
+    parser.add_argument("--min-size", type=int, default=DEFAULT_CDN_CONFIG.min_size, help="Minimum image size in bytes.")
+    parser.add_argument("--max-size", type=int, default=DEFAULT_CDN_CONFIG.max_size, help="Maximum image size in bytes.")
+    parser.add_argument("--upload-latency", type=float, default=0.0,
+                        help="Seconds a (blocking) upload to the in-memory store takes.")
+    parser.add_argument("--max-attempts", type=int, default=DOWNLOAD_MAX_ATTEMPTS)
+    parser.add_argument("--backoff-base", type=float, default=DOWNLOAD_BACKOFF_BASE)
+    parser.add_argument("--breaker-threshold", type=int, default=CIRCUIT_BREAKER_THRESHOLD)
+    parser.add_argument("--breaker-cooldown", type=float, default=CIRCUIT_BREAKER_COOLDOWN)
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="RSS above which the downloader stops starting new batches.")
+    parser.add_argument("--sample-interval", type=float, default=0.1, help="Seconds between memory samples.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also save the report as JSON to this file.")
+    args = parser.parse_args()
+
+    config = CDNConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after, min_size=args.min_size, max_size=args.max_size, seed=args.seed
+    )
+    cdn_process, base_url = start_fake_cdn(config)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            dead_letters_path = os.path.join(directory, 'dead_letters.jsonl')
+            storage = InMemoryStorage(args.upload_latency)
+            downloader = MeasuredDownloader(
+                batch_size=args.batch_size,
+                user_id=0,
+                source_obj=generate_records(base_url, args.records, args.photos),
+                output_storage=storage,
+                retry_policy=RetryPolicy(max_attempts=args.max_attempts, base_delay=args.backoff_base),
+                circuit_breaker=CircuitBreaker(args.breaker_threshold, args.breaker_cooldown),
+                dead_letters=DeadLetterFile(dead_letters_path),
+                max_concurrent_batches=args.max_concurrent_batches,
+                # The load goes straight to the fake CDN
+                proxy_pool=ProxyPool(proxies=[]),
+                memory_budget=MemoryBudget(args.memory_budget),
+            )
+            rss_before = get_rss()
+            logger.info("Downloading %d images from %s...", args.records * args.photos, base_url)
+            seconds, samples = asyncio.run(run_load(downloader, args.sample_interval))
+            cdn_stats = asyncio.run(get_cdn_stats(base_url))
+            report = make_report(
+                downloader, storage, seconds, samples, count_dead_letters(dead_letters_path), cdn_stats, rss_before
+            )
+    finally:
+        cdn_process.terminate()
+        cdn_process.join()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'settings': vars(args), 'report': report}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import logging
+import sys
+
+from core.settings import BENCHMARK_BASELINE_FILE, BENCHMARK_TOLERANCE
+from core.utilities.log import setup_logging
+
+from benchmarks.suite import (
+    BENCHMARKS, Workload, run_benchmarks, make_report, load_baseline, save_baseline, find_regressions
+)
+
+
+def print_results(results):
+    print(f"{'benchmark':<12} {'items':>9} {'seconds':>9} {'items/s':>12} {'peak MB':>9}")
+    for name, result in results.items():
+        if 'skipped' in result:
+            print(f"{name:<12} skipped: {result['skipped']}")
+        else:
+            print(
+                f"{name:<12} {result['items']:>9} {result['seconds']:>9.3f} "
+                f"{result['items_per_second']:>12.0f} {result['peak_mb']:>9.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput and peak memory of the parsing, deduplication and persistence hot paths."
+    )
+    parser.add_argument("--pages", type=int, default=200, help="Number of synthetic pages.")
+    parser.add_argument("--limit", type=int, default=300, help="Items per synthetic page.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1,
+                        help="Share of items that repeat items of the previous pages.")
+    parser.add_argument("--recorded", metavar="DIR",
+                        help="Use the pages recorded by the response cache in DIR instead of synthetic ones.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the best time is kept.")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE_FILE, help="Baseline results file.")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE,
+                        help="Relative slowdown or memory growth reported as a regression.")
+    args = parser.parse_args()
+
+    # Per-page log lines would be measured along with the code
+    setup_logging(level=logging.WARNING)
+
+    workload = Workload(args.pages, args.limit, args.seed, args.duplicate_ratio, args.recorded)
+    report = make_report(workload, run_benchmarks(workload, args.only, args.repeat))
+    print_results(report['results'])
+
+    if args.save_baseline:
+        save_baseline(report, args.baseline)
+        print(f"Baseline saved to {args.baseline}.")
+        return
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print("No baseline to compare with. Run with --save-baseline to create one.")
+    elif baseline['workload'] != report['workload']:
+        print(f"The baseline was measured on another workload ({baseline['workload']}). Skipping the comparison.")
+    else:
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
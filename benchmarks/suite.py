@@ -0,0 +1,240 @@
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+from core.parsers import BaseParser
+from core.settings import BENCHMARK_DB_NAME, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, DB_SCHEMA
+from core.utilities.other_functions import return_unique_records
+from core.utilities.response_cache import ResponseCache
+
+from benchmarks.synthetic import iter_synthetic_pages, iter_recorded_pages
+
+
+class Workload(namedtuple('Workload', ['pages', 'limit', 'seed', 'duplicate_ratio', 'recorded_dir'])):
+    """Pages fed to every benchmark: synthetic ones or the ones recorded by the response cache."""
+
+    def iter_pages(self):
+        if self.recorded_dir:
+            return iter_recorded_pages(self.recorded_dir)
+        return iter_synthetic_pages(self.pages, self.limit, self.seed, self.duplicate_ratio)
+
+    def describe(self):
+        if self.recorded_dir:
+            return {'recorded_dir': self.recorded_dir}
+        return {'pages': self.pages, 'limit': self.limit, 'seed': self.seed, 'duplicate_ratio': self.duplicate_ratio}
+
+
+class BenchmarkSkipped(Exception):
+    """Raised by a benchmark that can't run in the current environment."""
+
+
+class Stopwatch:
+    """
+    Accumulates the time spent inside `with stopwatch:` blocks, so preparing the input is not measured.
+    While tracemalloc is tracing, it also keeps the peak of the memory allocated inside a block.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.peak_bytes = 0
+        self._started = None
+        self._memory_at_start = 0
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            self._memory_at_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.seconds += time.perf_counter() - self._started
+        if tracemalloc.is_tracing():
+            self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1] - self._memory_at_start)
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark: a function of (workload, stopwatch) that returns the number of processed items."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def get_parser():
+    return BaseParser(browser=None, base_url='', response_cache=ResponseCache(mode='off'))
+
+
+def parse_all(workload):
+    parser = get_parser()
+    objects = []
+    for category_name, page in workload.iter_pages():
+        objects.extend(parser._parse_data(page, category_name))
+    return objects
+
+
+@benchmark('json_decode')
+def bench_json_decode(workload, stopwatch):
+    items = 0
+    for _, page in workload.iter_pages():
+        body = json.dumps(page, ensure_ascii=False)
+        with stopwatch:
+            items += len(json.loads(body)['items'])
+    return items
+
+
+@benchmark('parse')
+def bench_parse(workload, stopwatch):
+    parser = get_parser()
+    items = 0
+    for category_name, page in workload.iter_pages():
+        with stopwatch:
+            items += len(parser._parse_data(page, category_name))
+    return items
+
+
+@benchmark('dedup')
+def bench_dedup(workload, stopwatch):
+    objects = parse_all(workload)
+    with stopwatch:
+        return_unique_records(objects)
+    return len(objects)
+
+
+@benchmark('csv')
+def bench_csv(workload, stopwatch):
+    # pandas is only needed by this benchmark
+    import pandas as pd
+    from core.utilities.csv import PandasHelper
+
+    objects = parse_all(workload)
+    with tempfile.TemporaryDirectory() as directory:
+        helper = PandasHelper(path_to_save=directory)
+        with stopwatch:
+            helper.save_data_to_csv_file(pd.DataFrame(objects), 'benchmark.csv')
+            helper.merge_from_csv_files([os.path.join(directory, 'benchmark.csv')])
+    return len(objects)
+
+
+@benchmark('db_write')
+def bench_db_write(workload, stopwatch):
+    if not BENCHMARK_DB_NAME:
+        raise BenchmarkSkipped("Set BENCHMARK_DB_NAME (and the DB_* settings) to benchmark against a local Postgres.")
+    # psycopg2 is only needed by this benchmark
+    from database.db import DailyParserDB
+
+    db = DailyParserDB(
+        host=DB_HOST, user=DB_USER, port=DB_PORT, password=DB_PASSWORD, db_name=BENCHMARK_DB_NAME, db_schema=DB_SCHEMA
+    )
+    if db.conn is None:
+        raise BenchmarkSkipped(f"Couldn't connect to the benchmark database '{BENCHMARK_DB_NAME}'.")
+    db.create_table(DB_SCHEMA['unique_records'])
+    with db.conn as conn, conn.cursor() as cursor:
+        cursor.execute("TRUNCATE unique_records;")
+
+    parser = get_parser()
+    items = 0
+    for category_name, page in workload.iter_pages():
+        # A batch can't update the same row twice
+        objects = return_unique_records(parser._parse_data(page, category_name))
+        with stopwatch:
+            counts = db.save_to_db('unique_records', objects)
+        if objects and counts is None:
+            # save_to_db logs and swallows its errors, a failed write must not pass for a fast one
+            db.conn.close()
+            raise RuntimeError("Couldn't save the objects into 'unique_records', see the log.")
+        items += len(objects)
+    db.conn.close()
+    return items
+
+
+def measure(func, workload, repeat=3):
+    """
+    Run a benchmark `repeat` times for its best time, then once more under tracemalloc for its peak memory
+    (tracing slows the code down, so the two are never measured in the same run).
+    """
+    seconds = []
+    items = 0
+    for _ in range(repeat):
+        stopwatch = Stopwatch()
+        items = func(workload, stopwatch)
+        seconds.append(stopwatch.seconds)
+
+    stopwatch = Stopwatch()
+    tracemalloc.start()
+    try:
+        func(workload, stopwatch)
+    finally:
+        tracemalloc.stop()
+
+    best = min(seconds)
+    return {
+        'items': items,
+        'seconds': round(best, 6),
+        'items_per_second': round(items / best, 1) if best else None,
+        'peak_mb': round(stopwatch.peak_bytes / 2 ** 20, 3),
+    }
+
+
+def run_benchmarks(workload, names=None, repeat=3):
+    """
+    :return: Results of every benchmark, or the reason it was skipped.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        try:
+            results[name] = measure(BENCHMARKS[name], workload, repeat)
+        except BenchmarkSkipped as e:
+            results[name] = {'skipped': str(e)}
+    return results
+
+
+def make_report(workload, results):
+    return {
+        'workload': workload.describe(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(report, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+def find_regressions(report, baseline, tolerance, memory_slack_mb=1.0):
+    """
+    Compare the results with a baseline of the same workload.
+
+    :param tolerance: Allowed relative drop of the throughput and growth of the peak memory, e.g. 0.15.
+    :param memory_slack_mb: Absolute growth of the peak memory that is never reported, so tiny peaks don't flap.
+    :return: Descriptions of the regressions.
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        previous = baseline['results'].get(name)
+        if 'skipped' in result or not previous or 'skipped' in previous:
+            continue
+        if previous['items_per_second'] and result['items_per_second'] < previous['items_per_second'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['items_per_second']:.0f} items/s, baseline {previous['items_per_second']:.0f} items/s"
+            )
+        if result['peak_mb'] > previous['peak_mb'] * (1 + tolerance) + memory_slack_mb:
+            regressions.append(f"{name}: peak {result['peak_mb']:.1f} MB, baseline {previous['peak_mb']:.1f} MB")
+    return regressions
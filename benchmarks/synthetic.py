@@ -0,0 +1,96 @@
+import gzip
+import json
+import os
+import random
+
+from core.utilities.enums import CategoryType
+
+
+TITLES = {
+    'vehicles_and_parts': ("Шины летние R17", "Toyota Camry, 2018", "Аккумулятор 60 А·ч", "Диски литые R16"),
+    'household_equipment': ("Стиральная машина Bosch", "Холодильник Indesit", "Пылесос Dyson V11", "Микроволновка LG"),
+    'real_estate': ("2-к. квартира, 54 м²", "Студия, 25 м²", "Дом 120 м² на участке 6 сот.", "Гараж, 18 м²"),
+    'electronics': ("iPhone 13, 128 ГБ", "Ноутбук Lenovo ThinkPad", "Телевизор Samsung 55\"", "Наушники Sony WH-1000XM4"),
+}
+LOCATIONS = ("Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург", "Нижний Новгород")
+PRICE_POSTFIXES = ("", "", "", "за сутки", "в месяц", "за м²")
+
+
+def generate_item(rng, item_id, category_name):
+    """
+    A raw item of an Avito API page with the fields the parsers read and a few that they ignore,
+    so the size of a page is close to a real one.
+    """
+    title = rng.choice(TITLES[category_name])
+    price = rng.randrange(500, 15_000_000, 100)
+    images = [
+        {
+            size: f"https://{rng.randint(0, 99):02d}.img.avito.st/image/1/{item_id}{counter}.{size}.jpg"
+            for size in ('208x156', '432x324', '640x640', '864x864')
+        }
+        for counter in range(rng.randint(1, 10))
+    ]
+    return {
+        'type': 'item',
+        'id': item_id,
+        'categoryId': rng.randint(1, 120),
+        'category': {'id': rng.randint(1, 120), 'slug': category_name.split('_')[0]},
+        'title': title,
+        'description': f"{title}. " * rng.randint(5, 30),
+        'priceDetailed': {
+            'string': f"{price:,} ₽".replace(',', ' '),
+            'value': price,
+            'postfix': rng.choice(PRICE_POSTFIXES),
+        },
+        'location': {'id': rng.randint(600_000, 700_000), 'name': rng.choice(LOCATIONS)},
+        'coords': {'lat': rng.uniform(43, 60), 'lng': rng.uniform(30, 90)},
+        'images': images,
+        'imagesCount': len(images),
+        'urlPath': f"/{category_name}/{title.lower().replace(' ', '_')}_{item_id}",
+        'sortTimeStamp': 1_700_000_000_000 + item_id,
+        'isFavorite': False,
+    }
+
+
+def generate_page(rng, category_name, offset, limit, duplicate_ratio=0.0):
+    """
+    A page of `limit` items, with item IDs following the offset.
+
+    :param duplicate_ratio: Share of items that repeat items of the previous pages,
+        like the reshuffled listings of a real crawl.
+    """
+    items = []
+    for position in range(offset, offset + limit):
+        item_id = position + 1
+        if position and rng.random() < duplicate_ratio:
+            item_id = rng.randint(1, position)
+        items.append(generate_item(rng, item_id, category_name))
+    return {'items': items}
+
+
+def iter_synthetic_pages(pages, limit, seed=0, duplicate_ratio=0.1):
+    """
+    Generate pages one by one, cycling through the categories, so the whole workload is never held in memory.
+
+    :return: An iterator of (category name, page JSON data).
+    """
+    rng = random.Random(seed)
+    categories = [category.verbose_name for category in CategoryType]
+    offsets = dict.fromkeys(categories, 0)
+    for number in range(pages):
+        category_name = categories[number % len(categories)]
+        yield category_name, generate_page(rng, category_name, offsets[category_name], limit, duplicate_ratio)
+        offsets[category_name] += limit
+
+
+def iter_recorded_pages(directory):
+    """
+    Read the pages recorded by the response cache (RESPONSE_CACHE_MODE=record).
+    The cache files are keyed by a hash of the URL, so the category of a page is unknown.
+
+    :return: An iterator of ('recorded', page JSON data).
+    """
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if entry.name.endswith('.json.gz'):
+            with gzip.open(entry.path, 'rt', encoding='utf-8') as file:
+                yield 'recorded', json.load(file)
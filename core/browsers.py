@@ -1,3 +1,6 @@
+import statistics
+import time
+
 import undetected_chromedriver as uc
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -5,14 +8,167 @@ from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException
 
+from core.exceptions import AccessDeniedException
+from core.settings import LEAN_BROWSER, PAGE_LOAD_STRATEGY, BLOCKED_URL_PATTERNS, MEASURE_NAVIGATION
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# Chrome features that are not needed to read the API pages
+LEAN_ARGUMENTS = (
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-notifications",
+    "--no-first-run",
+    "--mute-audio",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication",
+)
+
+
+class TimedDriver:
+    """
+    A webdriver wrapper that measures every navigation.
+
+    For every `get` it records the wall time and the Navigation Timing of the page (time to DOMContentLoaded,
+    time to the load event and the transferred bytes). A summary is printed when the driver quits.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.timings = []
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def get(self, url):
+        started = time.monotonic()
+        try:
+            self.driver.get(url)
+        finally:
+            timing = {'url': url, 'seconds': time.monotonic() - started}
+            timing.update(self._get_navigation_timing())
+            self.timings.append(timing)
+            logger.info(
+                "Navigation took %.2fs", timing['seconds'],
+                extra={key: value for key, value in timing.items() if key != 'seconds'}
+            )
+
+    def _get_navigation_timing(self):
+        try:
+            entry = self.driver.execute_script(
+                "const entry = performance.getEntriesByType('navigation')[0];"
+                "return entry ? entry.toJSON() : null;"
+            )
+        except Exception:
+            return {}
+        if not entry:
+            return {}
+        return {
+            'dom_content_loaded': round(entry['domContentLoadedEventEnd']),
+            'load': round(entry['loadEventEnd']),
+            'transfer_size': entry['transferSize'],
+        }
+
+    def summary(self):
+        """Count, mean, median and maximum navigation time in seconds."""
+        seconds = [timing['seconds'] for timing in self.timings]
+        if not seconds:
+            return {'navigations': 0}
+        return {
+            'navigations': len(seconds),
+            'mean': statistics.mean(seconds),
+            'median': statistics.median(seconds),
+            'max': max(seconds),
+            'transferred_bytes': sum(timing.get('transfer_size', 0) for timing in self.timings),
+        }
+
+    def quit(self):
+        summary = self.summary()
+        if summary['navigations']:
+            logger.info(
+                "Navigations: %d, mean: %.2fs, median: %.2fs, max: %.2fs, transferred: %d bytes.",
+                summary['navigations'], summary['mean'], summary['median'], summary['max'], summary['transferred_bytes']
+            )
+        self.driver.quit()
+
+
+class RotatingProxyDriver:
+    """
+    A webdriver that goes through a proxy of a ProxyPool and sticks to it until it is rate limited.
+    `rotate` restarts the browser on the best available proxy, so the driver object stays the same for its users.
+    Chrome's --proxy-server doesn't take credentials, so the proxies must not require authentication.
+    """
+
+    def __init__(self, browser, proxy_pool):
+        self.browser = browser
+        self.proxy_pool = proxy_pool
+        self.session_id = f"driver-{id(self)}"
+        self.proxy = None
+        self.driver = None
+        self._start()
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def _start(self):
+        self.proxy = self.proxy_pool.acquire(self.session_id)
+        if self.proxy is None:
+            raise AccessDeniedException("All the proxies are rate limited. Access denied.")
+        logger.info("Starting the browser on proxy %s.", self.proxy)
+        self.browser.proxy = self.proxy
+        self.driver = self.browser.create_driver()
+
+    def get(self, url):
+        started = time.monotonic()
+        try:
+            self.driver.get(url)
+        except TimeoutException:
+            self.proxy_pool.report_failure(self.proxy)
+            raise
+        self.proxy_pool.report_success(self.proxy, time.monotonic() - started)
+
+    def rotate(self):
+        """Report the current proxy as rate limited and restart the browser on another one."""
+        self.proxy_pool.report_blocked(self.proxy)
+        self.driver.quit()
+        self._start()
+
+    def quit(self):
+        self.proxy_pool.release(self.session_id)
+        self.driver.quit()
+
+
 class ChromeBrowser:
     """ A class for initializing base Chrome webdriver"""
 
-    def __init__(self, headless=False, disable_images=True, timeout=30, proxy=None):
+    def __init__(
+            self, headless=False, disable_images=True, timeout=30, proxy=None,
+            lean=LEAN_BROWSER, page_load_strategy=PAGE_LOAD_STRATEGY, blocked_urls=BLOCKED_URL_PATTERNS,
+            measure=MEASURE_NAVIGATION, proxy_pool=None
+    ):
+        """
+        :param lean: Use the lean navigation profile: the `page_load_strategy`, blocking of `blocked_urls`
+            through CDP and Chrome features that the API pages don't need turned off.
+        :param page_load_strategy: 'eager' waits for DOMContentLoaded only, 'none' returns right after the
+            navigation starts (the delay between requests gives the page time to arrive).
+        :param blocked_urls: URL patterns (with '*' wildcards) that are never requested in the lean profile.
+        :param measure: Wrap the driver in a TimedDriver that reports the timing of every navigation.
+        :param proxy_pool: A ProxyPool to draw the proxy from instead of the static `proxy`.
+        """
         self.headless = headless
         self.disable_images = disable_images
         self.timeout = timeout
         self.proxy = proxy
+        self.lean = lean
+        self.page_load_strategy = page_load_strategy
+        self.blocked_urls = blocked_urls
+        self.measure = measure
+        self.proxy_pool = proxy_pool
 
 
     def _set_options(self,options=None):
@@ -20,6 +176,11 @@ class ChromeBrowser:
         options = options or Options()
         options.add_argument("--disable-gpu")
 
+        if self.lean:
+            options.page_load_strategy = self.page_load_strategy
+            for argument in LEAN_ARGUMENTS:
+                options.add_argument(argument)
+
         if self.headless:
             options.add_argument("--headless")  # Run in headless mode if you don't need a GUI
         
@@ -31,24 +192,43 @@ class ChromeBrowser:
         
         return options
 
+    def _configure_driver(self, driver):
+        """Set the timeouts and the lean profile of a new driver."""
+        driver.set_page_load_timeout(self.timeout)
+        if self.lean and self.blocked_urls:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(self.blocked_urls)})
+        if self.measure:
+            return TimedDriver(driver)
+        return driver
+
     def get_driver(self):
+        """
+        Start a driver. With an enabled proxy pool the driver is a RotatingProxyDriver
+        that moves to another proxy when its own one is rate limited.
+        """
+        if self.proxy_pool is not None and self.proxy_pool.enabled:
+            return RotatingProxyDriver(self, self.proxy_pool)
+        return self.create_driver()
+
+    def create_driver(self):
         # Initialize the Chrome driver
-        print("Initializing Chrome driver...")
+        logger.info("Initializing Chrome driver...")
         try:
             options = self._set_options()
             driver = webdriver.Chrome(
                 service=Service(ChromeDriverManager().install()), 
                 options=options
                 )
-            driver.set_page_load_timeout(self.timeout)
-            print(f"Driver object {driver} has been initialized.")
+            driver = self._configure_driver(driver)
+            logger.info("Driver %s has been initialized.", driver)
             return driver
         
         except TimeoutException as e:
-            print(f"Couldn't load the page source.")
+            logger.error("Couldn't load the page source.")
             raise e
         except Exception as e:
-            print(f"{type(e).__name__} occured during driver initialization: {e}")
+            logger.error("%s occurred during driver initialization: %s", type(e).__name__, e)
             raise e
 
 
@@ -56,22 +236,22 @@ class UndetectedChromeBrowser(ChromeBrowser):
     """ A class for initializing undetected Chrome webdriver"""
 
 
-    def get_driver(self):
+    def create_driver(self):
 
         # Initialize the Chrome driver
-        print("Initializing Undetected Chrome driver...")
+        logger.info("Initializing Undetected Chrome driver...")
         try:
             options = self._set_options(options=uc.ChromeOptions())
             driver = uc.Chrome(options)
-            driver.set_page_load_timeout(self.timeout)
-            print(f"Driver object {driver} has been initialized.")
+            driver = self._configure_driver(driver)
+            logger.info("Driver %s has been initialized.", driver)
             return driver
         
         except TimeoutException as e:
-            print(f"Couldn't load the page source.")
+            logger.error("Couldn't load the page source.")
             raise e
         except Exception as e:
-            print(f"{type(e).__name__} occured during driver initialization: {e}")
+            logger.error("%s occurred during driver initialization: %s", type(e).__name__, e)
             raise e
     
 
@@ -0,0 +1,166 @@
+import math
+import os
+import socket
+import time
+
+from core.exceptions import AccessDeniedException
+from core.settings import CRAWL_LEASE_SECONDS, CRAWL_TASK_MAX_ATTEMPTS, CRAWL_POLL_INTERVAL
+from core.utilities.enums import CategoryType
+from core.utilities.other_functions import get_utc_timestamp, return_unique_records
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def get_worker_id():
+    """A worker ID that is unique across hosts and processes."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class CrawlCoordinator:
+    """Plans page tasks for every category and watches the crawl queue until it's done."""
+
+    def __init__(self, db, max_attempts=CRAWL_TASK_MAX_ATTEMPTS):
+        """
+        :param db: A CrawlQueueDB instance.
+        :param max_attempts: Number of attempts per task before it is marked as failed.
+        """
+        self.db = db
+        self.max_attempts = max_attempts
+
+    def plan(self, total_goal, limit, location=False, categories=CategoryType):
+        """
+        Put the page tasks needed to fetch `total_goal` objects into the queue,
+        split evenly between the categories.
+
+        :param total_goal: Total number of objects to fetch.
+        :param limit: Number of objects per API call.
+        :param location: Location filter for the requests.
+        :param categories: Categories to crawl.
+        :return: Number of new tasks.
+        """
+        categories = list(categories)
+        last_stamp = get_utc_timestamp()
+        pages_per_category = math.ceil(total_goal / len(categories) / limit)
+        tasks = [
+            {
+                'category_id': category.category_id,
+                'page_offset': page * limit,
+                'page_limit': limit,
+                'last_stamp': last_stamp,
+                'location': location
+            }
+            for category in categories
+            for page in range(pages_per_category)
+        ]
+        logger.info("Planned %d pages for each of %d categories.", pages_per_category, len(categories))
+        return self.db.enqueue_tasks(tasks)
+
+    def monitor(self, poll_interval=CRAWL_POLL_INTERVAL, should_stop=None):
+        """
+        Release expired leases and report progress until there are no pending or leased tasks left.
+
+        :param poll_interval: Seconds between checks.
+        :param should_stop: Optional callable that ends monitoring early when it returns True.
+        :return: The final queue statistics.
+        """
+        while True:
+            self.db.release_expired_leases(self.max_attempts)
+            stats = self.db.get_queue_stats()
+            logger.info(
+                "Crawl queue: %s. Objects saved: %d.",
+                ", ".join(f"{status}: {value['tasks']}" for status, value in sorted(stats.items())),
+                sum(value['items_saved'] for value in stats.values())
+            )
+            if not stats.get('pending') and not stats.get('leased'):
+                return stats
+            if should_stop and should_stop():
+                return stats
+            time.sleep(poll_interval)
+
+
+class CrawlWorker:
+    """Leases page tasks from the crawl queue, fetches them with its own browser and saves new objects."""
+
+    def __init__(
+            self,
+            parser,
+            db,
+            worker_id=None,
+            lease_seconds=CRAWL_LEASE_SECONDS,
+            max_attempts=CRAWL_TASK_MAX_ATTEMPTS,
+            poll_interval=CRAWL_POLL_INTERVAL
+    ):
+        """
+        :param parser: A BaseParser instance used to fetch and parse the pages.
+        :param db: A CrawlQueueDB instance (a separate connection per worker).
+        :param worker_id: ID of the worker (defaults to host name and process ID).
+        :param lease_seconds: For how long a leased task belongs to the worker.
+        :param max_attempts: Number of attempts per task before it is marked as failed.
+        :param poll_interval: Seconds to wait when there are no pending tasks but others are still leased.
+        """
+        self.parser = parser
+        self.db = db
+        self.worker_id = worker_id or get_worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+
+    def process_task(self, driver, task):
+        """
+        Fetch the page of a task and save the objects that are not stored yet into 'unique_records'.
+
+        :return: A tuple of the number of fetched and saved objects.
+        :raise Exception: If the page couldn't be fetched or saved, so that the task is failed and retried rather than completed.
+        """
+        category = CategoryType.get_by_id(task['category_id'])
+        fetched_objects = self.parser.fetch_objects_or_raise(
+            driver, category, task['page_limit'], task['page_offset'], task['last_stamp'], task['location']
+        )
+        fetched_objects = return_unique_records(fetched_objects)
+        known_ids = self.db.get_known_object_ids([obj['id'] for obj in fetched_objects])
+        new_objects = [obj for obj in fetched_objects if obj['id'] not in known_ids]
+        if new_objects and self.db.save_to_db('unique_records', new_objects) is None:
+            raise RuntimeError(f"Couldn't save {len(new_objects)} objects into 'unique_records'.")
+        return len(fetched_objects), len(new_objects)
+
+    def run(self, driver):
+        """
+        Process tasks until the queue is empty.
+
+        :return: Number of completed tasks.
+        """
+        completed = 0
+        logger.info("Worker %s started.", self.worker_id)
+        while True:
+            task = self.db.lease_task(self.worker_id, self.lease_seconds, self.max_attempts)
+            if task is None:
+                # Expired leases that have used up their attempts are never leased again, so mark them as failed
+                self.db.release_expired_leases(self.max_attempts)
+                stats = self.db.get_queue_stats()
+                if not stats.get('pending') and not stats.get('leased'):
+                    break
+                # Other workers still hold leases that may expire and come back to the queue
+                time.sleep(self.poll_interval)
+                continue
+
+            try:
+                items_fetched, items_saved = self.process_task(driver, task)
+            except AccessDeniedException as e:
+                self.db.fail_task(task['id'], self.worker_id, str(e), self.max_attempts)
+                logger.error("Access denied for worker %s. Stopping the worker.", self.worker_id)
+                break
+            except Exception as e:
+                self.db.fail_task(task['id'], self.worker_id, f"{type(e).__name__}: {e}", self.max_attempts)
+                logger.exception("%s occurred processing task %s: %s", type(e).__name__, task['id'], e)
+                continue
+
+            if self.db.complete_task(task['id'], self.worker_id, items_fetched, items_saved):
+                completed += 1
+                logger.info("Worker %s completed task %s: %d/%d new objects.", self.worker_id, task['id'], items_saved, items_fetched)
+            else:
+                logger.warning("Lease on task %s has expired before completion.", task['id'])
+
+        logger.info("Worker %s finished. Completed tasks: %d.", self.worker_id, completed)
+        return completed
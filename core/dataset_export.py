@@ -0,0 +1,262 @@
+import io
+import itertools
+import json
+import os
+import tarfile
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from core.settings import (
+    BUCKET_NAME, EXPORT_OBJECTS_PER_SHARD, EXPORT_SHARD_WRITERS, EXPORT_FETCH_WORKERS, EXPORT_FETCH_AHEAD
+)
+from core.utilities.log import get_logger, ProgressLogger
+from core.utilities.metrics import REGISTRY
+from core.utilities.minio import create_image_key
+
+
+logger = get_logger(__name__)
+
+EXPORTED_SAMPLES = REGISTRY.counter('export_samples_total', "Image and metadata pairs written to dataset shards.")
+EXPORTED_BYTES = REGISTRY.counter('export_bytes_total', "Bytes written to dataset shards.")
+MISSING_IMAGES = REGISTRY.counter('export_missing_images_total', "Images of exported objects that are not in the bucket.")
+
+# Columns of an object that are not a part of the metadata of its samples
+NOT_EXPORTED_COLUMNS = ('content_hash',)
+
+
+def get_shard_name(shard_index):
+    return f"shard-{shard_index:06d}.tar"
+
+
+def to_json(value):
+    # NUMERIC columns are Decimals, timestamps are datetimes
+    return float(value) if isinstance(value, Decimal) else str(value)
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def add_file(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+
+class ExportManifest:
+    """
+    The settings of an export and its completed shards, saved after every shard.
+    A shard is only listed once its file is complete, so an interrupted export resumes by skipping the listed shards.
+    """
+
+    FILE_NAME = 'manifest.json'
+
+    def __init__(self, output_dir, config, shards=None):
+        self.path = os.path.join(output_dir, self.FILE_NAME)
+        self.config = config
+        self.shards = shards or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, output_dir, config, resume=False):
+        """
+        :param resume: Continue the export in `output_dir`. Otherwise, the directory must not have an export yet.
+        :raise ValueError: If there is an export with other settings to resume, or an export that is not to be resumed.
+        """
+        path = os.path.join(output_dir, cls.FILE_NAME)
+        if not os.path.exists(path):
+            os.makedirs(output_dir, exist_ok=True)
+            manifest = cls(output_dir, config)
+            manifest.save()
+            return manifest
+        if not resume:
+            raise ValueError(f"{output_dir} already has an export. Resume it or choose another directory.")
+
+        with open(path) as file:
+            saved = json.load(file)
+        if saved['config'] != config:
+            raise ValueError(f"The export in {output_dir} was made with other settings: {saved['config']}.")
+        logger.info("Resuming the export in %s: %d shards are done.", output_dir, len(saved['shards']))
+        return cls(output_dir, config, saved['shards'])
+
+    def is_done(self, shard_name):
+        with self._lock:
+            return shard_name in self.shards
+
+    def add_shard(self, shard_name, stats):
+        with self._lock:
+            self.shards[shard_name] = stats
+            self.save()
+
+    def get_totals(self):
+        with self._lock:
+            totals = Counter()
+            categories = Counter()
+            for stats in self.shards.values():
+                totals.update({key: value for key, value in stats.items() if key != 'categories'})
+                categories.update(stats['categories'])
+        return {**totals, 'shards': len(self.shards), 'categories': dict(categories)}
+
+    def save(self):
+        # Written to a temporary file first, so an interruption never leaves a broken manifest
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump({'config': self.config, 'shards': self.shards}, file, indent=2)
+        os.replace(temp_path, self.path)
+
+
+class DatasetExporter:
+    """
+    Exports the objects assigned to users and their photos as WebDataset shards: tar files in which
+    every photo '<object id>-<photo number>.<ext>' is followed by its metadata '<object id>-<photo number>.json'.
+
+    Objects are streamed from Postgres through a server-side cursor and cut into shards of `objects_per_shard` objects.
+    Up to `shard_writers` shards are written in parallel; every writer fetches the photos of its shard from MinIO
+    `fetch_ahead` photos ahead through a pool of `fetch_workers` threads, so the export is bound by the network
+    and the disk rather than by the round trips of single rows and photos.
+    """
+
+    def __init__(
+            self, db, storage, output_dir, bucket_name=BUCKET_NAME, objects_per_shard=EXPORT_OBJECTS_PER_SHARD,
+            shard_writers=EXPORT_SHARD_WRITERS, fetch_workers=EXPORT_FETCH_WORKERS, fetch_ahead=EXPORT_FETCH_AHEAD,
+            extension='jpg', suffix=''
+    ):
+        """
+        :param db: A DailyParserDB.
+        :param storage: A MinioClient, thread-safe with at least `fetch_workers` connections.
+        :param extension: Extension of the photos in the bucket ('webp' if they have been post-processed).
+        :param suffix: Suffix of the photo variant to export, e.g. '-256' for the thumbnails of post-processed photos.
+        """
+        self.db = db
+        self.storage = storage
+        self.output_dir = output_dir
+        self.bucket_name = bucket_name
+        self.objects_per_shard = objects_per_shard
+        self.shard_writers = shard_writers
+        self.fetch_workers = fetch_workers
+        self.fetch_ahead = fetch_ahead
+        self.extension = extension
+        self.suffix = suffix
+        self.fetch_pool = None
+        self.progress = None
+
+    def run(self, categories=None, per_category=None, fraction=1.0, seed=0, resume=False):
+        """
+        Export a sample of the objects (see DailyParserDB.iter_objects_sample for the sampling).
+
+        :param resume: Continue an interrupted export in the output directory, which must have been made with the same settings.
+            The objects of the finished shards are still read from the database, but their photos are not fetched again.
+        :return: Totals of the export: shards, objects, samples, missing images, bytes and samples per category.
+        """
+        config = {
+            'bucket': self.bucket_name,
+            'categories': sorted(categories) if categories else None,
+            'per_category': per_category,
+            'fraction': fraction,
+            'seed': seed,
+            'objects_per_shard': self.objects_per_shard,
+            'extension': self.extension,
+            'suffix': self.suffix,
+        }
+        manifest = ExportManifest.open(self.output_dir, config, resume)
+        self.progress = ProgressLogger(logger, "Exported samples")
+        # Bounds the shards whose objects are held in memory
+        free_slots = threading.BoundedSemaphore(self.shard_writers * 2)
+        failed = threading.Event()
+        futures = []
+
+        def release(future):
+            if future.exception() is not None:
+                failed.set()
+            free_slots.release()
+
+        self.fetch_pool = ThreadPoolExecutor(self.fetch_workers, thread_name_prefix="export-fetch")
+        objects = self.db.iter_objects_sample(categories, per_category, fraction, seed)
+        try:
+            with ThreadPoolExecutor(self.shard_writers, thread_name_prefix="export-shard") as writer_pool:
+                for shard_index, shard_objects in enumerate(iter_chunks(objects, self.objects_per_shard)):
+                    shard_name = get_shard_name(shard_index)
+                    if manifest.is_done(shard_name):
+                        continue
+                    free_slots.acquire()
+                    if failed.is_set():
+                        break
+                    future = writer_pool.submit(self.write_shard, manifest, shard_name, shard_objects)
+                    future.add_done_callback(release)
+                    futures.append(future)
+            # Re-raise the error of a failed shard; the shards written so far stay in the manifest
+            for future in futures:
+                future.result()
+        finally:
+            # Closes the server-side cursor
+            objects.close()
+            self.fetch_pool.shutdown(cancel_futures=True)
+
+        self.progress.done()
+        totals = manifest.get_totals()
+        logger.info(
+            "Exported %d objects (%d samples, %.1f MB) into %d shards in %s; %d images were missing.",
+            totals.get('objects', 0), totals.get('samples', 0), totals.get('bytes', 0) / 2 ** 20, totals['shards'],
+            self.output_dir, totals.get('missing_images', 0)
+        )
+        return totals
+
+    def write_shard(self, manifest, shard_name, objects):
+        path = os.path.join(self.output_dir, shard_name)
+        stats = Counter(objects=len(objects))
+        categories = Counter()
+        # A shard interrupted halfway stays a temporary file and is written again on resume
+        temp_path = f"{path}.tmp"
+        with tarfile.open(temp_path, 'w') as tar:
+            for obj, counter, image_key, image_data in self.iter_images(objects):
+                if image_data is None:
+                    stats['missing_images'] += 1
+                    continue
+                key = f"{obj['id']}-{counter}"
+                metadata = {
+                    **{col: value for col, value in obj.items() if col not in NOT_EXPORTED_COLUMNS},
+                    'image_number': counter,
+                    'image_key': image_key,
+                }
+                metadata = json.dumps(metadata, ensure_ascii=False, default=to_json).encode()
+                add_file(tar, f"{key}.{self.extension}", image_data)
+                add_file(tar, f"{key}.json", metadata)
+                stats['samples'] += 1
+                stats['bytes'] += len(image_data) + len(metadata)
+                categories[obj['category']] += 1
+                self.progress.add()
+        os.replace(temp_path, path)
+
+        EXPORTED_SAMPLES.inc(stats['samples'])
+        EXPORTED_BYTES.inc(stats['bytes'])
+        MISSING_IMAGES.inc(stats['missing_images'])
+        manifest.add_shard(shard_name, {**stats, 'categories': dict(categories)})
+        logger.debug("Shard %s written: %d samples.", shard_name, stats['samples'])
+
+    def iter_images(self, objects):
+        """
+        Fetch the photos of the objects, `fetch_ahead` at a time, and yield them in order.
+
+        :return: An iterator of (object, photo number, image key, image data or None if it's not in the bucket).
+        :raise Exception: If a photo couldn't be fetched for another reason, so that the shard fails and is written again on resume.
+        """
+        pending = deque()
+        for obj in objects:
+            for counter in range(1, len(obj['photo_URLs'] or []) + 1):
+                image_key = create_image_key(obj, counter, self.suffix, self.extension)
+                future = self.fetch_pool.submit(self.storage.get_image, self.bucket_name, image_key, missing_ok=True)
+                pending.append((obj, counter, image_key, future))
+                if len(pending) >= self.fetch_ahead:
+                    yield self.pop_image(pending)
+        while pending:
+            yield self.pop_image(pending)
+
+    @staticmethod
+    def pop_image(pending):
+        obj, counter, image_key, future = pending.popleft()
+        return obj, counter, image_key, future.result()
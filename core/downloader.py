@@ -1,32 +1,56 @@
 import ast
 import asyncio
+import concurrent.futures
 import csv
 import os
+import threading
+import time
+from urllib.parse import urlparse
 
 import aiofiles
 import aiohttp
 import asyncpg
 
-from core.settings import DOWNLOAD_DIR, BASE_DIR, BUCKET_NAME
+from core.settings import (
+    DOWNLOAD_DIR, BASE_DIR, BUCKET_NAME, DB_CURSOR_PREFETCH, MAX_CONCURRENT_BATCHES, PIPELINE_MAX_PENDING,
+    DOWNLOADER_MEMORY_BUDGET_MB
+)
+from core.utilities.images import ImageProcessor
+from core.utilities.log import get_logger, ProgressLogger
+from core.utilities.memory import MemoryBudget, PROFILER
 from core.utilities.minio import create_image_key
+from core.utilities.metrics import REGISTRY, timed, count_items
+from core.utilities.proxy_pool import ProxyPool
+from core.utilities.retry import RetryPolicy, CircuitBreaker, DeadLetterFile
 
 
+DOWNLOADED_BYTES = REGISTRY.counter('downloaded_bytes_total', "Bytes of downloaded images.")
+DOWNLOADS_IN_FLIGHT = REGISTRY.gauge('downloads_in_flight', "Image downloads in progress.")
 
-async def create_filename(record, counter):
+logger = get_logger(__name__)
+
+
+
+async def create_filename(record, counter, suffix='', extension='jpg'):
     # Create a unique filename with the domain name and counter
     category = record['category']
     record_id = record['id']
     domain_name = f"{category.lower()}-{record_id}"
-    print(f"Filename: {domain_name}-{counter}.jpg")
-    return f"{domain_name}-{counter}.jpg"
+    logger.debug("Filename: %s-%s%s.%s", domain_name, counter, suffix, extension)
+    return f"{domain_name}-{counter}{suffix}.{extension}"
 
 
 
 class Downloader:
     def __init__(
-            self, batch_size, user_id, source_db=None, source_file=None, source_obj=None, output_db=None, output_storage=None
+            self, batch_size, user_id, source_db=None, source_file=None, source_obj=None, output_db=None, output_storage=None,
+            retry_policy=None, circuit_breaker=None, dead_letters=None,
+            prefetch=DB_CURSOR_PREFETCH, max_concurrent_batches=MAX_CONCURRENT_BATCHES, processor=None,
+            hash_index=None, proxy_pool=None, memory_budget=None
     ):
         self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.max_concurrent_batches = max_concurrent_batches
         self.user_id = user_id
         self.session = None
         self.source_db = source_db
@@ -35,6 +59,23 @@ class Downloader:
         self.output_db = output_db
         self.pool = None
         self.output_storage = output_storage
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.dead_letters = dead_letters or DeadLetterFile()
+        # Proxies are shared with the browsers when the same pool is passed to both (disabled without PROXIES)
+        self.proxy_pool = proxy_pool or ProxyPool()
+        # Above the budget no new batch starts until the running ones are done
+        self.memory_budget = memory_budget or MemoryBudget(DOWNLOADER_MEMORY_BUDGET_MB)
+        # Per-image messages are debug traces, the default output is an aggregate progress line
+        self.progress = ProgressLogger(logger, "Downloaded images")
+        # Optional post-processing stage (an ImageProcessor) between download and save
+        self.processor = processor
+        # Optional PerceptualHashIndex that collects the hashes of the saved images
+        self.hash_index = hash_index
+        if self.hash_index is not None:
+            # Hashing needs decoded images, so it always goes through the process pool
+            self.processor = self.processor or ImageProcessor(target_sizes=())
+            self.processor.compute_hash = True
         if not self.output_db and not self.output_storage:
             self.output_directory = DOWNLOAD_DIR
             os.makedirs(self.output_directory,exist_ok=True)
@@ -43,51 +84,53 @@ class Downloader:
     async def init_session(self):
         """Initialize the session inside the event loop."""
         self.session = aiohttp.ClientSession()
-        print("Session initialized.")
+        logger.debug("Session initialized.")
 
     async def close_session(self):
         """Close the session inside the event loop."""
         await self.session.close()
-        print("Session closed.")
+        logger.debug("Session closed.")
 
     async def create_pool(self):
         if self.output_db:
             self.pool = await asyncpg.create_pool(**self.output_db)
-            print(f"Successfully created a connection pool for the database '{self.output_db['database']}'.")
+            logger.info("Created a connection pool for the database '%s'.", self.output_db['database'])
 
     async def close_pool(self):
         if self.pool:
             await self.pool.close()
-            print("Connection pool to the database closed.")
+            logger.debug("Connection pool to the database closed.")
 
     async def get_records_from_db(self):
         """
-        Asynchronously fetch records from PostgreSQL database using asyncpg.
+        Asynchronously stream records from PostgreSQL database using an asyncpg server-side cursor.
+        Rows are fetched in chunks of `prefetch` rows, so memory usage doesn't depend on the table size.
         """
         # Establish connection using asyncpg
         conn = await asyncpg.connect(**self.source_db)
         query =  "SELECT id, category, photo_URLs FROM objects;"
-        # Fetch the records asynchronously
-        records = await conn.fetch(query)
-
-        # Close the connection
-        await conn.close()
-        print(f"Successfully fetched {len(records)} records from the database.")
-        # Create the record and append to the list
-
-        return records
+        counter = 0
+        try:
+            # Cursors only live inside a transaction
+            async with conn.transaction():
+                async for record in conn.cursor(query, prefetch=self.prefetch):
+                    counter += 1
+                    yield dict(record)
+        finally:
+            # Close the connection
+            await conn.close()
+            logger.info("Fetched %d records from the database.", counter)
 
 
     async def get_records_from_csv(self):
         """
-        Function to extract records from a CSV file, ensuring photo_URLs is a proper list.
+        Function to lazily extract records from a CSV file, ensuring photo_URLs is a proper list.
         """
-        records = []
         file_path = os.path.join(BASE_DIR, 'data', self.source_file)
         with open(file_path, 'r') as file:
             reader = csv.reader(file)
             next(reader)  # Skip the header row
-            for row in reader:
+            for row_number, row in enumerate(reader, start=1):
                 # Ensure we're accessing the correct column indices
                 category = row[1]  # The category should be in the second column (index 1)
                 object_id = row[0]  # The id should be in the first column (index 0)
@@ -105,29 +148,36 @@ class Downloader:
                     if not isinstance(photo_urls, list):
                         photo_urls = []  # Ensure it's a list
                 except (ValueError, SyntaxError) as e:
-                    print(f"Error parsing photo URLs: {e}")
+                    logger.warning("Error parsing photo URLs in row %d: %s", row_number, e)
                     photo_urls = []  # In case parsing fails, use an empty list
 
-                # Create the record and append to the list
-                record = {
-                    'object_id': object_id,
+                yield {
+                    'id': object_id,
                     'category': category,
                     'photo_URLs': photo_urls
                 }
-                records.append(record)
 
-        return records
+                # Let the scheduled downloads run while the file is being read
+                if row_number % self.prefetch == 0:
+                    await asyncio.sleep(0)
+
+    async def get_records_from_obj(self):
+        """
+        Asynchronously iterate over the records of the source object.
+        """
+        for record in self.source_obj:
+            yield record
 
-    async def get_objects_from_source(self):
+    def get_objects_from_source(self):
         """
-        Asynchronously fetch records from the source object.
+        Return an async iterator over the records of the configured source.
         """
         if self.source_db:
-            return await self.get_records_from_db()
+            return self.get_records_from_db()
         elif self.source_file:
-            return await self.get_records_from_csv()
+            return self.get_records_from_csv()
         elif self.source_obj:
-                return self.source_obj
+            return self.get_records_from_obj()
         else:
             raise ValueError("Invalid source.")
 
@@ -142,54 +192,181 @@ class Downloader:
 
         photo_urls = record.get('photo_URLs') if record.get('photo_URLs') is not None else record.get('photo_urls')
         # Download each image with a unique counter for the record
-        tasks = [self.download_image(record, url, counter) for counter, url in enumerate(photo_urls, start=1)]
+        tasks = [self.get_image_records(record, url, counter) for counter, url in enumerate(photo_urls, start=1)]
 
-        # Gather all the tasks and run them concurrently
-        image_data_filename_pairs = await asyncio.gather(*tasks)
+        # Gather all the tasks and run them concurrently, the images of a record share a proxy
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            self.proxy_pool.release(self.get_proxy_session_id(record))
         # Prepare records for DB or disk saving
-        image_records = [(filename, image_data) for filename, image_data in image_data_filename_pairs if image_data]
+        image_records = [image_record for image_records in results for image_record in image_records]
+        await self.save_image_records(image_records)
+
+    async def get_image_records(self, record, url, counter):
+        """
+        Download an image and pass it through the post-processing stage, if there is one.
+
+        :return: A list of (filename, image_data) pairs ready to be saved, empty if the image is lost.
+        """
+        DOWNLOADS_IN_FLIGHT.inc()
+        try:
+            filename, image_data = await self.download_image(record, url, counter)
+        finally:
+            DOWNLOADS_IN_FLIGHT.dec()
+        if not image_data:
+            return []
+        if not self.processor:
+            return [(filename, image_data)]
+
+        result = await self.processor.process(image_data)
+        if result is None:
+            logger.warning("Invalid image data downloaded from %s. Dropping it.", url)
+            await self.dead_letters.write(record, url, counter, "Invalid image data")
+            return []
+
+        variants, image_hash = result
+        if variants:
+            image_records = [
+                (await self.create_image_name(record, counter, suffix, self.processor.extension), variant_data)
+                for suffix, variant_data in variants
+            ]
+        else:
+            # No target sizes: the image has only been validated (and hashed)
+            image_records = [(filename, image_data)]
+
+        if self.hash_index is not None and image_hash is not None:
+            self.hash_index.add(image_records[0][0], image_hash)
+        return image_records
+
+    async def save_image_records(self, image_records):
+        """Save (filename, image_data) pairs to the configured output."""
         if self.output_db:
             await self.save_to_db(image_records)
         else:
             # Save each image to disk or the database if successfully downloaded
             for filename, image_data in image_records:
-                print(f"Saving {filename}")
+                logger.debug("Saving %s", filename)
                 if image_data:
                     if self.output_storage:
                         await self.save_to_bucket(filename,image_data)
                     else:
-                        await self.save_to_disk(filename, image_data)
+                        await self.save_to_disk(image_data, filename)
                 else:
-                    print(f"No image data found for {filename}...")
-
+                    logger.warning("No image data found for %s.", filename)
+
+    async def create_image_name(self, record, counter, suffix='', extension='jpg'):
+        """Create an object key for the bucket or a filename for the database/disk."""
+        if self.output_storage:
+            return create_image_key(record, counter, suffix, extension)
+        return await create_filename(record, counter, suffix, extension)
+
+    @staticmethod
+    def get_proxy_session_id(record):
+        return f"record-{record['id']}"
+
+    async def acquire_proxy(self, record):
+        """Return the proxy of a record's session, waiting for one to come back if all are paused (None without proxies)."""
+        if not self.proxy_pool.enabled:
+            return None
+        while True:
+            proxy = self.proxy_pool.acquire(self.get_proxy_session_id(record))
+            if proxy is not None:
+                return proxy
+            delay = self.proxy_pool.next_available_in()
+            logger.warning("All the proxies are paused. Waiting %.0fs...", delay)
+            await asyncio.sleep(delay)
 
     # Create an async function to download an image with a domain name and counter
+    @timed('image_download')
     async def download_image(self, record, url, counter):
         """
         Download an image with a domain name and counter.
+        Transient errors (429/5xx and connection errors) are retried according to the retry policy,
+        hosts that keep failing are paused by the circuit breaker,
+        and URLs that still fail are written to the dead-letter file, unless the image is gone (404/410).
 
         :param record: A dictionary containing 'category', 'unique_id', and 'photo_URLs'.
         :param url: The URL of the image to download.
         """
-        print(f"Processing record: {record}")  # Print the record
-        print(f"Trying to download from {url}")
-        try:
-            async with self.session.get(url) as response:
-                if response.status == 200:
-                    image_data = await response.read()
-                    print(f"Image data size for {url}: {len(image_data)}")
-                    if self.output_storage:
-                        filename = create_image_key(record, counter)
-                    if self.output_db:
-                        filename = await create_filename(record, counter)
-                    return filename, image_data
-                else:
-                    print(f"Failed to download {url}: Status code {response.status}")
-        except Exception as e:
-            print(f"{type(e).__name__} occurred downloading {url}: {str(e)}")
-
+        logger.debug("Downloading image %d of record %s: %s", counter, record.get('id'), url)
+        host = urlparse(url).netloc
+        reason = None
+
+        for attempt in range(1, self.retry_policy.max_attempts + 1):
+            await self.circuit_breaker.wait_until_closed(host)
+            proxy = await self.acquire_proxy(record)
+            logger.debug("Trying to download from %s (attempt %d/%d)", url, attempt, self.retry_policy.max_attempts)
+            retry_after = None
+            started = time.monotonic()
+            try:
+                async with self.session.get(url, proxy=proxy) as response:
+                    if response.status == 200:
+                        image_data = await response.read()
+                        self.circuit_breaker.record_success(host)
+                        count_items('image_download')
+                        DOWNLOADED_BYTES.inc(len(image_data))
+                        if proxy:
+                            self.proxy_pool.report_success(proxy, time.monotonic() - started)
+                        logger.debug("Image data size for %s: %d", url, len(image_data))
+                        self.progress.add()
+                        filename = await self.create_image_name(record, counter)
+                        return filename, image_data
+
+                    reason = f"Status code {response.status}"
+                    logger.debug("Failed to download %s: %s", url, reason)
+                    if self.retry_policy.is_permanent(response.status):
+                        # Replaying the URL won't bring the image back
+                        logger.warning("Dropping %s: %s", url, reason)
+                        return None, None
+                    if not self.retry_policy.is_retryable(response.status):
+                        break
+                    retry_after = RetryPolicy.parse_retry_after(response.headers.get('Retry-After'))
+                    if proxy and response.status == 429:
+                        # The exit is rate limited rather than the host: move on to another proxy
+                        self.proxy_pool.report_blocked(proxy, retry_after)
+                        retry_after = None
+                    else:
+                        self.circuit_breaker.record_failure(host, retry_after)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                reason = f"{type(e).__name__}: {e}"
+                logger.debug("%s occurred downloading %s: %s", type(e).__name__, url, e)
+                self.circuit_breaker.record_failure(host)
+                if proxy:
+                    self.proxy_pool.report_failure(proxy)
+            except Exception as e:
+                reason = f"{type(e).__name__}: {e}"
+                logger.debug("%s occurred downloading %s: %s", type(e).__name__, url, e)
+                break
+
+            if attempt < self.retry_policy.max_attempts:
+                delay = self.retry_policy.get_delay(attempt, retry_after)
+                logger.debug("Retrying %s in %.1fs...", url, delay)
+                await asyncio.sleep(delay)
+
+        await self.dead_letters.write(record, url, counter, reason)
         return None, None
 
+    async def replay_dead_letters(self):
+        """
+        Download the images from the dead-letter file once again. The ones that fail are written back.
+        The entries stay in the dead-letter file until the recovered images have been saved.
+        """
+        async with self.dead_letters.replay() as entries:
+            logger.info("Replaying %d failed downloads.", len(entries))
+
+            tasks = [self.get_image_records(entry, entry['url'], entry['counter']) for entry in entries]
+            try:
+                results = await asyncio.gather(*tasks)
+            finally:
+                for entry in entries:
+                    self.proxy_pool.release(self.get_proxy_session_id(entry))
+            image_records = [image_record for image_records in results for image_record in image_records]
+            await self.save_image_records(image_records)
+        logger.info("Recovered %d of %d images.", sum(1 for image_records in results if image_records), len(entries))
+
+    @timed('upload')
     async def save_to_disk(self, image_data, filename):
         """
         Save the downloaded image to the filesystem, a CSV file, or a database,
@@ -200,13 +377,13 @@ class Downloader:
         save_path = os.path.join(self.output_directory, filename)
         # Save to the file system
         if image_data:
-            print(f"Saving to disk: {save_path}")
             async with aiofiles.open(save_path, 'wb') as f:
                 await f.write(image_data)
-            print(f"Downloaded and saved to disk: {save_path}")
+            logger.debug("Saved to disk: %s", save_path)
         else:
-            print(f"No image data found for {filename}...")
+            logger.warning("No image data found for %s.", filename)
 
+    @timed('upload')
     async def save_to_db(self, image_records):
         """Save image data to the database using connection pool."""
         if not self.pool:
@@ -230,12 +407,13 @@ class Downloader:
                 """
                 await conn.executemany(insert_query, image_records)
             await conn.close()
-            print(f"Successfully inserted/updated {len(image_records)} records into the database.")
+            logger.debug("Inserted/updated %d images in the database.", len(image_records))
 
     async def init_bucket(self, bucket_name):
         client = self.output_storage
         client.create_bucket(bucket_name)
 
+    @timed('upload')
     async def save_to_bucket(self, image_key, image_data, bucket_name=BUCKET_NAME):
         client = self.output_storage
         client.upload_image(bucket_name, image_key, image_data)
@@ -247,30 +425,205 @@ class Downloader:
         await asyncio.gather(*tasks)
 
 
+    async def start_batch(self, semaphore, batch_tasks, batch, label, batch_errors):
+        """
+        Start downloading a batch as soon as one of the `max_concurrent_batches` slots is free.
+        While the process is over its memory budget, the batch waits for the running batches to finish.
+
+        :param semaphore: A semaphore limiting the number of batches in flight.
+        :param batch_tasks: A set of running batch tasks, the new task is added to it.
+        :param batch: A list of records.
+        :param label: A label of the batch for the logs.
+        :param batch_errors: A list the exception of the batch is added to. Finished tasks leave `batch_tasks`,
+            so their exceptions are re-raised from here after the remaining batches are gathered.
+        :return: The task of the batch.
+        """
+        while batch_tasks and self.memory_budget.exceeded():
+            logger.warning("Memory budget exceeded. %s waits for %d running batches.", label, len(batch_tasks))
+            await asyncio.wait(batch_tasks, return_when=asyncio.FIRST_COMPLETED)
+        await semaphore.acquire()
+
+        async def run_batch():
+            try:
+                logger.debug("%s started (%d records).", label, len(batch))
+                with PROFILER.stage('download_batch'):
+                    await self.run_batch_downloads(batch)
+            finally:
+                semaphore.release()
+
+        def on_done(task):
+            batch_tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                batch_errors.append(task.exception())
+
+        task = asyncio.create_task(run_batch())
+        batch_tasks.add(task)
+        task.add_done_callback(on_done)
+        return task
+
+    @staticmethod
+    async def gather_batches(batch_tasks, batch_errors):
+        """Wait for the running batches and raise the first exception of a batch, like asyncio.gather of all of them."""
+        await asyncio.gather(*batch_tasks, return_exceptions=True)
+        if batch_errors:
+            raise batch_errors[0]
+
     async def manage_batch_tasks(self):
-        records = await self.get_objects_from_source()
-        updated_records = [record.update({'user_id': self.user_id}) for record in records]
-        num_of_total_records = len(updated_records)
-        print(f"Total records: {num_of_total_records}")
+        """
+        Stream records from the source and download them in batches as soon as a batch is filled.
+        At most `max_concurrent_batches` batches are in flight: reading the source is paused until one of them is done.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+        batch_tasks = set()
+        batch_errors = []
+
+        num_of_total_records = 0
+        num_of_batches = 0
+        batch = []
+        async for record in self.get_objects_from_source():
+            record = dict(record)
+            record['user_id'] = self.user_id
+            batch.append(record)
+            num_of_total_records += 1
+
+            if len(batch) >= self.batch_size:
+                num_of_batches += 1
+                await self.start_batch(semaphore, batch_tasks, batch, f"Batch {num_of_batches}", batch_errors)
+                batch = []
+
+        if batch:
+            num_of_batches += 1
+            await self.start_batch(semaphore, batch_tasks, batch, f"Batch {num_of_batches}", batch_errors)
+
+        await self.gather_batches(batch_tasks, batch_errors)
+        logger.info("Total records: %d in %d batches.", num_of_total_records, num_of_batches)
+
+    async def consume_queue(self, queue):
+        """
+        Download batches of records put into the queue until a None sentinel arrives.
+        Records must already have their 'user_id'. Every batch is marked as done in the queue
+        only after its images are saved, so `queue.join()` waits for the uploads.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+        batch_tasks = set()
+        batch_errors = []
 
-        # Split records into batches
-        batch_tasks = []
-        for i in range(0, num_of_total_records, self.batch_size):
-            batch = records[i:i + self.batch_size]
-            print(f"Batch {i // self.batch_size + 1} of {num_of_total_records // self.batch_size + 1} started.")
-            batch_tasks.append(self.run_batch_downloads(batch))
+        num_of_batches = 0
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                queue.task_done()
+                break
+            num_of_batches += 1
+            task = await self.start_batch(semaphore, batch_tasks, batch, f"Queued batch {num_of_batches}", batch_errors)
+            task.add_done_callback(lambda _: queue.task_done())
 
-        await asyncio.gather(*batch_tasks)
+        await self.gather_batches(batch_tasks, batch_errors)
+        logger.info("Queue drained: %d batches downloaded.", num_of_batches)
 
 
-    async def run(self):
+    async def run(self, replay=False, queue=None):
+        """
+        Run the downloads.
+
+        :param replay: If True, replay the dead-letter file instead of reading the source.
+        :param queue: An asyncio queue to consume batches of records from instead of reading the source.
+        """
         try:
             # Initialize session, connection pool and MinIO bucket for storing photos
             await self.init_session()
             await self.create_pool()
-            await self.init_bucket(BUCKET_NAME)
+            if self.processor:
+                self.processor.start()
+            if self.output_storage:
+                await self.init_bucket(BUCKET_NAME)
             # Run the batch downloads
-            await self.manage_batch_tasks()
+            if replay:
+                await self.replay_dead_letters()
+            elif queue is not None:
+                await self.consume_queue(queue)
+            else:
+                await self.manage_batch_tasks()
+            if self.hash_index is not None:
+                self.hash_index.save()
         finally:
+            self.progress.done()
             await self.close_session()
-            await self.close_pool()
\ No newline at end of file
+            await self.close_pool()
+            if self.processor:
+                self.processor.shutdown()
+
+
+class DownloadPipeline:
+    """
+    A single long-lived Downloader running in its own event loop in a background thread.
+
+    Synchronous code (e.g. the daily parser) submits batches of records and moves on right away,
+    while the downloader keeps one session, connection pool and bucket for the whole run.
+    When `max_pending` batches are waiting, `submit` blocks until the downloader catches up.
+    """
+
+    def __init__(self, downloader, max_pending=PIPELINE_MAX_PENDING):
+        self.downloader = downloader
+        self.max_pending = max_pending
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=asyncio.run, args=(self._main(),), name="download-pipeline", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        logger.info("Download pipeline started.")
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._ready.set()
+        try:
+            await self.downloader.run(queue=self._queue)
+        except Exception as e:
+            self.error = e
+            logger.exception("%s occurred in the download pipeline: %s", type(e).__name__, e)
+
+    def _put(self, item):
+        """Put an item into the queue from another thread, waiting while the queue is full."""
+        if not self._thread.is_alive():
+            raise RuntimeError(f"Download pipeline has stopped: {self.error}")
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        while True:
+            try:
+                return future.result(timeout=1)
+            except concurrent.futures.TimeoutError:
+                if not self._thread.is_alive():
+                    future.cancel()
+                    raise RuntimeError(f"Download pipeline has stopped: {self.error}")
+
+    def submit(self, records, user_id):
+        """
+        Queue the records of a user for downloading.
+
+        :param records: A list of records with 'id', 'category' and 'photo_URLs'.
+        :param user_id: ID of the user the records are assigned to.
+        """
+        self._put([dict(record, user_id=user_id) for record in records])
+
+    def close(self):
+        """Wait until every submitted batch is downloaded and saved, then stop the downloader."""
+        if self._thread is None:
+            return
+        if self._thread.is_alive():
+            logger.info("Draining the download pipeline...")
+            self._put(None)
+            self._thread.join()
+        self._thread = None
+        logger.info("Download pipeline closed.")
@@ -14,3 +14,11 @@ class AccessDeniedException(Exception):
         super().__init__(f"{message}")
 
 
+
+
+class CacheMissException(Exception):
+    """A custom exception class for pages missing from the response cache in replay mode"""
+
+    def __init__(self, message="No cached response"):
+        self.message = message
+        super().__init__(f"{message}")
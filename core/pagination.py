@@ -0,0 +1,204 @@
+import json
+import math
+import os
+
+from core.settings import (
+    LIMIT, PAGE_MIN_LIMIT, PAGE_MAX_LIMIT, PAGE_TARGET_LATENCY, EMPTY_PAGES_TO_EXHAUST, PAGINATION_STATS_FILE
+)
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# Weight of the latest observation in the moving averages
+SMOOTHING = 0.3
+
+
+def moving_average(average, value):
+    return value if average is None else (1 - SMOOTHING) * average + SMOOTHING * value
+
+
+class CategoryPageState:
+    """Pagination state of a category in the current run and its yield statistics across runs."""
+
+    def __init__(self, limit, stats=None):
+        stats = stats or {}
+        # State of the current run
+        self.offset = 0
+        self.pages = 0
+        self.empty_pages = 0
+        self.exhausted = False
+        # Statistics kept between runs
+        self.limit = stats.get('limit', limit)
+        self.requests = stats.get('requests', 0)
+        self.items_returned = stats.get('items_returned', 0)
+        self.items_useful = stats.get('items_useful', 0)
+        self.latency = stats.get('latency')
+        self.useful_ratio = stats.get('useful_ratio')
+
+    def to_stats(self):
+        return {
+            'limit': self.limit,
+            'requests': self.requests,
+            'items_returned': self.items_returned,
+            'items_useful': self.items_useful,
+            'latency': self.latency,
+            'useful_ratio': self.useful_ratio,
+        }
+
+
+class PaginationPlanner:
+    """
+    Plans the API pages per category.
+
+    Every category has its own offset, which moves by the number of items actually returned,
+    and its own exhaustion flag. The page size of a category is tuned from the observed responses:
+    it is capped at the largest page the API actually returns and shrinks when pages load slowly.
+    Pages are sized to cover the remaining goal with as few requests as possible, taking into account
+    the share of useful (new) objects per returned item seen so far. The statistics are saved for later runs.
+
+    Offsets are only moved by `record_page`, so with a PagePrefetcher the pages are planned and recorded
+    by the fetching thread, while the yields are recorded by the thread that processes the pages.
+    """
+
+    def __init__(
+            self,
+            limit=LIMIT,
+            min_limit=PAGE_MIN_LIMIT,
+            max_limit=PAGE_MAX_LIMIT,
+            target_latency=PAGE_TARGET_LATENCY,
+            stats_file=PAGINATION_STATS_FILE,
+            fixed_limit=False
+    ):
+        """
+        :param limit: Initial page size for categories without statistics.
+        :param min_limit: Smallest page size to request.
+        :param max_limit: Largest page size to request.
+        :param target_latency: Page load time in seconds above which the page size is reduced.
+        :param stats_file: JSON file with the statistics of previous runs (None to keep them in memory only).
+        :param fixed_limit: Request every page with `limit` and ignore the statistics of previous runs,
+            so that a run requests the same URLs as another one over the same data (e.g. with the response cache).
+        """
+        self.limit = limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.fixed_limit = fixed_limit
+        self.stats_file = None if fixed_limit else stats_file
+        self.states = {}
+        self._saved_stats = self._load_stats()
+
+    def _load_stats(self):
+        if not self.stats_file or not os.path.exists(self.stats_file):
+            return {}
+        with open(self.stats_file, 'r') as file:
+            return json.load(file)
+
+    def save_stats(self):
+        if not self.stats_file:
+            return
+        stats = dict(self._saved_stats)
+        stats.update({category_name: state.to_stats() for category_name, state in self.states.items()})
+        os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
+        with open(self.stats_file, 'w') as file:
+            json.dump(stats, file, indent=2)
+        logger.info("Saved pagination statistics for %s.", ', '.join(self.states))
+
+    def get_state(self, category):
+        if category.verbose_name not in self.states:
+            self.states[category.verbose_name] = CategoryPageState(
+                self.limit, self._saved_stats.get(category.verbose_name)
+            )
+        return self.states[category.verbose_name]
+
+    def is_exhausted(self, category):
+        return self.get_state(category).exhausted
+
+    def next_page(self, category, wanted_items):
+        """
+        Plan the next page of a category.
+
+        :param wanted_items: Number of useful objects still needed from this category.
+        :return: A tuple of the offset and the limit of the page.
+        """
+        state = self.get_state(category)
+        if self.fixed_limit:
+            return state.offset, self.limit
+        # Ask for enough items to cover the need in one request, counting on the usual share of new objects
+        useful_ratio = max(state.useful_ratio if state.useful_ratio is not None else 1.0, 0.1)
+        wanted_limit = math.ceil(wanted_items / useful_ratio)
+        limit = max(self.min_limit, min(wanted_limit, state.limit, self.max_limit))
+        return state.offset, limit
+
+    def next_request(self, categories, wanted_items, skip=()):
+        """
+        Plan the next page round-robin over the categories that can still deliver.
+
+        :param categories: Categories to crawl.
+        :param wanted_items: Number of useful objects still needed from all the categories together.
+        :param skip: Names of the categories that are done.
+        :return: A tuple of the category, offset and limit of the page, or None if there is nothing to fetch.
+        """
+        active = [
+            category for category in categories
+            if category.verbose_name not in skip and not self.is_exhausted(category)
+        ]
+        if not active or wanted_items <= 0:
+            return None
+        # The category with the fewest pages in this run goes next
+        category = min(active, key=lambda category: self.get_state(category).pages)
+        return (category, *self.next_page(category, math.ceil(wanted_items / len(active))))
+
+    def expected_useful(self, category, items):
+        """Number of useful objects expected among `items` returned items of a category."""
+        useful_ratio = self.get_state(category).useful_ratio
+        return items * (useful_ratio if useful_ratio is not None else 1.0)
+
+    def record(self, category, requested_limit, items_returned, items_useful, latency=None):
+        """
+        Record the result of a page.
+
+        :param requested_limit: The limit the page was requested with.
+        :param items_returned: Number of items the API returned.
+        :param items_useful: Number of returned items that were new.
+        :param latency: Page load time in seconds (None if unknown).
+        """
+        self.record_page(category, requested_limit, items_returned, latency)
+        self.record_yield(category, items_returned, items_useful)
+
+    def record_page(self, category, requested_limit, items_returned, latency=None):
+        """Move the offset of a category past a fetched page and tune its page size."""
+        state = self.get_state(category)
+        state.pages += 1
+        state.requests += 1
+        state.items_returned += items_returned
+        state.offset += items_returned
+
+        if items_returned == 0:
+            state.empty_pages += 1
+            if state.empty_pages >= EMPTY_PAGES_TO_EXHAUST:
+                state.exhausted = True
+                logger.info("Category %s is exhausted at offset %d.", category.verbose_name, state.offset)
+            return
+
+        state.empty_pages = 0
+        if self.fixed_limit:
+            return
+        if items_returned < requested_limit:
+            # The API returns at most this many items per page: don't ask for more
+            state.limit = max(self.min_limit, items_returned)
+
+        if latency is not None:
+            state.latency = moving_average(state.latency, latency)
+            if state.latency > self.target_latency:
+                state.limit = max(self.min_limit, int(state.limit * 0.75))
+            elif state.latency < self.target_latency / 2 and items_returned >= requested_limit:
+                state.limit = min(self.max_limit, int(state.limit * 1.25))
+
+    def record_yield(self, category, items_returned, items_useful):
+        """Record how many of the items of a processed page were new."""
+        state = self.get_state(category)
+        state.items_useful += items_useful
+        if items_returned:
+            state.useful_ratio = moving_average(state.useful_ratio, items_useful / items_returned)
@@ -1,69 +1,103 @@
 import time
 import json
 import random
+import threading
 
 from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.common.exceptions import TimeoutException
 from bs4 import BeautifulSoup
-from faker import Faker
 
+from core.settings import (
+    PREFETCH_DEPTH, DELTA_CRAWL, SERVE_FROM_DB_ONLY, INVENTORY_WAIT_TIMEOUT, INVENTORY_LOW_WATERMARK, INVENTORY_HIGH_WATERMARK, INVENTORY_CHECK_INTERVAL,
+    PARSER_MEMORY_BUDGET_MB
+)
+from core.pagination import PaginationPlanner
+from core.prefetch import Page, PagePrefetcher
 from core.utilities.enums import CategoryType
-from core.exceptions import AccessDeniedException, MaxRetryAttemptsReachedException
+from core.exceptions import AccessDeniedException, MaxRetryAttemptsReachedException, CacheMissException
 from core.utilities.other_functions import get_utc_timestamp, return_unique_records
+from core.utilities.metrics import timed, count_items
+from core.utilities.prices import normalize_prices
+from core.utilities.response_cache import ResponseCache
+from core.utilities.log import get_logger
+from core.utilities.memory import MemoryBudget, PROFILER
 
-from main_scripts.download_photos import download_and_save_photos
+
+logger = get_logger(__name__)
+
+
+_user_factory = None
 
 
 def generate_user_data():
     """Generate random user data."""
-    faker = Faker()
-    gender = faker.random_element(["M", "F"])
-    return {
-        "username": faker.user_name(),
-        "phone_number": faker.phone_number()[:32],  # Truncate to avoid VARCHAR(32) overflow
-        "email": faker.email(),
-        "first_name": faker.first_name_male() if gender == "M" else faker.first_name_female(),
-        "last_name": faker.last_name(),
-        "address": faker.address(),
-        "gender": gender,
-    }
+    global _user_factory
+    if _user_factory is None:
+        # Faker is slow to import and only needed by the daily parser
+        from core.utilities.user_factory import MockUserFactory
+        _user_factory = MockUserFactory()
+    return _user_factory.generate_one()
 
 
 class BaseParser:
     """Base class for parsing initial data from Avito."""
 
-    def __init__(self, browser, base_url, delay_range=(5, 15)):
+    def __init__(self, browser, base_url, delay_range=(5, 15), watermark_store=None, response_cache=None):
         """
         Initialize the parser.
         :param base_url: Base URL of the site.
         :param delay_range: Range of delays between requests.
+        :param watermark_store: Storage of the newest object ID seen per category (required for delta crawls),
+            e.g. a FileWatermarkStore or a DailyParserDB.
+        :param response_cache: ResponseCache of the API pages (configured by RESPONSE_CACHE_MODE by default).
         """
         self.browser = browser
         self.base_url = base_url
         self.delay_range = delay_range
+        self.watermark_store = watermark_store
+        self.response_cache = response_cache or ResponseCache()
+        # Load time of the last page, without the delay between requests
+        self.last_fetch_latency = None
 
     def _get_json(self, driver: WebDriver, url: str, delay: int, max_attempts: int = 3) -> dict:
-        """Fetch JSON data from a URL using Selenium."""
+        """Fetch JSON data from a URL using Selenium, or from the response cache."""
+        data = self.response_cache.get(url)
+        if data is not None:
+            logger.debug("Served %s from the response cache", url)
+            return data
+
         attempts = 0
         while attempts < max_attempts:
             try:
-                driver.get(url)
-                print(f"Navigated to {driver.current_url}")
+                started = time.monotonic()
+                with timed('page_fetch'):
+                    driver.get(url)
+                self.last_fetch_latency = time.monotonic() - started
+                count_items('page_fetch')
+                logger.debug("Navigated to %s", driver.current_url)
                 time.sleep(delay)
 
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                pre_tag = soup.find('pre')
-                if not pre_tag:
-                    raise ValueError("No <pre> tag found.")
-                data = json.loads(pre_tag.text)
+                with timed('json_decode'):
+                    soup = BeautifulSoup(driver.page_source, 'html.parser')
+                    pre_tag = soup.find('pre')
+                    if not pre_tag:
+                        raise ValueError("No <pre> tag found.")
+                    data = json.loads(pre_tag.text)
 
                 if data.get('status') == "too-many-requests":
-                    raise AccessDeniedException("Too many requests. Access denied.")
+                    if not hasattr(driver, 'rotate'):
+                        raise AccessDeniedException("Too many requests. Access denied.")
+                    # The proxy is rate limited: continue on another one (raises AccessDeniedException if none is left)
+                    logger.warning("Too many requests. Switching to another proxy...")
+                    driver.rotate()
+                    attempts += 1
+                    continue
+                self.response_cache.put(url, data)
                 return data
             
             except (json.JSONDecodeError, TimeoutException, ValueError) as e:
                 attempts += 1
-                print(f"Attempt {attempts}/{max_attempts} failed for {url}. Retrying...")
+                logger.warning("Attempt %d/%d failed for %s. Retrying...", attempts, max_attempts, url)
         raise MaxRetryAttemptsReachedException("Max retry attempts reached.")
 
 
@@ -95,6 +129,7 @@ class BaseParser:
 
         return obj
 
+    @timed('parse')
     def _parse_data(self, data, category_name):
         """
         Parse a list of raw data items into structured objects with 'object_category'.
@@ -109,7 +144,10 @@ class BaseParser:
                 obj = self._parse_item(item, category_name)
                 objects.append(obj)
             except Exception as e:
-                print(f"Error parsing item: {e}")
+                logger.debug("Error parsing item: %s", e)
+        # The price texts of the whole page are parsed into typed columns at once
+        normalize_prices(objects)
+        count_items('parse', len(objects))
         return objects
 
 
@@ -135,90 +173,207 @@ class BaseParser:
             return parsed_data
 
         except MaxRetryAttemptsReachedException:
-            print(f"Max retries reached for {url}. Moving to the next URL.")
+            logger.error("Max retries reached for %s. Moving to the next URL.", url)
             return []
         except AccessDeniedException as e:
-            print(f"Access denied for {url}. Stopping the script.")
+            logger.error("Access denied for %s. Stopping the script.", url)
             raise e  # Re-raise the exception to stop the scraping process
+        except CacheMissException as e:
+            logger.error("%s is not in the response cache. Stopping the replay.", url)
+            raise e
         except Exception as e:
-            print(f"Unexpected error in worker for {url}: {e}")
+            logger.exception("Unexpected error in worker for %s: %s", url, e)
             return []
 
+    def create_planner(self, limit):
+        """
+        A PaginationPlanner of the pages of a crawl. Page sizes are not tuned while the response cache is used,
+        because the cached pages are keyed by their URLs, limit included, and a replay must request the recorded ones.
+        """
+        return PaginationPlanner(limit=limit, fixed_limit=self.response_cache.enabled)
+
     def fetch_objects_for_category(self, driver, category, limit, offset, last_stamp, location):
         """Fetch objects for a specific category."""
 
         url = self.url_generator(category.category_id, limit, offset, last_stamp, location)
-        print(f"Fetching data from: {url} for category: {category.verbose_name}")
+        logger.debug("Fetching data from: %s for category: %s", url, category.verbose_name)
         return self._worker(driver, url, category.verbose_name, random.randint(*self.delay_range))
 
+    def fetch_objects_or_raise(self, driver, category, limit, offset, last_stamp, location):
+        """
+        Fetch objects for a specific category like fetch_objects_for_category, but let the errors through,
+        so that the caller can tell a failed page from an empty one.
+        """
+        url = self.url_generator(category.category_id, limit, offset, last_stamp, location)
+        logger.debug("Fetching data from: %s for category: %s", url, category.verbose_name)
+        json_data = self._get_json(driver, url, random.randint(*self.delay_range))
+        return self._parse_data(json_data, category.verbose_name)
+
+    def fetch_page(self, driver, planner, request, last_stamp, location):
+        """Fetch a page planned by the pagination planner and record it."""
+        category, offset, limit = request
+        self.last_fetch_latency = None
+        objects = self.fetch_objects_for_category(driver, category, limit, offset, last_stamp, location)
+        planner.record_page(category, limit, len(objects), self.last_fetch_latency)
+        return Page(category, offset, limit, objects, planner.expected_useful(category, len(objects)))
+
+    def iter_pages(self, driver, planner, plan_next, last_stamp, location, depth=PREFETCH_DEPTH):
+        """
+        Fetch the pages planned by `plan_next` up to `depth` pages ahead of their processing.
+        The driver must not be used elsewhere until the returned PagePrefetcher is closed.
+        """
+        return PagePrefetcher(
+            plan_next,
+            lambda request: self.fetch_page(driver, planner, request, last_stamp, location),
+            depth
+        )
+
+    @staticmethod
+    def is_known_page(objects, watermark):
+        """Check whether none of the objects of a page is newer than the watermark of its category."""
+        return watermark is not None and all(obj['id'] <= watermark for obj in objects)
+
+    def get_watermarks(self, delta):
+        if not delta:
+            return {}
+        if self.watermark_store is None:
+            raise ValueError("A watermark store is required for delta crawls.")
+        return self.watermark_store.get_watermarks()
+
+    def save_watermarks(self, watermarks, newest_ids, caught_up):
+        """
+        Move the watermarks of the categories whose crawl reached the previous watermark (or had none yet)
+        to the newest object ID seen. Categories that stopped before that keep their watermarks,
+        so the next delta crawl covers the gap.
+        """
+        new_watermarks = {
+            category_name: newest_id for category_name, newest_id in newest_ids.items()
+            if category_name in caught_up or category_name not in watermarks
+        }
+        self.watermark_store.save_watermarks(new_watermarks)
 
-    def run(self, driver, total_goal, limit, location=False, max_scraping_failures=3):
+    def run(
+            self, driver, total_goal, limit, location=False, max_scraping_failures=3, delta=False, planner=None,
+            flush=None, memory_budget=None
+    ):
         """
         Fetch objects dynamically until total_goal is met.
         :parameters:
             - driver: WebDriver instance
             - total_goal: Total number of objects to fetch
-            - limit: Number of objects per API call
+            - limit: Initial number of objects per API call (tuned per category by the planner)
             - delay: Delay between API requests
             - location: Location filter for the request
             - max_scraping_failures: Maximum number of consecutive zero-fetch attempts
+            - delta: Incremental crawl: only objects newer than the category's watermark are kept,
+              and a category is done as soon as a page contains only known objects
+            - planner: PaginationPlanner with the per-category offsets and page sizes
+              (a new one with the saved statistics by default)
+            - flush: A function that saves a list of unique objects. When the process goes over the memory budget,
+              the objects fetched so far are passed to it and dropped, and only the rest is returned
+            - memory_budget: MemoryBudget that triggers the flush (PARSER_MEMORY_BUDGET_MB by default)
         """
 
         fetched_objects = []
-        offset = 0
+        flushed_count = 0
+        memory_budget = memory_budget or MemoryBudget(PARSER_MEMORY_BUDGET_MB)
+        seen_ids = set()
+        planner = planner or self.create_planner(limit)
         last_stamp = get_utc_timestamp()
 
+        watermarks = self.get_watermarks(delta)
+        newest_ids = {}
+        caught_up = set()
+
         # Initialize the zero-fetch counter to prevent infinite loops
         scraping_failures_count = 0
 
-        while len(fetched_objects) < total_goal:
-            try:
-                for category in CategoryType:
-                    new_objects = self.fetch_objects_for_category(driver, category, limit, offset, last_stamp, location)
+        def plan_next(pending):
+            # Split what is left of the goal between the categories that can still deliver
+            return planner.next_request(
+                CategoryType, total_goal - flushed_count - len(fetched_objects) - pending, skip=caught_up
+            )
+
+        try:
+            with PROFILER.stage('parser'), self.iter_pages(driver, planner, plan_next, last_stamp, location) as pages:
+                for page in pages:
+                    category = page.category
+                    new_objects = page.objects
                     if new_objects:
                         scraping_failures_count = 0
+                        newest_ids[category.verbose_name] = max(
+                            [newest_ids.get(category.verbose_name, 0)] + [obj['id'] for obj in new_objects]
+                        )
+                        if delta:
+                            watermark = watermarks.get(category.verbose_name)
+                            if self.is_known_page(new_objects, watermark):
+                                planner.record_yield(category, len(page.objects), 0)
+                                caught_up.add(category.verbose_name)
+                                logger.info("Only known objects for category: %s. Delta crawl is done.", category.verbose_name)
+                                continue
+                            if watermark is not None:
+                                new_objects = [obj for obj in new_objects if obj['id'] > watermark]
+
+                        new_objects = [obj for obj in new_objects if obj['id'] not in seen_ids]
+                        seen_ids.update(obj['id'] for obj in new_objects)
                         fetched_objects.extend(new_objects)
-                        print(f"Added {len(new_objects)} objects. Total: {len(fetched_objects)}/{total_goal}.")
+                        logger.info(
+                            "Added %d objects. Total: %d/%d.",
+                            len(new_objects), flushed_count + len(fetched_objects), total_goal
+                        )
+                        if flush is not None and memory_budget.exceeded():
+                            logger.warning("Memory budget exceeded. Flushing %d objects.", len(fetched_objects))
+                            flush(return_unique_records(fetched_objects))
+                            flushed_count += len(fetched_objects)
+                            fetched_objects = []
+                            memory_budget.mark_flushed()
                     else:
                         scraping_failures_count += 1
-                        print(
-                            f"No objects fetched for category: {category.verbose_name}."
-                            f"\nZero-fetch count: {scraping_failures_count}/{max_scraping_failures}.")
+                        logger.warning(
+                            "No objects fetched for category: %s. Zero-fetch count: %d/%d.",
+                            category.verbose_name, scraping_failures_count, max_scraping_failures)
+                    planner.record_yield(category, len(page.objects), len(new_objects))
 
-                    if len(fetched_objects) >= total_goal:
-                        print(f"Goal reached: {len(fetched_objects)} objects fetched.")
-                        return return_unique_records(fetched_objects)
+                    if flushed_count + len(fetched_objects) >= total_goal:
+                        logger.info("Goal reached: %d objects fetched.", flushed_count + len(fetched_objects))
+                        break
 
                     if scraping_failures_count >= max_scraping_failures:
-                        print(
-                            f"Too many consecutive zero-fetch attempts ({scraping_failures_count}). Stopping script.")
-                        return return_unique_records(fetched_objects)
-
-                offset += limit * 2
-
-            except AccessDeniedException:
-                print("Access Denied Exception raised. Stopping script.")
-                break
-
+                        logger.error(
+                            "Too many consecutive zero-fetch attempts (%d). Stopping script.", scraping_failures_count)
+                        break
+                else:
+                    logger.info("All categories are up to date or exhausted.")
+
+        except AccessDeniedException:
+            logger.error("Access Denied Exception raised. Stopping script.")
+        except CacheMissException:
+            logger.error("Replay reached a page that is not in the response cache. Stopping script.")
+
+        planner.save_stats()
+        if delta:
+            self.save_watermarks(watermarks, newest_ids, caught_up)
         return return_unique_records(fetched_objects)
 
 
 class DailyParser(BaseParser):
-    def __init__(self, db, browser, base_url, user_count, delay_range=(5, 10)):
-        super().__init__(browser, base_url, delay_range)
-        self.db = db
-        self.user_count = user_count
-
-
-    def get_objects_to_assign(self, unique_objects, total_goal):
+    def __init__(
+            self, db, browser, base_url, user_count, delay_range=(5, 10),
+            serve_from_db_only=SERVE_FROM_DB_ONLY, wait_timeout=INVENTORY_WAIT_TIMEOUT, delta=DELTA_CRAWL
+    ):
         """
-        Handles the logic for assigning unique objects from the database.
+        :param delta: If True, fetching new objects of a category stops at the first page with only known objects
+            and the crawl watermarks are kept in the database.
+        :param serve_from_db_only: If True, objects are only claimed from 'unique_records' and the API is never
+            called during user generation (the stock is kept up by the InventoryReplenisher).
+        :param wait_timeout: In DB-only mode, for how long to wait for an out-of-stock category to be replenished.
         """
-
-        objects_to_assign = unique_objects[:min(total_goal, len(unique_objects))]
-        print(f"Assigned {len(objects_to_assign)} objects.")
-        return objects_to_assign
-
+        super().__init__(browser, base_url, delay_range, watermark_store=db)
+        self.db = db
+        self.user_count = user_count
+        self.delta = delta
+        self.serve_from_db_only = serve_from_db_only
+        self.wait_timeout = wait_timeout
 
 
     def handle_new_objects_from_api(self, driver, category, total_goal, limit, location):
@@ -226,30 +381,53 @@ class DailyParser(BaseParser):
         Handles the logic for fetching new objects from the API and assigning them.
         """
 
-        offset = 0
+        planner = self.create_planner(limit)
         last_stamp = get_utc_timestamp()
 
-        unique_objects = []
-
-        while len(unique_objects) < total_goal:
-            new_objects = self.fetch_objects_for_category(driver, category, limit, offset, last_stamp, location)
-            print(f"Fetched {len(new_objects)} new objects for {category.verbose_name}.")
+        watermarks = self.get_watermarks(self.delta)
+        newest_ids = {}
+        caught_up = set()
 
-            # Filter out existing objects
-            existing_ids = self.db.get_existing_object_ids('objects', category.verbose_name)
-            unique_objects = [obj for obj in new_objects if obj['id'] not in existing_ids]
+        unique_objects = []
 
-            if unique_objects:
-                print(f"Filtered {len(unique_objects)} unique objects for {category.verbose_name}.")
-            else:
-                print(f"No more unique objects for {category.verbose_name}.\nMaking another API call...")
-            offset += limit
+        def plan_next(pending):
+            return planner.next_request([category], total_goal - len(unique_objects) - pending)
+
+        with self.iter_pages(driver, planner, plan_next, last_stamp, location) as pages:
+            for page in pages:
+                new_objects = page.objects
+                logger.info("Fetched %d new objects for %s.", len(new_objects), category.verbose_name)
+                if new_objects:
+                    newest_ids[category.verbose_name] = max(
+                        [newest_ids.get(category.verbose_name, 0)] + [obj['id'] for obj in new_objects]
+                    )
+
+                # Filter out existing objects
+                existing_ids = self.db.get_existing_object_ids('objects', category.verbose_name)
+                page_unique_objects = [obj for obj in new_objects if obj['id'] not in existing_ids]
+                unique_objects.extend(page_unique_objects)
+                planner.record_yield(category, len(new_objects), len(page_unique_objects))
+
+                if page_unique_objects:
+                    logger.info("Filtered %d unique objects for %s.", len(page_unique_objects), category.verbose_name)
+                elif self.delta:
+                    # Everything on the page is known already, older pages won't have anything new either
+                    logger.info("No more unique objects for %s. Delta crawl is done.", category.verbose_name)
+                    caught_up.add(category.verbose_name)
+                    break
+                else:
+                    logger.info("No more unique objects for %s. Making another API call...", category.verbose_name)
+
+        planner.save_stats()
+        if self.delta:
+            self.save_watermarks(watermarks, newest_ids, caught_up)
 
         # Save unique objects into 'unique_records' table
-        print(f"Saving {len(unique_objects)} unique objects into 'unique_records'.")
+        unique_objects = return_unique_records(unique_objects)
+        logger.info("Saving %d unique objects into 'unique_records'.", len(unique_objects))
         self.db.save_to_db('unique_records', unique_objects)
-        # Assign objects
-        return self.get_objects_to_assign(unique_objects, total_goal)
+        # Claim objects, other workers may have taken some of the new ones already
+        return self.db.claim_unique_objects(category.verbose_name, total_goal)
 
 
     def assign_objects_to_category(self, driver, category, total_goal, limit, location):
@@ -257,31 +435,136 @@ class DailyParser(BaseParser):
         Assigns objects to a category, either from unique records or fetched via an API.
         Updates assigned objects for both the user and category.
         """
-        print(f"Current category: {category.verbose_name}")
+        logger.info("Current category: %s", category.verbose_name)
 
-        # Check for unique objects in the database
-        existing_unique_objects = self.db.filter_out_unique_objects_by_category(category.verbose_name)
+        # Claim unique objects in the database, safe to run from several workers at once
+        claimed_objects = self.db.claim_unique_objects(category.verbose_name, total_goal)
 
-        if existing_unique_objects:
-            print(f"Fetching existing objects from the DB...")
-            return self.get_objects_to_assign(existing_unique_objects, total_goal)
+        if claimed_objects:
+            logger.info("Assigned %d existing objects from the DB.", len(claimed_objects))
+            return claimed_objects
+        elif self.serve_from_db_only:
+            return self.wait_for_inventory(category, total_goal)
         else:
-            print(f"No unique objects for {category.verbose_name}. Fetching new objects from API...")
+            logger.info("No unique objects for %s. Fetching new objects from API...", category.verbose_name)
             return self.handle_new_objects_from_api(driver, category, total_goal, limit, location)
 
+    def wait_for_inventory(self, category, total_goal, poll_interval=5):
+        """Wait for the replenisher to stock up an empty category and claim objects from it."""
+        logger.info("No unique objects for %s. Waiting for the inventory to be replenished...", category.verbose_name)
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            claimed_objects = self.db.claim_unique_objects(category.verbose_name, total_goal)
+            if claimed_objects:
+                return claimed_objects
+        logger.warning("Inventory of %s is still empty after %ss. Skipping the category.", category.verbose_name, self.wait_timeout)
+        return []
+
     def run(self, driver, total_goal, limit, location=False, max_scraping_failures=3):
 
         assigned_objects_per_user = []
 
-        for category in CategoryType:
-            assigned_objects_per_category = self.assign_objects_to_category(driver, category, total_goal, limit, location)
-            assigned_objects_per_user.extend(assigned_objects_per_category)
+        try:
+            for category in CategoryType:
+                assigned_objects_per_category = self.assign_objects_to_category(driver, category, total_goal, limit, location)
+                assigned_objects_per_user.extend(assigned_objects_per_category)
+        except BaseException:
+            # Don't strand the objects claimed for the user so far: they have no user yet
+            self.db.release_claimed_objects(assigned_objects_per_user)
+            raise
 
-        print("*" * 50)
         return assigned_objects_per_user
 
 
+class InventoryReplenisher(BaseParser):
+    """
+    Keeps the stock of 'unique_records' of every category between a low and a high watermark,
+    so that user generation can be served purely from the database.
+
+    Categories below the low watermark are replenished first. When none of them is that low,
+    the idle time is used to top up the rest of the categories to the high watermark.
+    """
+
+    def __init__(
+            self, db, browser, base_url, delay_range=(5, 10),
+            low_watermark=INVENTORY_LOW_WATERMARK, high_watermark=INVENTORY_HIGH_WATERMARK
+    ):
+        super().__init__(browser, base_url, delay_range)
+        self.db = db
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+
+    def replenish_category(self, driver, category, stock, limit, location=False, max_scraping_failures=3):
+        """
+        Fetch new objects of a category and save them into 'unique_records' until the high watermark is reached.
+
+        :param stock: Current number of objects of the category in 'unique_records'.
+        :return: Number of saved objects.
+        """
+        logger.info("Replenishing %s: %d/%d objects in stock.", category.verbose_name, stock, self.high_watermark)
+        planner = self.create_planner(limit)
+        last_stamp = get_utc_timestamp()
+        saved = 0
+        scraping_failures_count = 0
+
+        while (stock + saved < self.high_watermark and scraping_failures_count < max_scraping_failures
+               and not planner.is_exhausted(category)):
+            page_offset, page_limit = planner.next_page(category, self.high_watermark - stock - saved)
+            self.last_fetch_latency = None
+            fetched_objects = self.fetch_objects_for_category(
+                driver, category, page_limit, page_offset, last_stamp, location
+            )
+            new_objects = return_unique_records(fetched_objects)
+
+            known_ids = self.db.get_known_object_ids([obj['id'] for obj in new_objects])
+            unique_objects = [obj for obj in new_objects if obj['id'] not in known_ids]
+            planner.record(category, page_limit, len(fetched_objects), len(unique_objects), self.last_fetch_latency)
+            if not unique_objects:
+                scraping_failures_count += 1
+                logger.info("No new objects for %s. Zero-fetch count: %d/%d.",
+                            category.verbose_name, scraping_failures_count, max_scraping_failures)
+                continue
+
+            scraping_failures_count = 0
+            self.db.save_to_db('unique_records', unique_objects)
+            saved += len(unique_objects)
+
+        planner.save_stats()
+        logger.info("Saved %d new objects for %s.", saved, category.verbose_name)
+        return saved
+
+    def replenish_once(self, driver, limit, location=False):
+        """
+        Check the stock of all the categories and replenish the ones that need it.
+
+        :return: A dictionary of saved objects per category.
+        """
+        counts = self.db.count_unique_records_by_category()
+        stock = {category: counts.get(category.verbose_name, 0) for category in CategoryType}
 
+        urgent = [category for category, count in stock.items() if count < self.low_watermark]
+        # Crawl ahead of demand only when no category is running low
+        categories = urgent or [category for category, count in stock.items() if count < self.high_watermark]
 
+        return {
+            category.verbose_name: self.replenish_category(driver, category, stock[category], limit, location)
+            for category in categories
+        }
 
+    def run_forever(self, driver, limit, location=False, interval=INVENTORY_CHECK_INTERVAL, stop_event=None):
+        """
+        Replenish the inventory until the stop event is set (or forever).
 
+        :param interval: Seconds to wait between checks when all the categories are stocked.
+        :param stop_event: An optional threading.Event to stop the loop.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                saved = self.replenish_once(driver, limit, location)
+            except AccessDeniedException:
+                logger.error("Access Denied Exception raised. Pausing replenishment.")
+                saved = {}
+            if not any(saved.values()):
+                stop_event.wait(interval)
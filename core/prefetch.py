@@ -0,0 +1,117 @@
+import queue
+import threading
+from collections import namedtuple
+
+from core.settings import PREFETCH_DEPTH
+
+
+# A fetched page; `expected` is the number of useful objects it is expected to contain
+Page = namedtuple('Page', ['category', 'offset', 'limit', 'objects', 'expected'])
+
+_DONE = object()
+
+
+class PagePrefetcher:
+    """
+    Fetches pages in a background thread while the consumer processes the previous ones.
+
+    The thread owns the browser for as long as the prefetcher is open and stays at most `depth` pages
+    ahead of the consumer. Pages are planned lazily by `plan_next(pending)`, where `pending` is the number of
+    useful objects expected from the fetched pages the consumer hasn't finished yet. When it returns None
+    while pages are in flight, the thread waits for the consumer and asks again, so that no pages are fetched
+    for a goal that the pending ones may already cover. When it returns None with no pages in flight, the crawl is over.
+    Exceptions of the thread (e.g. AccessDeniedException) are raised to the consumer.
+
+    Usage:
+        with PagePrefetcher(plan_next, fetch) as pages:
+            for page in pages:
+                ...
+    """
+
+    def __init__(self, plan_next, fetch, depth=PREFETCH_DEPTH):
+        """
+        :param plan_next: Callable that takes the pending count and returns the next request or None.
+        :param fetch: Callable that fetches a request and returns a Page.
+        :param depth: Number of pages to fetch ahead (0 to fetch them one at a time in the consumer's thread).
+        """
+        self.plan_next = plan_next
+        self.fetch = fetch
+        self.depth = depth
+        self.pending = 0
+        # Pages fetched but not finished by the consumer; `pending` is a sum of floats and may not return to 0 exactly
+        self.in_flight = 0
+        self._pages = queue.Queue(maxsize=max(depth, 1))
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.depth:
+            self._thread = threading.Thread(target=self._run, name="page-prefetcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._pages.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _next_request(self):
+        with self._condition:
+            request = self.plan_next(self.pending)
+            while request is None and self.in_flight and not self._stop.is_set():
+                self._condition.wait()
+                request = self.plan_next(self.pending)
+            return request
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                request = self._next_request()
+                if request is None:
+                    break
+                page = self.fetch(request)
+                with self._condition:
+                    self.in_flight += 1
+                    self.pending += page.expected
+                self._put(page)
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(_DONE)
+
+    def __iter__(self):
+        if not self.depth:
+            request = self.plan_next(0)
+            while request is not None:
+                yield self.fetch(request)
+                request = self.plan_next(0)
+            return
+
+        while True:
+            page = self._pages.get()
+            if page is _DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+            # The consumer is done with the page once it asks for the next one
+            with self._condition:
+                self.in_flight -= 1
+                self.pending = self.pending - page.expected if self.in_flight else 0
+                self._condition.notify_all()
+
+    def close(self):
+        """Stop fetching ahead and wait for the page being fetched, after which the browser is free again."""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
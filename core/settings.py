@@ -3,6 +3,8 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+from database.db_schema import DB_SCHEMA
+
 """ Settings for the application """
 
 load_dotenv()
@@ -13,13 +15,117 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 BASE_URL = "https://www.avito.ru/web/1/main/items"
 LIMIT = 300
 MAX_ATTEMPTS = 3
+DELTA_CRAWL = os.getenv('DELTA_CRAWL', 'false').lower() == 'true' # Stop crawling a category at the first page of known objects
+WATERMARK_FILE = os.path.join(BASE_DIR, "data", "crawl_watermarks.json") # Watermarks of runs without a database
+
+# Pagination planner settings (page sizes are tuned per category between the bounds)
+PAGE_MIN_LIMIT = 50
+PAGE_MAX_LIMIT = 500
+PAGE_TARGET_LATENCY = 5 # Seconds; pages that load slower than this are made smaller
+EMPTY_PAGES_TO_EXHAUST = 2 # Consecutive empty pages before a category is considered exhausted
+PAGINATION_STATS_FILE = os.path.join(BASE_DIR, "data", "pagination_stats.json") # Per-category yield statistics
+PREFETCH_DEPTH = 1 # Pages fetched ahead while the current one is processed (0 to fetch one page at a time)
+
+# API response cache settings
+RESPONSE_CACHE_MODE = os.getenv('RESPONSE_CACHE_MODE', 'off') # off, record (read-through cache) or replay (cache only)
+RESPONSE_CACHE_DIR = os.path.join(BASE_DIR, "data", "response_cache")
+RESPONSE_CACHE_TTL = 24 * 60 * 60 # Seconds before a recorded page is fetched again
+RESPONSE_CACHE_MAX_BYTES = 512 * 1024 * 1024 # Least recently used pages are removed above this size
+
+# Browser settings
+LEAN_BROWSER = os.getenv('LEAN_BROWSER', 'false').lower() == 'true' # Lean navigation profile (see ChromeBrowser)
+PAGE_LOAD_STRATEGY = os.getenv('PAGE_LOAD_STRATEGY', 'eager') # Page load strategy of the lean profile: eager or none
+BLOCKED_URL_PATTERNS = ( # Requests blocked through CDP in the lean profile (the API pages only need the document)
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.mp4",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*mc.yandex.ru*",
+)
+MEASURE_NAVIGATION = os.getenv('MEASURE_NAVIGATION', 'false').lower() == 'true' # Report the timing of every navigation
+
+# Proxy pool settings (shared by the browsers and the photo downloader)
+PROXIES = [proxy.strip() for proxy in os.getenv('PROXIES', '').split(',') if proxy.strip()] # Comma-separated proxy URLs
+PROXY_COOLDOWN = 300 # Seconds a rate-limited or unhealthy proxy is not used
+PROXY_MIN_SCORE = 0.2 # Health score (0-1) below which a proxy is paused
+
+# Distributed crawl settings
+CRAWL_LEASE_SECONDS = 300 # For how long a worker owns a leased page task before it goes back to the queue
+CRAWL_TASK_MAX_ATTEMPTS = 3 # Attempts per page task before it is marked as failed
+CRAWL_POLL_INTERVAL = 10 # Seconds between queue checks when there is nothing to lease
 
 #Daily parser settings
 USER_COUNT_RANGE = (5,20) # Number of users to parse
 OBJECT_COUNT_RANGE = (1,5) # Number of objects to parse
+FAKER_LOCALE = os.getenv('FAKER_LOCALE', 'en_US') # Locale of the generated mock users
+USER_FACTORY_SEED = int(os.getenv('USER_FACTORY_SEED')) if os.getenv('USER_FACTORY_SEED') else None # Set for reproducible users
+
+# Inventory replenishment settings (stock of 'unique_records' per category)
+INVENTORY_LOW_WATERMARK = 50 # Below this level a category is replenished right away
+INVENTORY_HIGH_WATERMARK = 200 # Categories are topped up to this level during idle time
+INVENTORY_CHECK_INTERVAL = 60 # Seconds between inventory checks of the replenisher
+SERVE_FROM_DB_ONLY = os.getenv('SERVE_FROM_DB_ONLY', 'false').lower() == 'true' # Never crawl during user generation
+INVENTORY_WAIT_TIMEOUT = 300 # Seconds to wait for the replenisher when a category is out of stock
 
 # Photo download settings
 DOWNLOAD_DIR = os.path.join(BASE_DIR, "data", "downloads", "photos") #"data/downloads/photos"
+DB_CURSOR_PREFETCH = 500 # Rows fetched per round trip when streaming records from the database
+MAX_CONCURRENT_BATCHES = 4 # Download batches in flight; reading the source pauses until one is done
+PIPELINE_MAX_PENDING = 10 # Users' batches waiting in the download pipeline before the parser is paused
+
+# Photo post-processing settings (decoding, validation, resizing and re-encoding in a process pool)
+PROCESS_IMAGES = os.getenv('PROCESS_IMAGES', 'false').lower() == 'true'
+IMAGE_TARGET_SIZES = (None, 256) # None keeps the original resolution, an integer is the longest side of a thumbnail
+IMAGE_FORMAT = 'WEBP' # JPEG, WEBP or PNG
+IMAGE_QUALITY = 80
+IMAGE_PROCESS_WORKERS = None # Defaults to the number of CPUs
+
+# Near-duplicate photo detection settings
+PHASH_INDEX_FILE = os.path.join(BASE_DIR, "data", "phash_index.npz")
+PHASH_MAX_DISTANCE = 8 # Maximum Hamming distance (out of 64 bits) between near-duplicate images
+HASH_IMAGES = os.getenv('HASH_IMAGES', 'true').lower() == 'true' # Add the downloaded photos to PHASH_INDEX_FILE
+
+# Photo download retry settings
+DOWNLOAD_MAX_ATTEMPTS = 5 # Attempts per image URL, including the first one
+DOWNLOAD_BACKOFF_BASE = 0.5 # Seconds before the first retry (exponential backoff with jitter)
+DOWNLOAD_BACKOFF_MAX = 30 # Upper bound for a single backoff delay in seconds
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+PERMANENT_FAILURE_STATUSES = (404, 410) # The image is gone: not written to the dead-letter file
+CIRCUIT_BREAKER_THRESHOLD = 5 # Consecutive 429/5xx responses from a host before pausing it
+CIRCUIT_BREAKER_COOLDOWN = 60 # Seconds to pause a host once its circuit is open
+DEAD_LETTER_FILE = os.path.join(BASE_DIR, "data", "downloads", "dead_letters.jsonl")
+
+# Logging settings
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper() # DEBUG adds per-item traces
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text') # text or json
+LOG_FILE = os.getenv('LOG_FILE') # Also write the logs to this file
+LOG_SAMPLE_EVERY = 100 # Only every n-th message of a sampled per-item event is logged
+LOG_PROGRESS_INTERVAL = 10 # Seconds between aggregate progress lines
+
+# Metrics settings
+METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None # Serve /metrics on this port
+METRICS_SUMMARY_FILE = os.path.join(BASE_DIR, "data", "metrics", "summary.json") # JSON summary written after a run
+
+# Memory settings
+MEMORY_PROFILE = os.getenv('MEMORY_PROFILE', 'false').lower() == 'true' # Profile the memory of the pipeline stages
+MEMORY_SAMPLE_INTERVAL = 1 # Seconds between RSS samples while profiling
+MEMORY_TOP_SITES = 10 # Allocation sites reported per stage
+MEMORY_REPORT_FILE = os.path.join(BASE_DIR, "data", "metrics", "memory.json")
+MEMORY_BUDGET_RATIO = 0.8 # Default budgets: this share of the container's memory limit (none without a limit)
+MEMORY_BUDGET_HYSTERESIS = 0.1 # After a flush, the RSS must grow by this share of the budget before the next one
+PARSER_MEMORY_BUDGET_MB = int(os.getenv('PARSER_MEMORY_BUDGET_MB', 0)) or None # Above it the parser flushes its objects
+DOWNLOADER_MEMORY_BUDGET_MB = int(os.getenv('DOWNLOADER_MEMORY_BUDGET_MB', 0)) or None # Above it no new batches start
+
+# Dataset export settings (python -m main_scripts.export_dataset)
+EXPORT_DIR = os.path.join(BASE_DIR, "data", "datasets")
+EXPORT_OBJECTS_PER_SHARD = 1000 # Objects (with all their images) in a shard
+EXPORT_SHARD_WRITERS = 4 # Shards written in parallel
+EXPORT_FETCH_WORKERS = 32 # Threads fetching images from MinIO, shared by the shard writers
+EXPORT_FETCH_AHEAD = 64 # Images a shard writer fetches ahead of the one it writes
+
+# Benchmark settings (python -m benchmarks.run)
+BENCHMARK_BASELINE_FILE = os.path.join(BASE_DIR, "data", "benchmarks", "baseline.json")
+BENCHMARK_TOLERANCE = 0.15 # Relative slowdown or memory growth against the baseline reported as a regression
+BENCHMARK_DB_NAME = os.getenv('BENCHMARK_DB_NAME') # A scratch database for the db_write benchmark, it is truncated
+TEST_DB_NAME = os.getenv('TEST_DB_NAME') # A scratch database for the Postgres tests, its tables are truncated
 
 # Postgres settings (set your own)
 DB_HOST = os.getenv('DB_HOST', 'localhost')
@@ -27,6 +133,7 @@ DB_PORT=os.getenv('DB_PORT', '5432')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_NAME = os.getenv('DB_NAME')
+DB_CREATE_INDEXES_CONCURRENTLY = os.getenv('DB_CREATE_INDEXES_CONCURRENTLY', 'true').lower() == 'true' # Don't block the writes to live tables while indexing
 
 #MinIO settings
 MINIO_ROOT_USER = os.getenv('MINIO_ROOT_USER','minio')
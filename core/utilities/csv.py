@@ -1,8 +1,19 @@
+from __future__ import annotations
+
 import os
 from os import PathLike
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+from core.utilities.log import get_logger
+from core.utilities.memory import PROFILER
+from core.utilities.prices import PRICE_COLUMNS, add_price_columns
+
 
-import pandas as pd
+logger = get_logger(__name__)
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class PandasHelper:
@@ -26,23 +37,30 @@ class PandasHelper:
         Returns:
             pd.DataFrame: A DataFrame containing the merged and deduplicated data.
         """
+        # pandas takes a while to import, so it's only loaded when a CSV file is actually read or written
+        import pandas as pd
+
         data_frames = []
 
         # Read each file into a DataFrame
         for file in csv_files:
             try:
                 df = pd.read_csv(file)
+                # Files saved before the prices were normalized
+                if 'price' in df and not all(col in df for col in PRICE_COLUMNS):
+                    add_price_columns(df)
                 data_frames.append(df)
             except (FileNotFoundError, pd.errors.EmptyDataError):
-                print(f"Warning: Could not read {file}. Skipping.")
+                logger.warning("Could not read %s. Skipping.", file)
 
         # Concatenate and drop duplicates based on 'id'
         try:
-            merged_df = pd.concat(data_frames, ignore_index=True).drop_duplicates(subset='id', keep='last')
-            print(f"Merged {len(csv_files)} files. Total records after deduplication: {len(merged_df)}")
+            with PROFILER.stage('dataframe'):
+                merged_df = pd.concat(data_frames, ignore_index=True).drop_duplicates(subset='id', keep='last')
+            logger.info("Merged %d files. Total records after deduplication: %d", len(csv_files), len(merged_df))
             return merged_df
         except ValueError as e:
-            print(f"Error merging files: {e}")
+            logger.error("Error merging files: %s", e)
             return pd.DataFrame()
 
 
@@ -60,8 +78,10 @@ class PandasHelper:
             output_file_name (str): Path to the output file.
             create_new_file (bool): Whether to create a new file or append to an existing one.
         """
+        import pandas as pd
+
         if df.empty:
-            print("No data to save. Exiting...")
+            logger.info("No data to save. Exiting...")
             return
 
         filepath = os.path.join(self.path_to_save, output_file_name)
@@ -69,19 +89,49 @@ class PandasHelper:
         if create_new_file:
             if not os.path.exists(filepath):
                 # Save as a new file
-                print(f"New file created: {filepath}. Total records: {len(df)}")
+                logger.info("New file created: %s. Total records: %d", filepath, len(df))
             else:
-                print(f"File already exists: {filepath}. Rewriting to it.")
+                logger.info("File already exists: %s. Rewriting to it.", filepath)
             df.to_csv(filepath, index=False)
         else:
             # Append to the existing file while maintaining uniqueness
             try:
-                existing_df = pd.read_csv(filepath)
-                combined_df = pd.concat([existing_df, df], ignore_index=True).drop_duplicates(
-                    subset='id', keep='last'
-                )
-                combined_df.to_csv(filepath, index=False)
-                print(f"Appended and updated file: {filepath}. Total records: {len(combined_df)}")
+                with PROFILER.stage('dataframe'):
+                    existing_df = pd.read_csv(filepath)
+                    combined_df = pd.concat([existing_df, df], ignore_index=True).drop_duplicates(
+                        subset='id', keep='last'
+                    )
+                    combined_df.to_csv(filepath, index=False)
+                logger.info("Appended and updated file: %s. Total records: %d", filepath, len(combined_df))
             except (FileNotFoundError, pd.errors.EmptyDataError):
-                print(f"Error: Could not read {filepath}. Saving as a new file.")
-                df.to_csv(output_file_name, index=False)
\ No newline at end of file
+                logger.warning("Could not read %s. Saving as a new file.", filepath)
+                df.to_csv(output_file_name, index=False)
+
+    def append_data_to_csv_file(self, df: pd.DataFrame, output_file_name: PathLike | str) -> None:
+        """
+        Append the rows of a DataFrame to a file without reading it, writing the header if the file is new.
+        Unlike save_data_to_csv_file, the rows are not deduplicated against the file, which is left to
+        merge_from_csv_files: use it for rows that are unique already, e.g. the flushes of a single parser run.
+
+        Parameters:
+            df (pd.DataFrame): The DataFrame to append.
+            output_file_name (str): Path to the output file.
+        """
+        import pandas as pd
+
+        if df.empty:
+            logger.info("No data to save. Exiting...")
+            return
+
+        filepath = os.path.join(self.path_to_save, output_file_name)
+        file_exists = os.path.exists(filepath) and os.path.getsize(filepath) > 0
+        if file_exists:
+            columns = pd.read_csv(filepath, nrows=0).columns
+            if set(columns) != set(df.columns):
+                logger.warning("Columns of %s don't match. Merging the file instead.", filepath)
+                self.save_data_to_csv_file(df, output_file_name, create_new_file=False)
+                return
+            # Keep the columns in the order of the existing header
+            df = df[list(columns)]
+        df.to_csv(filepath, mode='a', header=not file_exists, index=False)
+        logger.info("Appended %d records to %s.", len(df), filepath)
\ No newline at end of file
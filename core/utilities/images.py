@@ -0,0 +1,161 @@
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from core.settings import IMAGE_TARGET_SIZES, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_PROCESS_WORKERS
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'WEBP': 'webp',
+    'PNG': 'png',
+}
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II matrix, so that the 2D DCT of X is D @ X @ D.T."""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+HASH_IMAGE_SIZE = 32
+HASH_SIZE = 8
+DCT_MATRIX = _dct_matrix(HASH_IMAGE_SIZE)
+
+
+def compute_phash(image):
+    """
+    Compute a 64-bit perceptual hash (pHash) of an image.
+
+    The image is reduced to a 32x32 grayscale square, the 8x8 lowest DCT frequencies are kept
+    and each bit tells whether a frequency is above their median. Crops, rescaling and re-compression
+    change only a few bits, so near-duplicates are close in Hamming distance.
+
+    :param image: A PIL image.
+    :return: The hash as an unsigned 64-bit integer.
+    """
+    pixels = np.asarray(
+        image.convert('L').resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.Resampling.LANCZOS),
+        dtype=np.float64
+    )
+    frequencies = (DCT_MATRIX @ pixels @ DCT_MATRIX.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term only reflects the average brightness, leave it out of the median
+    bits = frequencies > np.median(frequencies[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def decode_image(image_data):
+    """
+    Fully decode an image.
+
+    :return: An RGB PIL image or None if the data is truncated, corrupt or not an image.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            # Force a full decode: truncated or corrupt files fail here, not at re-encoding
+            image.load()
+            return image.convert('RGB')
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return None
+
+
+def compute_image_hash(image_data):
+    """Decode an image and compute its perceptual hash. Runs in a worker process."""
+    image = decode_image(image_data)
+    return compute_phash(image) if image is not None else None
+
+
+def process_image(image_data, target_sizes, image_format, quality, compute_hash=False):
+    """
+    Decode, validate, resize and re-encode an image. Runs in a worker process.
+
+    :param image_data: Raw bytes of the downloaded image.
+    :param target_sizes: Sizes to produce: None keeps the original resolution,
+        an integer is the longest side of a thumbnail in pixels. If empty, the image is only validated.
+    :param image_format: Pillow format name to re-encode the image to (e.g. 'WEBP').
+    :param quality: Encoder quality (1-100).
+    :param compute_hash: Whether to compute the perceptual hash of the image.
+    :return: A tuple of a list of (suffix, encoded_bytes) pairs and the perceptual hash (or None),
+        or None if the image can't be decoded.
+    """
+    image = decode_image(image_data)
+    if image is None:
+        return None
+
+    variants = []
+    for size in target_sizes:
+        if size is None:
+            variant, suffix = image, ''
+        else:
+            variant, suffix = image.copy(), f"-{size}"
+            variant.thumbnail((size, size))
+
+        buffer = io.BytesIO()
+        variant.save(buffer, format=image_format, quality=quality)
+        variants.append((suffix, buffer.getvalue()))
+
+    image_hash = compute_phash(image) if compute_hash else None
+    return variants, image_hash
+
+
+class ImageProcessor:
+    """Post-processes downloaded images in a process pool, so the event loop keeps downloading."""
+
+    def __init__(
+            self,
+            target_sizes=IMAGE_TARGET_SIZES,
+            image_format=IMAGE_FORMAT,
+            quality=IMAGE_QUALITY,
+            max_workers=IMAGE_PROCESS_WORKERS,
+            compute_hash=False
+    ):
+        """
+        :param target_sizes: Sizes to produce for every image (see `process_image`).
+            With no target sizes, images are only validated and stored as they are.
+        :param image_format: Pillow format name to re-encode images to.
+        :param quality: Encoder quality (1-100).
+        :param max_workers: Number of worker processes (defaults to the number of CPUs).
+        :param compute_hash: Whether to compute perceptual hashes of the images.
+        """
+        if image_format not in IMAGE_EXTENSIONS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.target_sizes = tuple(target_sizes)
+        self.image_format = image_format
+        self.extension = IMAGE_EXTENSIONS[image_format]
+        self.quality = quality
+        self.max_workers = max_workers
+        self.compute_hash = compute_hash
+        self.executor = None
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            logger.info("Image processing pool started (%d workers).", self.executor._max_workers)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            logger.info("Image processing pool closed.")
+
+    async def process(self, image_data):
+        """
+        Process an image in the pool.
+
+        :return: A tuple of a list of (suffix, encoded_bytes) pairs and the perceptual hash,
+            or None if the image is invalid.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, process_image,
+            image_data, self.target_sizes, self.image_format, self.quality, self.compute_hash
+        )
@@ -0,0 +1,158 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from core.settings import LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_SAMPLE_EVERY, LOG_PROGRESS_INTERVAL
+
+
+ROOT_LOGGER_NAME = 'avito'
+
+# Attributes of every LogRecord, the rest comes from `extra` and is logged as structured fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records as 'time level logger message key=value ...' or as JSON lines,
+    with the fields passed in `extra` added to the message.
+    """
+
+    def __init__(self, fmt='text'):
+        super().__init__(datefmt='%Y-%m-%d %H:%M:%S')
+        self.fmt = fmt
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+        message = record.getMessage()
+        if self.fmt == 'json':
+            entry = {
+                'time': self.formatTime(record, self.datefmt),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': message,
+                **fields
+            }
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        line = f"{self.formatTime(record, self.datefmt)} {record.levelname:<7} {record.name}: {message}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, log_file=LOG_FILE):
+    """
+    Send the records of the project's loggers through a queue to a listener thread that writes them
+    to stderr (and `log_file`), so logging never blocks the crawler or the downloader's event loop on I/O.
+    Called on the first `get_logger`; calling it again replaces the configuration.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+
+        formatter = StructuredFormatter(fmt)
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        root.setLevel(level)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging():
+    """Write out the queued records and stop the listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(name):
+    """
+    Return a logger of the project, e.g. get_logger(__name__).
+    Per-item messages go to `debug` with %-style arguments, so they cost almost nothing when disabled.
+    """
+    if _listener is None:
+        setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+class SampledLogger:
+    """
+    Logs only every n-th message of a frequent per-item event, e.g. one of every 100 saved images.
+    The counter is shared by all the messages of the sampled logger.
+    """
+
+    def __init__(self, logger, every=LOG_SAMPLE_EVERY):
+        self.logger = logger
+        self.every = max(every, 1)
+        self._counter = itertools.count(1)
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        count = next(self._counter)
+        if (count - 1) % self.every == 0:
+            self.logger.log(level, msg, *args, extra={'sampled': f"1/{self.every}", 'seen': count}, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+
+class ProgressLogger:
+    """
+    Counts per-item events and logs an aggregate progress line at most every `interval` seconds,
+    e.g. 'Downloaded images: 1200 (35.2/s)'.
+    """
+
+    def __init__(self, logger, label, interval=LOG_PROGRESS_INTERVAL):
+        self.logger = logger
+        self.label = label
+        self.interval = interval
+        self.count = 0
+        self.started = time.monotonic()
+        self._last_logged = self.started
+        self._lock = threading.Lock()
+
+    def add(self, amount=1):
+        with self._lock:
+            self.count += amount
+            now = time.monotonic()
+            if now - self._last_logged < self.interval:
+                return
+            self._last_logged = now
+            count = self.count
+        self.logger.info("%s: %d (%.1f/s)", self.label, count, count / max(now - self.started, 1e-9))
+
+    def done(self):
+        elapsed = time.monotonic() - self.started
+        self.logger.info("%s: %d in %.1fs (%.1f/s)", self.label, self.count, elapsed, self.count / max(elapsed, 1e-9))
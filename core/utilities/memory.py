@@ -0,0 +1,267 @@
+import json
+import os
+import resource
+import threading
+import tracemalloc
+
+from core.settings import (
+    MEMORY_PROFILE, MEMORY_SAMPLE_INTERVAL, MEMORY_TOP_SITES, MEMORY_REPORT_FILE, MEMORY_BUDGET_RATIO,
+    MEMORY_BUDGET_HYSTERESIS
+)
+from core.utilities.log import get_logger
+from core.utilities.metrics import REGISTRY
+
+
+logger = get_logger(__name__)
+
+RSS_BYTES = REGISTRY.gauge('process_rss_bytes', "Resident set size of the process.")
+STAGE_PEAK_RSS_BYTES = REGISTRY.gauge('pipeline_stage_peak_rss_bytes', "Peak RSS sampled while a pipeline stage ran.")
+
+# Memory limits of the container (cgroup v2 and v1)
+CGROUP_LIMIT_FILES = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+MB = 2 ** 20
+
+# The profiler's own allocations are left out of the top sites
+_IGNORED_TRACES = (tracemalloc.Filter(False, tracemalloc.__file__),)
+
+
+def get_rss():
+    """Resident set size of the process in bytes (None where /proc is not available)."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def get_peak_rss():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_container_memory_limit():
+    """The memory limit of the container in bytes, or None if there is none."""
+    for path in CGROUP_LIMIT_FILES:
+        try:
+            with open(path) as file:
+                value = file.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports a huge number instead of 'max' when there is no limit
+        if value != 'max' and int(value) < 2 ** 60:
+            return int(value)
+    return None
+
+
+class MemoryBudget:
+    """
+    An RSS limit of the process, checked by the stages that can shed memory:
+    the parser flushes the objects it holds, the downloader stops starting new batches.
+    """
+
+    def __init__(self, limit_mb=None, ratio=MEMORY_BUDGET_RATIO, hysteresis=MEMORY_BUDGET_HYSTERESIS):
+        """
+        :param limit_mb: The budget in MB. By default it is `ratio` of the container's memory limit,
+            and without a container limit the budget is disabled.
+        :param hysteresis: Share of the budget the RSS must grow by after `mark_flushed` before the budget
+            is exceeded again. Freed memory is rarely returned to the OS, so the RSS stays high after a flush.
+        """
+        if limit_mb:
+            self.limit = limit_mb * MB
+        else:
+            container_limit = get_container_memory_limit()
+            self.limit = int(container_limit * ratio) if container_limit else None
+        self.hysteresis = hysteresis
+        self.threshold = self.limit
+
+    @property
+    def enabled(self):
+        return self.limit is not None
+
+    def exceeded(self):
+        if not self.enabled:
+            return False
+        rss = get_rss()
+        return rss is not None and rss > self.threshold
+
+    def mark_flushed(self):
+        """Measure the budget from the RSS after the memory has been shed, e.g. after the parser's flush."""
+        rss = get_rss()
+        if self.enabled and rss is not None:
+            self.threshold = max(self.limit, rss + int(self.limit * self.hysteresis))
+
+
+class StageMemory:
+    """Memory statistics of one pipeline stage, collected over all its runs."""
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.peak_rss = 0
+        self.max_rss_growth = 0
+        self.max_traced_peak = 0
+        self.max_traced_growth = None
+        self.top_sites = []
+
+
+class MemoryProfiler:
+    """
+    Optional memory profiling of the pipeline stages (MEMORY_PROFILE=true).
+
+    A background thread samples the RSS, so the peak of every running stage is known even for stages
+    that run concurrently (e.g. download batches). With tracemalloc, every run of a stage also records
+    the peak of the traced memory and the lines that allocated the most memory during the run.
+    Allocations of concurrent runs are attributed to all of them, so the top sites of concurrent stages are approximate.
+    When disabled, `stage` costs nothing but a function call.
+    """
+
+    def __init__(self, enabled=MEMORY_PROFILE, sample_interval=MEMORY_SAMPLE_INTERVAL, top_sites=MEMORY_TOP_SITES):
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        self.top_sites = top_sites
+        self.stages = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, trace=True):
+        """Start the RSS sampler and, with `trace`, tracemalloc."""
+        if not self.enabled or self._thread is not None:
+            return
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _sample(self):
+        while not self._stop_event.wait(self.sample_interval):
+            rss = get_rss()
+            if rss is None:
+                continue
+            RSS_BYTES.set(rss)
+            with self._lock:
+                for name in self._active:
+                    stage = self.stages[name]
+                    stage.peak_rss = max(stage.peak_rss, rss)
+
+    def stage(self, name):
+        """Profile a run of a stage: `with PROFILER.stage('parser'): ...`"""
+        if not self.enabled:
+            return _NO_STAGE
+        return _StageRun(self, name)
+
+    def _enter(self, name):
+        with self._lock:
+            self.stages.setdefault(name, StageMemory(name))
+            self._active[name] = self._active.get(name, 0) + 1
+
+    def _exit(self, name, rss_growth, traced_peak, traced_growth, top_sites):
+        rss = get_rss() or 0
+        with self._lock:
+            self._active[name] -= 1
+            if not self._active[name]:
+                del self._active[name]
+            stage = self.stages[name]
+            stage.runs += 1
+            stage.peak_rss = max(stage.peak_rss, rss)
+            stage.max_rss_growth = max(stage.max_rss_growth, rss_growth)
+            stage.max_traced_peak = max(stage.max_traced_peak, traced_peak)
+            # Keep the allocation sites of the run that grew the traced memory the most
+            if top_sites is not None and (stage.max_traced_growth is None or traced_growth > stage.max_traced_growth):
+                stage.max_traced_growth = traced_growth
+                stage.top_sites = top_sites
+            STAGE_PEAK_RSS_BYTES.set(stage.peak_rss, stage=name)
+
+    def get_report(self):
+        with self._lock:
+            return {
+                name: {
+                    'runs': stage.runs,
+                    'peak_rss_mb': round(stage.peak_rss / MB, 1),
+                    'max_rss_growth_mb': round(stage.max_rss_growth / MB, 1),
+                    'max_traced_peak_mb': round(stage.max_traced_peak / MB, 1),
+                    'top_sites': stage.top_sites,
+                }
+                for name, stage in self.stages.items()
+            }
+
+    def report(self, path=MEMORY_REPORT_FILE):
+        """Log the peak memory and the top allocation sites of every stage and save the report as JSON."""
+        if not self.enabled:
+            return
+        report = self.get_report()
+        for name, stage in report.items():
+            logger.info(
+                "Memory of stage %s: peak RSS %.1f MB, max growth %.1f MB, traced peak %.1f MB over %d runs.",
+                name, stage['peak_rss_mb'], stage['max_rss_growth_mb'], stage['max_traced_peak_mb'], stage['runs']
+            )
+            for site in stage['top_sites']:
+                logger.info("  %s: %+.1f KB in %+d blocks", site['site'], site['size_kb'], site['blocks'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({'peak_rss_mb': round(get_peak_rss() / MB, 1), 'stages': report}, file, indent=2)
+        logger.info("Memory report saved to %s.", path)
+
+
+class _StageRun:
+    __slots__ = ('profiler', 'name', 'rss', 'snapshot', 'traced')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        self.rss = get_rss() or 0
+        self.snapshot = None
+        if tracemalloc.is_tracing():
+            self.traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            self.snapshot = tracemalloc.take_snapshot()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        traced_peak = traced_growth = 0
+        top_sites = None
+        if self.snapshot is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            traced_peak = peak - self.traced
+            traced_growth = current - self.traced
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_TRACES)
+            differences = snapshot.compare_to(self.snapshot.filter_traces(_IGNORED_TRACES), 'lineno')
+            top_sites = [
+                {
+                    'site': f"{difference.traceback[0].filename}:{difference.traceback[0].lineno}",
+                    'size_kb': round(difference.size_diff / 1024, 1),
+                    'blocks': difference.count_diff,
+                }
+                for difference in differences[:self.profiler.top_sites]
+            ]
+        self.profiler._exit(self.name, (get_rss() or 0) - self.rss, traced_peak, traced_growth, top_sites)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+PROFILER = MemoryProfiler()
@@ -0,0 +1,269 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.settings import METRICS_PORT, METRICS_SUMMARY_FILE
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# Upper bounds of the latency histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _summary_key(key):
+    return ",".join(f"{name}={value}" for name, value in key) or 'total'
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class Counter:
+    """A value that only goes up, e.g. the number of fetched pages."""
+
+    type = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def summary(self):
+        with self._lock:
+            return {_summary_key(key): value for key, value in self.values.items()}
+
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g. the number of downloads in flight."""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Distribution of observed values (latencies in seconds) in cumulative buckets."""
+
+    type = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        # Label key -> [bucket counts, sum, count, max]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+            entry[3] = max(entry[3], value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count, _) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key + (('le', bound),), cumulative))
+                samples.append((f"{self.name}_bucket", key + (('le', '+Inf'),), count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+    def _quantile(self, counts, count, maximum, quantile):
+        # Upper bound of the bucket the quantile falls into
+        rank = quantile * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(bound, maximum)
+        return maximum
+
+    def summary(self):
+        with self._lock:
+            return {
+                _summary_key(key): {
+                    'count': count,
+                    'sum': round(total, 6),
+                    'mean': round(total / count, 6) if count else None,
+                    'p50': round(self._quantile(counts, count, maximum, 0.5), 6),
+                    'p99': round(self._quantile(counts, count, maximum, 0.99), 6),
+                    'max': round(maximum, 6),
+                }
+                for key, (counts, total, count, maximum) in self.values.items()
+            }
+
+
+class MetricsRegistry:
+    """A set of metrics that can be exposed in the Prometheus text format and summarized as JSON."""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _get_or_create(self, metric_class, name, description, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(name, description, **kwargs)
+            elif type(metric) is not metric_class:
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}.")
+            return metric
+
+    def counter(self, name, description=""):
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name, description=""):
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name, description="", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def render_prometheus(self):
+        """All the metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """A JSON-serializable summary of all the metrics."""
+        return {name: metric.summary() for name, metric in list(self.metrics.items())}
+
+    def write_summary(self, path=METRICS_SUMMARY_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+        logger.info("Metrics summary saved to %s.", path)
+
+    def start_http_server(self, port=METRICS_PORT, host='0.0.0.0'):
+        """Serve the metrics at http://<host>:<port>/metrics from a daemon thread."""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info("Serving metrics at http://%s:%s/metrics", host, port)
+        return self._server
+
+    def stop_http_server(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram('pipeline_stage_seconds', "Time spent in a pipeline stage.")
+STAGE_ITEMS = REGISTRY.counter('pipeline_stage_items_total', "Items that went through a pipeline stage.")
+STAGE_ERRORS = REGISTRY.counter('pipeline_stage_errors_total', "Errors raised in a pipeline stage.")
+
+
+class timed:
+    """
+    Measure the time of a pipeline stage, as a context manager or as a decorator of sync and async functions.
+
+    Usage:
+        with timed('parse'):
+            ...
+
+        @timed('db_write')
+        def save_to_db(...):
+            ...
+    """
+
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage)
+
+    def __call__(self, func):
+        stage = self.stage
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def count_items(stage, amount=1):
+    """Count the items that went through a pipeline stage."""
+    STAGE_ITEMS.inc(amount, stage=stage)
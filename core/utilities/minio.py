@@ -1,67 +1,132 @@
 import io
+import os
+from datetime import timedelta
 
+import certifi
+import urllib3
 from minio import Minio
 from minio.error import S3Error
 
+from core.utilities.log import get_logger
 
-def create_image_key(record, counter=1):
+
+logger = get_logger(__name__)
+
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp',
+    'png': 'image/png',
+}
+
+
+def create_image_key(record, counter=1, suffix='', extension='jpg'):
     # Generate a unique key for the image
     user_id = record['user_id']
     object_id = record['id']
 
     # Construct the object key based on user and object
-    image_key = f"user-{user_id}/object-{object_id}/image-{counter}.jpg"
-    print(f"Image key: {image_key} has been created")
+    image_key = f"user-{user_id}/object-{object_id}/image-{counter}{suffix}.{extension}"
+    logger.debug("Image key %s has been created", image_key)
     return image_key
 
 
 class MinioClient:
-    def __init__(self, endpoint, root_user, password, secure=False):
+    def __init__(self, endpoint, root_user, password, secure=False, max_connections=None):
+        """
+        :param max_connections: Size of the connection pool, for clients shared by many threads
+            (the MinIO client keeps 10 connections by default and drops the others after every request).
+        """
+        http_client = None
+        if max_connections:
+            # The defaults of the MinIO client, but the pool size
+            timeout = timedelta(minutes=5).seconds
+            http_client = urllib3.PoolManager(
+                timeout=urllib3.Timeout(connect=timeout, read=timeout),
+                maxsize=max_connections,
+                cert_reqs='CERT_REQUIRED',
+                ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+                retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+            )
         self.client = Minio(endpoint,
                             access_key=root_user,
                             secret_key=password,
-                            secure=secure)
+                            secure=secure,
+                            http_client=http_client)
 
     def create_bucket(self, bucket_name):
         # Check if the bucket exists, create if it doesn't
         try:
             if not self.client.bucket_exists(bucket_name):
                 self.client.make_bucket(bucket_name)
-                print(f"Bucket '{bucket_name}' created.")
+                logger.info("Bucket '%s' created.", bucket_name)
             else:
-                print(f"Bucket '{bucket_name}' already exists.")
+                logger.info("Bucket '%s' already exists.", bucket_name)
         except S3Error as err:
-            print(f"Error creating bucket: {err}")
+            logger.error("Error creating bucket: %s", err)
 
     def delete_bucket(self, bucket_name):
         try:
             self.client.remove_bucket(bucket_name)
-            print(f"Bucket '{bucket_name}' deleted.")
+            logger.info("Bucket '%s' deleted.", bucket_name)
         except S3Error as err:
-            print(f"Error deleting bucket: {err}")
+            logger.error("Error deleting bucket: %s", err)
 
     def upload_image(self, bucket_name, image_key, image_data):
         try:
             file_data = io.BytesIO(image_data)
+            content_type = CONTENT_TYPES.get(image_key.rsplit('.', 1)[-1], 'application/octet-stream')
             # Upload image to the specified bucket
             self.client.put_object(
                 bucket_name,
                 image_key,
                 file_data,
                 len(image_data),
-                'image/jpeg')
-            print(f"Uploaded {image_key} to Minio.")
+                content_type)
+            logger.debug("Uploaded %s to Minio.", image_key)
         except S3Error as err:
-            print(f"Error uploading {image_key} to Minio: {err}")
+            logger.error("Error uploading %s to Minio: %s", image_key, err)
         except Exception as err:
-            print(f"{type(err).__name__} occurred uploading {image_key} to Minio: {err}")
+            logger.error("%s occurred uploading %s to Minio: %s", type(err).__name__, image_key, err)
 
-    def get_image(self, bucket_name, image_key):
+    def get_image(self, bucket_name, image_key, missing_ok=False):
+        """
+        :param missing_ok: Return None only if there is no such image (e.g. its download has failed),
+            and raise the other errors, so that the caller can tell a missing image from a failed request.
+            Otherwise, every error is logged and None is returned.
+        """
+        response = None
         try:
-            image_data = self.client.get_object(bucket_name, image_key)
-            return image_data.read()
+            response = self.client.get_object(bucket_name, image_key)
+            return response.read()
         except S3Error as err:
-            print(f"Error getting {image_key} from Minio: {err}")
+            if missing_ok and err.code == 'NoSuchKey':
+                logger.debug("%s is not in Minio.", image_key)
+            elif missing_ok:
+                raise
+            else:
+                logger.error("Error getting %s from Minio: %s", image_key, err)
         except Exception as err:
-            print(f"{type(err).__name__} occurred getting {image_key} from Minio: {err}")
+            if missing_ok:
+                raise
+            logger.error("%s occurred getting %s from Minio: %s", type(err).__name__, image_key, err)
+        finally:
+            # Return the connection to the pool
+            if response is not None:
+                response.close()
+                response.release_conn()
         return None
+
+    def list_image_keys(self, bucket_name, prefix=None):
+        """Iterate over the keys of all the objects in the bucket (optionally under a prefix)."""
+        try:
+            for obj in self.client.list_objects(bucket_name, prefix=prefix, recursive=True):
+                yield obj.object_name
+        except S3Error as err:
+            logger.error("Error listing objects in '%s': %s", bucket_name, err)
+
+    def remove_image(self, bucket_name, image_key):
+        try:
+            self.client.remove_object(bucket_name, image_key)
+            logger.debug("Removed %s from Minio.", image_key)
+        except S3Error as err:
+            logger.error("Error removing %s from Minio: %s", image_key, err)
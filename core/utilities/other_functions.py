@@ -1,34 +1,41 @@
+import json
 import time
 from datetime import datetime, UTC
 import functools
 
+from core.settings import METRICS_PORT
+from core.utilities.log import get_logger
+from core.utilities.memory import PROFILER
+from core.utilities.metrics import REGISTRY, timed
+
+
+logger = get_logger(__name__)
+
 
 def runtime_counter(func):
-    """A decorator for measuring and logging a function's runtime."""
+    """
+    A decorator for measuring a function's runtime (usually a script's `main`).
+    While the function runs, the metrics are served at /metrics if METRICS_PORT is set;
+    afterwards the runtime is recorded and a JSON summary of all the metrics is saved to METRICS_SUMMARY_FILE.
+    With MEMORY_PROFILE=true the memory of the pipeline stages is profiled and reported as well.
+    """
 
     @functools.wraps(func)
-    #def wrapper(*args, **kwargs):
-        # start_time = time.time()
-        
-        # # Run the decorated function
-        # result = func(*args, **kwargs)
-
-        # # Calculate elapsed time
-        # elapsed_time = time.time() - start_time
-        # hours, remainder = divmod(elapsed_time, 3600)
-        # minutes, seconds = divmod(remainder, 60)
-        # milliseconds = (elapsed_time % 1) * 1000
-        # # Log the runtime details
-        # print(
-        #     f"{func.__name__} runtime: "
-        #     f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}.{int(milliseconds):03}"
-        # )
     def wrapper(*args, **kwargs):
+        if METRICS_PORT:
+            REGISTRY.start_http_server(METRICS_PORT)
+        PROFILER.start()
         start_time = time.time()
-        result = func(*args, **kwargs)
-        elapsed_time = time.time() - start_time
-        print(f"Function {func.__name__} executed in {elapsed_time:.2f} seconds.")
-        return result
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed_time = time.time() - start_time
+            REGISTRY.gauge('run_seconds', "Runtime of a script's main function.").set(elapsed_time, function=func.__name__)
+            logger.info("Function %s executed in %.2f seconds.", func.__name__, elapsed_time)
+            logger.info("Pipeline stages: %s", json.dumps(REGISTRY.summary().get('pipeline_stage_seconds', {}), indent=2))
+            REGISTRY.write_summary()
+            PROFILER.stop()
+            PROFILER.report()
     return wrapper
 
 
@@ -47,9 +54,10 @@ def dedupe(items, key=None):
             seen.add(val)
 
 
+@timed('dedup')
 def return_unique_records(items) -> list:
     records = list(dedupe(items, key=lambda d: d['id']))
-    print (f"Returning {len(records)} unique records.")
+    logger.debug("Returning %d unique records.", len(records))
     return records
 
 
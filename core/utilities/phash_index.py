@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+
+from core.settings import PHASH_INDEX_FILE, PHASH_MAX_DISTANCE
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# Upper bound for the number of cells of a single query x index distance matrix (uint8, so ~16 MB)
+SEARCH_CHUNK_CELLS = 16 * 1024 * 1024
+
+
+def hamming_distances(queries, hashes):
+    """
+    Vectorized Hamming distances between two sets of 64-bit hashes.
+
+    :param queries: A uint64 array of shape (q,).
+    :param hashes: A uint64 array of shape (n,).
+    :return: A uint8 array of shape (q, n).
+    """
+    return np.bitwise_count(queries[:, None] ^ hashes[None, :])
+
+
+class PerceptualHashIndex:
+    """
+    An in-memory index of 64-bit perceptual hashes of stored images.
+
+    Hashes are kept in a compact uint64 NumPy array (8 bytes per image) next to the list of image keys,
+    and searched by brute-force vectorized Hamming distance, which is fast enough for millions of images.
+    """
+
+    def __init__(self, path=PHASH_INDEX_FILE):
+        self.path = path
+        self.keys = []
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._pending = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def hashes(self):
+        # Appending to a NumPy array copies it, so new hashes are buffered and merged on demand
+        if self._pending:
+            self._hashes = np.concatenate([self._hashes, np.array(self._pending, dtype=np.uint64)])
+            self._pending = []
+        return self._hashes
+
+    def add(self, key, image_hash):
+        self.keys.append(key)
+        self._pending.append(image_hash)
+
+    def remove(self, keys):
+        keys = set(keys)
+        keep = np.array([key not in keys for key in self.keys], dtype=bool)
+        self._hashes = self.hashes[keep]
+        self.keys = [key for key in self.keys if key not in keys]
+
+    def search(self, query_hashes, max_distance=PHASH_MAX_DISTANCE):
+        """
+        Find the stored images within `max_distance` bits of each query hash.
+
+        :param query_hashes: An iterable of 64-bit hashes.
+        :param max_distance: Maximum Hamming distance for a match.
+        :return: A list with a list of (key, distance) pairs sorted by distance for every query.
+        """
+        queries = np.asarray(list(query_hashes), dtype=np.uint64)
+        results = [[] for _ in range(len(queries))]
+        for start, rows, cols, distances in self._iter_matches(queries, max_distance):
+            for row, col, distance in zip(rows, cols, distances):
+                results[start + row].append((self.keys[col], int(distance)))
+        return [sorted(matches, key=lambda match: match[1]) for matches in results]
+
+    def find_clusters(self, max_distance=PHASH_MAX_DISTANCE):
+        """
+        Group the stored images into clusters of near-duplicates.
+
+        :return: A list of clusters (lists of keys with more than one element), sorted by key.
+        """
+        hashes = self.hashes
+        parents = np.arange(len(hashes))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        for start, rows, cols, _ in self._iter_matches(hashes, max_distance):
+            for row, col in zip(rows + start, cols):
+                # Every pair is seen twice, keep one of them
+                if row < col:
+                    root_row, root_col = find(row), find(col)
+                    if root_row != root_col:
+                        parents[max(root_row, root_col)] = min(root_row, root_col)
+
+        clusters = {}
+        for i in range(len(hashes)):
+            clusters.setdefault(find(i), []).append(self.keys[i])
+        return [sorted(cluster) for cluster in clusters.values() if len(cluster) > 1]
+
+    def _iter_matches(self, queries, max_distance):
+        """
+        Yield (chunk_start, rows, cols, distances) of the query/index pairs within max_distance,
+        one chunk of queries at a time to bound the memory used by the distance matrix.
+        """
+        hashes = self.hashes
+        if not len(hashes) or not len(queries):
+            return
+        chunk_size = max(1, SEARCH_CHUNK_CELLS // len(hashes))
+        for start in range(0, len(queries), chunk_size):
+            distances = hamming_distances(queries[start:start + chunk_size], hashes)
+            rows, cols = np.nonzero(distances <= max_distance)
+            yield start, rows, cols, distances[rows, cols]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        np.savez(self.path, hashes=self.hashes, keys=np.array(self.keys, dtype=str))
+        logger.info("Saved %d perceptual hashes to %s.", len(self), self.path)
+
+    @classmethod
+    def load(cls, path=PHASH_INDEX_FILE):
+        """Load the index from disk, or return an empty one if there is no file yet."""
+        index = cls(path)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                index._hashes = data['hashes'].astype(np.uint64)
+                index.keys = data['keys'].tolist()
+            logger.info("Loaded %d perceptual hashes from %s.", len(index), path)
+        return index
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# The first number of a price text, with spaces (\s covers the non-breaking and thin ones), dots or commas
+# between the digit groups: "1 200 000,50 ₽", "$1,200.50", "1.200 €"
+PRICE_NUMBER_PATTERN = r'(\d(?:[\d\s.,]*\d)?)'
+# A dot or comma followed by exactly three digits separates digit groups, otherwise it's the decimal point
+DIGIT_GROUP_SEPARATORS_PATTERN = r'\s|[.,](?=\d{3}(?!\d))'
+
+# Currency signs and words mapped to ISO 4217 codes
+CURRENCIES = {
+    '₽': 'RUB', 'руб': 'RUB', 'р.': 'RUB',
+    '$': 'USD', 'usd': 'USD',
+    '€': 'EUR', 'eur': 'EUR',
+    '₸': 'KZT', '₴': 'UAH', '¥': 'CNY',
+}
+CURRENCY_PATTERN = '(' + '|'.join(re.escape(sign) for sign in CURRENCIES) + ')'
+
+# Price postfixes (`price_for`) mapped to units; unknown postfixes stay in 'price_for' and get no unit
+PRICE_UNITS = {
+    'на продажу': 'sale',
+    'за сутки': 'day', 'в сутки': 'day',
+    'в месяц': 'month', 'за месяц': 'month',
+    'в год': 'year', 'за год': 'year',
+    'за час': 'hour', 'в час': 'hour',
+    'за м²': 'm2', 'за м2': 'm2', 'за кв. м': 'm2',
+    'за сотку': 'are', 'за га': 'hectare',
+    'за шт.': 'piece', 'за шт': 'piece',
+    'за услугу': 'service',
+}
+
+PRICE_COLUMNS = ('price_value', 'currency', 'price_unit')
+
+
+def add_price_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the typed price columns parsed from the display texts of 'price' and 'price_for', for the whole DataFrame at once:
+    - price_value: the amount as a float, NaN for prices without a number ("Цена не указана", "Договорная");
+    - currency: the ISO code of the currency ('RUB', 'USD', ...), None if there is no currency sign;
+    - price_unit: what the price is for ('sale', 'day', 'month', 'm2', ...), None for unknown postfixes.
+
+    :param df: A DataFrame with the 'price' and 'price_for' columns, changed in place.
+    :return: The same DataFrame.
+    """
+    import pandas as pd
+
+    # Object dtype: the 'string' dtype is slower for the pages of a few hundred rows
+    price = df['price'].astype(object)
+    number = (
+        price.str.extract(PRICE_NUMBER_PATTERN, expand=False)
+        .str.replace(DIGIT_GROUP_SEPARATORS_PATTERN, '', regex=True)
+        .str.replace(',', '.', regex=False)
+    )
+    df['price_value'] = pd.to_numeric(number, errors='coerce')
+    df['currency'] = map_distinct(price.str.extract(CURRENCY_PATTERN, flags=re.IGNORECASE, expand=False), CURRENCIES)
+    df['price_unit'] = map_distinct(df['price_for'].astype(object).str.strip(), PRICE_UNITS)
+    return df
+
+
+def map_distinct(series: pd.Series, mapping: dict):
+    """
+    Map the lower-cased values of a column with few distinct values (postfixes, currency signs).
+    Only the distinct values are normalized, the result is gathered by their codes.
+
+    :return: An object array of the mapped values, None for missing and unknown ones.
+    """
+    import numpy as np
+    import pandas as pd
+
+    codes, distinct = pd.factorize(series)
+    # pandas 3 infers the 'str' dtype for the mapped strings, where None is stored as NaN
+    mapped = pd.Series(distinct, dtype=object).str.lower().map(mapping).astype(object)
+    # The code of missing values is -1, i.e. the appended None
+    return np.append(mapped.where(mapped.notna(), None).to_numpy(object), None)[codes]
+
+
+def normalize_prices(objects):
+    """
+    Add the typed price columns (see add_price_columns) to a page of parsed objects.
+
+    :param objects: A list of dictionaries with the 'price' and 'price_for' keys, changed in place.
+    :return: The same list.
+    """
+    if not objects:
+        return objects
+    import pandas as pd
+
+    df = add_price_columns(pd.DataFrame({
+        'price': [obj.get('price') for obj in objects],
+        'price_for': [obj.get('price_for') for obj in objects],
+    }))
+    # Missing values are NaN (the columns of strings too, under pandas 3), they become None, so that they are saved as NULLs
+    columns = [df[col].astype(object).where(df[col].notna(), None).tolist() for col in PRICE_COLUMNS]
+    for obj, *values in zip(objects, *columns):
+        obj.update(zip(PRICE_COLUMNS, values))
+    return objects
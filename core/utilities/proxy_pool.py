@@ -0,0 +1,157 @@
+import threading
+import time
+
+from core.settings import PROXIES, PROXY_COOLDOWN, PROXY_MIN_SCORE
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# Weight of the latest result in the health score of a proxy
+SCORE_SMOOTHING = 0.2
+# Health score of a proxy that comes back after a cooldown
+PROBATION_SCORE = 0.5
+
+
+class ProxyState:
+    """Health of a single proxy."""
+
+    def __init__(self, url):
+        self.url = url
+        self.score = 1.0
+        self.latency = None
+        self.cooldown_until = 0.0
+        self.sessions = 0
+        self.successes = 0
+        self.failures = 0
+        self.blocks = 0
+
+    def is_available(self, now):
+        return self.cooldown_until <= now
+
+    def rank(self):
+        # Healthy, fast and less loaded proxies go first
+        return self.score / ((self.latency or 1.0) * (1 + self.sessions))
+
+
+class ProxyPool:
+    """
+    A pool of proxies shared by the browsers and the downloader.
+
+    Every proxy has a health score (a moving average of its successes) and a moving average of its latency.
+    A proxy that gets a 429 or a 'too-many-requests' page is put on a cooldown, and so is a proxy
+    whose score drops below `min_score`; after the cooldown it gets another chance with a lower score.
+    Sessions (a driver, the images of a record) stick to their proxy while it is available,
+    otherwise they are moved to the best available one.
+    The pool is thread-safe, so it can be shared between browser threads and the downloader's event loop.
+    Without any proxies the pool is disabled and everything goes out directly.
+    """
+
+    def __init__(self, proxies=PROXIES, cooldown=PROXY_COOLDOWN, min_score=PROXY_MIN_SCORE):
+        """
+        :param proxies: Proxy URLs, e.g. 'http://host:port'.
+        :param cooldown: Seconds a blocked or unhealthy proxy is not used.
+        :param min_score: Health score below which a proxy is put on a cooldown.
+        """
+        self.states = {url: ProxyState(url) for url in proxies}
+        self.cooldown = cooldown
+        self.min_score = min_score
+        self.assignments = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.states)
+
+    def acquire(self, session_id=None):
+        """
+        Return the proxy of a session, or the best available one.
+
+        :param session_id: ID of a session that should stick to its proxy (None for a one-off request).
+        :return: A proxy URL, or None if all the proxies are on a cooldown (or there are none).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if session_id is not None and session_id in self.assignments:
+                state = self.states[self.assignments[session_id]]
+                if state.is_available(now):
+                    return state.url
+                self._unassign(session_id)
+
+            available = [state for state in self.states.values() if state.is_available(now)]
+            if not available:
+                return None
+            state = max(available, key=ProxyState.rank)
+            if session_id is not None:
+                self.assignments[session_id] = state.url
+                state.sessions += 1
+            return state.url
+
+    def release(self, session_id):
+        """End a session."""
+        with self._lock:
+            self._unassign(session_id)
+
+    def _unassign(self, session_id):
+        url = self.assignments.pop(session_id, None)
+        if url is not None:
+            self.states[url].sessions -= 1
+
+    def report_success(self, url, latency=None):
+        with self._lock:
+            state = self.states[url]
+            state.successes += 1
+            state.score += SCORE_SMOOTHING * (1.0 - state.score)
+            if latency is not None:
+                state.latency = latency if state.latency is None else state.latency + SCORE_SMOOTHING * (latency - state.latency)
+
+    def report_failure(self, url):
+        """Report a connection error or a timeout."""
+        with self._lock:
+            state = self.states[url]
+            state.failures += 1
+            state.score -= SCORE_SMOOTHING * state.score
+            if state.score < self.min_score and state.is_available(time.monotonic()):
+                logger.warning("Proxy %s is unhealthy. Pausing it for %ss.", url, self.cooldown)
+                self._cool_down(state, self.cooldown)
+
+    def report_blocked(self, url, retry_after=None):
+        """Report a 429 or a 'too-many-requests' response: the proxy is paused and its sessions move on."""
+        with self._lock:
+            state = self.states[url]
+            state.blocks += 1
+            cooldown = max(retry_after or 0, self.cooldown)
+            logger.warning("Proxy %s is rate limited. Pausing it for %ss.", url, cooldown)
+            self._cool_down(state, cooldown)
+
+    def _cool_down(self, state, seconds):
+        state.cooldown_until = time.monotonic() + seconds
+        state.score = PROBATION_SCORE
+        for session_id in [session_id for session_id, url in self.assignments.items() if url == state.url]:
+            self._unassign(session_id)
+
+    def next_available_in(self):
+        """Seconds until a proxy comes back from its cooldown (0 if one is available now)."""
+        with self._lock:
+            if not self.states:
+                return 0
+            now = time.monotonic()
+            return max(0.0, min(state.cooldown_until for state in self.states.values()) - now)
+
+    def get_stats(self):
+        """Health of every proxy."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                url: {
+                    'score': round(state.score, 3),
+                    'latency': state.latency,
+                    'available': state.is_available(now),
+                    'sessions': state.sessions,
+                    'successes': state.successes,
+                    'failures': state.failures,
+                    'blocks': state.blocks,
+                }
+                for url, state in self.states.items()
+            }
@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from core.exceptions import CacheMissException
+from core.settings import RESPONSE_CACHE_MODE, RESPONSE_CACHE_DIR, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+CACHE_MODES = ('off', 'record', 'replay')
+
+# Query parameters that don't change the content of a page
+IGNORED_PARAMS = ('lastStamp',)
+
+
+def get_cache_key(url):
+    """A key of the URL without `lastStamp`, independent of the order of the query parameters."""
+    parts = urlsplit(url)
+    params = sorted((name, value) for name, value in parse_qsl(parts.query) if name not in IGNORED_PARAMS)
+    normalized = f"{parts.netloc}{parts.path}?{urlencode(params)}"
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of the JSON bodies of API pages, one gzip file per page.
+
+    Modes:
+        - 'off': the cache is not used;
+        - 'record': fresh cached pages are served and the others are fetched and stored;
+        - 'replay': pages are only served from the cache (regardless of their age), a miss raises CacheMissException.
+
+    The cache is cleaned up with an LRU policy once it grows over `max_bytes`: the access time of a file is
+    updated on every hit and the least recently used files are removed first. The pagination planner doesn't
+    tune page sizes while the cache is enabled, so a replay requests the same pages as the recording.
+    """
+
+    def __init__(
+            self,
+            mode=RESPONSE_CACHE_MODE,
+            directory=RESPONSE_CACHE_DIR,
+            ttl=RESPONSE_CACHE_TTL,
+            max_bytes=RESPONSE_CACHE_MAX_BYTES
+    ):
+        """
+        :param mode: One of 'off', 'record' and 'replay'.
+        :param directory: Directory of the cache files.
+        :param ttl: Seconds after which a recorded page is fetched again (in 'record' mode).
+        :param max_bytes: Size of the cache above which the least recently used pages are removed.
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}. Expected one of {', '.join(CACHE_MODES)}.")
+        self.mode = mode
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def _path(self, url):
+        return os.path.join(self.directory, f"{get_cache_key(url)}.json.gz")
+
+    def get(self, url):
+        """
+        Return the cached JSON data of a URL, or None on a miss.
+
+        :raises CacheMissException: On a miss in 'replay' mode.
+        """
+        if not self.enabled:
+            return None
+
+        path = self._path(url)
+        data = None
+        if os.path.exists(path):
+            stat = os.stat(path)
+            if self.mode == 'replay' or time.time() - stat.st_mtime <= self.ttl:
+                with gzip.open(path, 'rt', encoding='utf-8') as file:
+                    data = json.load(file)
+                # Keep the modification time for the TTL, the access time is used for the LRU eviction
+                os.utime(path, (time.time(), stat.st_mtime))
+
+        if data is None:
+            self.misses += 1
+            if self.mode == 'replay':
+                raise CacheMissException(f"No cached response for {url}.")
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, url, data):
+        """Store the JSON data of a URL (in 'record' mode)."""
+        if self.mode != 'record':
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        size = self.get_size() - (os.path.getsize(path) if os.path.exists(path) else 0)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+        self._size = size + os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json.gz')]
+
+    def get_size(self):
+        """Total size of the cached pages in bytes."""
+        if self._size is None:
+            self._size = sum(entry.stat().st_size for entry in self._files())
+        return self._size
+
+    def evict(self):
+        """Remove the least recently used pages until the cache fits into `max_bytes`."""
+        removed = 0
+        for entry in sorted(self._files(), key=lambda entry: entry.stat().st_atime):
+            if self._size <= self.max_bytes:
+                break
+            self._size -= entry.stat().st_size
+            os.remove(entry.path)
+            removed += 1
+        logger.info("Removed %d least recently used pages from the response cache.", removed)
+
+    def clear(self):
+        """Remove all the cached pages."""
+        for entry in self._files():
+            os.remove(entry.path)
+        self._size = 0
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, UTC
+from email.utils import parsedate_to_datetime
+
+import aiofiles
+
+from core.settings import (
+    DOWNLOAD_MAX_ATTEMPTS, DOWNLOAD_BACKOFF_BASE, DOWNLOAD_BACKOFF_MAX, RETRY_STATUSES, PERMANENT_FAILURE_STATUSES,
+    CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN, DEAD_LETTER_FILE
+)
+from core.utilities.log import get_logger, SampledLogger
+
+
+logger = get_logger(__name__)
+# Failed downloads can come in thousands when a host is down
+dead_letter_logger = SampledLogger(logger)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that honors the server's Retry-After header."""
+
+    def __init__(
+            self,
+            max_attempts=DOWNLOAD_MAX_ATTEMPTS,
+            base_delay=DOWNLOAD_BACKOFF_BASE,
+            max_delay=DOWNLOAD_BACKOFF_MAX,
+            retry_statuses=RETRY_STATUSES,
+            permanent_statuses=PERMANENT_FAILURE_STATUSES
+    ):
+        """
+        :param max_attempts: Total number of attempts per URL (the first one included).
+        :param base_delay: Delay in seconds before the first retry (before jitter).
+        :param max_delay: Upper bound for a single delay in seconds.
+        :param retry_statuses: HTTP status codes that are worth retrying.
+        :param permanent_statuses: HTTP status codes that won't change on a replay either.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+        self.permanent_statuses = set(permanent_statuses)
+
+    def is_retryable(self, status):
+        return status in self.retry_statuses
+
+    def is_permanent(self, status):
+        return status in self.permanent_statuses
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        Calculate the delay before the next attempt.
+
+        :param attempt: Number of the attempt that has just failed (starting from 1).
+        :param retry_after: Delay in seconds requested by the server, if any.
+        :return: Delay in seconds.
+        """
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            # The server knows better: never retry earlier than it asked to
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        Parse a Retry-After header value given either in seconds or as an HTTP-date.
+
+        :return: Delay in seconds or None if the header is missing or malformed.
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=UTC)
+        return max(0.0, (retry_at - datetime.now(UTC)).total_seconds())
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    After `failure_threshold` consecutive 429/5xx responses (or connection errors) from a host
+    the circuit opens and every new request to that host waits until the cooldown expires.
+    The first request after the cooldown probes the host: a success closes the circuit,
+    a failure opens it again right away.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_BREAKER_THRESHOLD, cooldown=CIRCUIT_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._open_until = {}
+
+    def is_open(self, host):
+        return self._open_until.get(host, 0) > time.monotonic()
+
+    async def wait_until_closed(self, host):
+        """Pause the caller while the circuit for the host is open."""
+        while self.is_open(host):
+            await asyncio.sleep(self._open_until[host] - time.monotonic())
+
+    def record_success(self, host):
+        self._failures.pop(host, None)
+        self._open_until.pop(host, None)
+
+    def record_failure(self, host, retry_after=None):
+        failures = self._failures.get(host, 0) + 1
+        self._failures[host] = failures
+        if failures >= self.failure_threshold:
+            cooldown = max(self.cooldown, retry_after or 0)
+            self._open_until[host] = time.monotonic() + cooldown
+            # Half-open: a single failure after the cooldown re-opens the circuit
+            self._failures[host] = self.failure_threshold - 1
+            logger.warning("Circuit opened for %s after %d consecutive failures. Pausing for %.0fs.", host, failures, cooldown)
+
+
+class DeadLetterFile:
+    """A JSON Lines file that collects image URLs that could not be downloaded, so they can be replayed later."""
+
+    def __init__(self, path=DEAD_LETTER_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    async def write(self, record, url, counter, reason):
+        entry = {
+            'id': record.get('id', record.get('object_id')),
+            'category': record.get('category'),
+            'user_id': record.get('user_id'),
+            'url': url,
+            'counter': counter,
+            'reason': reason,
+            'failed_at': datetime.now(UTC).isoformat()
+        }
+        async with aiofiles.open(self.path, 'a') as f:
+            await f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        dead_letter_logger.warning("Added %s to the dead-letter file: %s", url, reason)
+
+    @asynccontextmanager
+    async def replay(self):
+        """
+        Take all the entries out of the file for a replay.
+
+        The entries are kept in a `.replaying` file until the replay has finished without errors,
+        so an interrupted replay loses nothing: its leftover file is merged into the next replay.
+        Entries that fail again during the replay are written back to the file by the downloader.
+
+        :return: An async context manager that yields the list of entries.
+        """
+        replay_path = f"{self.path}.replaying"
+        if os.path.exists(self.path):
+            async with aiofiles.open(self.path, 'r') as f:
+                new_lines = await f.readlines()
+            async with aiofiles.open(replay_path, 'a') as f:
+                await f.writelines(new_lines)
+            os.remove(self.path)
+        lines = []
+        if os.path.exists(replay_path):
+            async with aiofiles.open(replay_path, 'r') as f:
+                lines = await f.readlines()
+
+        # An interrupted replay may have written some of its entries back already: keep the latest one per URL
+        entries = {}
+        for line in lines:
+            if line.strip():
+                entry = json.loads(line)
+                entries[(entry['id'], entry['counter'], entry['url'])] = entry
+        yield list(entries.values())
+        if os.path.exists(replay_path):
+            os.remove(replay_path)
@@ -0,0 +1,78 @@
+from faker import Faker
+
+from core.settings import FAKER_LOCALE
+
+
+# Column lengths of the 'users' table (see DB_SCHEMA)
+MAX_USERNAME_LENGTH = 32
+MAX_PHONE_NUMBER_LENGTH = 32
+MAX_EMAIL_LENGTH = 64
+MAX_NAME_LENGTH = 255
+MAX_ADDRESS_LENGTH = 255
+
+MAX_PHONE_NUMBER_ATTEMPTS = 100
+
+
+class MockUserFactory:
+    """
+    Generates batches of unique mock users with one reusable Faker instance.
+
+    Usernames and phone numbers are guaranteed to be unique in memory, both within the generated users
+    and against the ones already stored in the database, so inserting them never hits a conflict.
+    With the same seed and the same existing users the factory produces the same users.
+    """
+
+    def __init__(self, seed=None, locale=FAKER_LOCALE, existing_usernames=(), existing_phone_numbers=()):
+        """
+        :param seed: Seed for reproducible output (None for random users).
+        :param locale: Faker locale (e.g. 'en_US', 'ru_RU').
+        :param existing_usernames: Usernames that are already taken.
+        :param existing_phone_numbers: Phone numbers that are already taken.
+        """
+        self.faker = Faker(locale)
+        if seed is not None:
+            self.faker.seed_instance(seed)
+        self.usernames = set(existing_usernames)
+        self.phone_numbers = set(existing_phone_numbers)
+
+    def _unique_username(self):
+        username = self.faker.user_name()[:MAX_USERNAME_LENGTH]
+        suffix = 1
+        candidate = username
+        while candidate in self.usernames:
+            suffix += 1
+            candidate = f"{username[:MAX_USERNAME_LENGTH - len(str(suffix))]}{suffix}"
+        self.usernames.add(candidate)
+        return candidate
+
+    def _unique_phone_number(self):
+        for _ in range(MAX_PHONE_NUMBER_ATTEMPTS):
+            phone_number = self.faker.phone_number()[:MAX_PHONE_NUMBER_LENGTH]
+            if phone_number not in self.phone_numbers:
+                self.phone_numbers.add(phone_number)
+                return phone_number
+        raise ValueError(f"Couldn't generate a unique phone number in {MAX_PHONE_NUMBER_ATTEMPTS} attempts.")
+
+    def generate_one(self):
+        """Generate a single unique user."""
+        faker = self.faker
+        gender = faker.random_element(["M", "F"])
+        first_name = faker.first_name_male() if gender == "M" else faker.first_name_female()
+        return {
+            "username": self._unique_username(),
+            "phone_number": self._unique_phone_number(),
+            "email": faker.email()[:MAX_EMAIL_LENGTH],
+            "first_name": first_name[:MAX_NAME_LENGTH],
+            "last_name": faker.last_name()[:MAX_NAME_LENGTH],
+            "address": faker.address()[:MAX_ADDRESS_LENGTH],
+            "gender": gender,
+        }
+
+    def generate(self, count):
+        """
+        Generate a batch of unique users.
+
+        :param count: Number of users to generate.
+        :return: A list of dictionaries with user data.
+        """
+        return [self.generate_one() for _ in range(count)]
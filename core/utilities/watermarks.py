@@ -0,0 +1,38 @@
+import json
+import os
+
+from core.settings import WATERMARK_FILE
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class FileWatermarkStore:
+    """
+    Keeps the crawl watermarks (the newest object ID seen per category) in a JSON file,
+    for runs that don't use the database (e.g. the initial dataset collection into CSV files).
+    """
+
+    def __init__(self, path=WATERMARK_FILE):
+        self.path = path
+
+    def get_watermarks(self):
+        """Return a dictionary of the newest object ID per category name."""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as file:
+            return json.load(file)
+
+    def save_watermarks(self, watermarks):
+        """Move the watermarks forward. A watermark never goes back."""
+        if not watermarks:
+            return
+        merged = self.get_watermarks()
+        for category_name, newest_id in watermarks.items():
+            merged[category_name] = max(merged.get(category_name, newest_id), newest_id)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as file:
+            json.dump(merged, file, indent=2)
+        logger.info("Saved crawl watermarks for %s.", ', '.join(watermarks))
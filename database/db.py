@@ -1,8 +1,108 @@
+import hashlib
+import json
+from decimal import Decimal
+
 import psycopg2
 from psycopg2 import sql
 from psycopg2.extras import execute_values, execute_batch
 
-from core.settings import DB_SCHEMA, DB_USER, DB_PASSWORD, DB_HOST
+from core.settings import DB_SCHEMA, DB_USER, DB_PASSWORD, DB_HOST, DB_CREATE_INDEXES_CONCURRENTLY, DB_CURSOR_PREFETCH
+from core.utilities.metrics import REGISTRY, timed
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+UPSERTED_ROWS = REGISTRY.counter('db_upserted_rows_total', "Rows passed to upserts, by table and result.")
+
+# Columns that are not a part of an object's content
+NOT_HASHED_COLUMNS = ('id', 'user_id', 'content_hash', 'last_updated')
+
+
+def get_hashed_columns(table_schema):
+    """The content columns of a table with a 'content_hash' column, in a stable order."""
+    return sorted(col for col in table_schema['columns'] if col not in NOT_HASHED_COLUMNS)
+
+
+def get_conflict_target(table_schema):
+    """The columns of the ON CONFLICT clause of the upserts (the primary key of partitioned tables includes the partition key)."""
+    return ", ".join(table_schema.get('conflict_target', ['id']))
+
+
+def get_index_definition(table_name, index):
+    """
+    Unpack an index of a table schema: (columns, name, method, predicate), only the columns are required.
+
+    :return: The index name and the part of CREATE INDEX that follows "ON <table>", e.g. "USING brin (last_updated)".
+    """
+    columns, index_name, method, predicate = (*index, None, None, None)[:4]
+    index_name = index_name or f"idx_{table_name}_{'_'.join(col.strip() for col in columns.split(','))}"
+    definition = f"USING {method or 'btree'} ({columns})"
+    if predicate:
+        definition += f" WHERE {predicate}"
+    return index_name, definition
+
+
+def get_content_hash(row, columns):
+    """
+    A hash of the content columns of a row, the same for the same content in 'unique_records' and 'objects'.
+
+    :param row: A dictionary of the row's values.
+    :param columns: The content columns (see get_hashed_columns).
+    """
+    # NUMERIC columns are read back as Decimals, they are hashed like the floats they were saved from
+    content = json.dumps(
+        [row.get(col) for col in columns], ensure_ascii=False,
+        default=lambda value: float(value) if isinstance(value, Decimal) else str(value)
+    )
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def get_existing_rows(cursor, table_name, key_columns, keys, compared_columns=()):
+    """
+    Select the rows of a batch that are already in a table, before the batch is upserted in the same transaction.
+    (The `xmax` system column can't tell inserted rows from updated ones here: it can't be read from partitioned tables.)
+
+    :param key_columns: The columns of the conflict target.
+    :param keys: Tuples of the key values of the rows of the batch.
+    :param compared_columns: Columns of the stored rows that the upsert only rewrites when they change.
+    :return: A dictionary of the key tuples of the existing rows and the tuples of their compared columns.
+    """
+    key_names = ", ".join(key_columns)
+    query = f"""
+        SELECT {", ".join([*key_columns, *compared_columns])}
+        FROM {table_name}
+        JOIN (VALUES %s) AS batch ({key_names}) USING ({key_names});
+    """
+    rows = execute_values(cursor, query, keys, fetch=True)
+    return {tuple(row[:len(key_columns)]): tuple(row[len(key_columns):]) for row in rows}
+
+
+def count_upsert_results(table_name, rows, existing):
+    """
+    Count and report the results of an upsert from the rows that existed before it (see get_existing_rows).
+    A new row is inserted, an existing one is unchanged if its compared columns are the same and updated otherwise.
+    Rows written by concurrent transactions in the meantime are counted as if they weren't there.
+
+    :param rows: Tuples of the key and of the compared values of the upserted rows.
+    :param existing: The existing rows returned by get_existing_rows.
+    """
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    for key, compared in rows:
+        if key not in existing:
+            counts['inserted'] += 1
+        elif compared and existing[key] == compared:
+            counts['unchanged'] += 1
+        else:
+            counts['updated'] += 1
+    total = len(rows)
+    for result, count in counts.items():
+        UPSERTED_ROWS.inc(count, table=table_name, result=result)
+    logger.info(
+        "Upserted %d rows into '%s': %d inserted, %d updated, %d unchanged.",
+        total, table_name, counts['inserted'], counts['updated'], counts['unchanged']
+    )
+    return counts
 
 
 class PostgresDB:
@@ -32,14 +132,14 @@ class PostgresDB:
             try:
                 # Try to connect to the desired database
                 conn = psycopg2.connect(dbname=self.db_name, user=self.user, password=self.password, host=self.host)
-                print(f"Connected to the existing database '{self.db_name}'.")
+                logger.info("Connected to the existing database '%s'.", self.db_name)
                 cursor.close()
                 return conn
             except psycopg2.OperationalError:
                 # If the database does not exist, catch the error and create the database
-                print(f"Database '{self.db_name}' does not exist. Creating it...")
+                logger.info("Database '%s' does not exist. Creating it...", self.db_name)
                 cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(self.db_name)))
-                print(f"Database '{self.db_name}' created successfully.")
+                logger.info("Database '%s' created successfully.", self.db_name)
 
                 # Close the cursor and connection of the default database
                 cursor.close()
@@ -47,11 +147,11 @@ class PostgresDB:
 
                 # Reconnect to the newly created database
                 new_conn =  psycopg2.connect(dbname=self.db_name, user=self.user, password=self.password, host=self.host)
-                print(f"Connected to the newly created database '{self.db_name}'.")
+                logger.info("Connected to the newly created database '%s'.", self.db_name)
                 return new_conn
 
         except Exception as e:
-            print(f"Error connecting to the default database: {e}")
+            logger.error("Error connecting to the default database: %s", e)
             if cursor:
                 cursor.close()
             if conn:
@@ -68,6 +168,10 @@ class PostgresDB:
                 - foreign_keys (list): A list of foreign key constraints, each containing three elements:
                     column name, referenced table name, and referenced column name.
                 - unique_constraints (list): A list of unique constraint columns.
+                - primary_key (list): Columns of a composite primary key (optional).
+                - partition_by (tuple): The partitioning method and key, e.g. ('LIST', 'category') (optional).
+                - partitions (dict): Partitions of a LIST-partitioned table: a name suffix mapped to the list of values.
+                    Rows with other values go to the '<table>_default' partition.
 
         Returns:
             None
@@ -81,7 +185,9 @@ class PostgresDB:
             unique_constraints = table_schema.get('unique_constraints', [])
 
             if self.__check_table_exists(table_name):
-                print(f"Table '{table_name}' already exists. Skipping...")
+                logger.debug("Table '%s' already exists. Skipping...", table_name)
+                self.__add_missing_columns(table_name, columns)
+                self.__upgrade_table(table_schema)
                 return
 
             # Define columns and their types
@@ -104,6 +210,12 @@ class PostgresDB:
             else:
                 unique_constraints_clause = ""
 
+            primary_key = table_schema.get('primary_key')
+            primary_key_clause = f", PRIMARY KEY ({', '.join(primary_key)})" if primary_key else ""
+
+            partition_by = table_schema.get('partition_by')
+            partition_clause = f"PARTITION BY {partition_by[0]} ({partition_by[1]})" if partition_by else ""
+
             # # Define other constraints (if any)
             # if other_constraints:
             #     other_constraints_clause = f", {', '.join(other_constraints)}"
@@ -114,34 +226,116 @@ class PostgresDB:
             create_query = f"""
             CREATE TABLE IF NOT EXISTS {table_name} (
                 {columns}
+                {primary_key_clause}
                 {foreign_keys_clause}
                 {unique_constraints_clause}
-            );
+            ) {partition_clause};
             """
 
             # Execute the query to create the table
             with self.conn as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(create_query)
-                    print(f"Table '{table_name}' created successfully (if not existed).")
+                    logger.info("Table '%s' created successfully (if not existed).", table_name)
+            if partition_by:
+                self.__create_partitions(table_schema)
         except psycopg2.Error as e:
-            print(f"Error during table creation: {e}")
+            logger.error("Error during table creation: %s", e)
         except Exception as e:
-            print(f"{type(e).__name__} occurred during table creation: {e}")
+            logger.error("%s occurred during table creation: %s", type(e).__name__, e)
 
 
 
-    def create_indexes(self, table_schema):
+    def __add_missing_columns(self, table_name, columns):
+        """Add the columns that were added to the schema after the table had been created."""
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s;", (table_name,))
+                existing_columns = {row[0] for row in cursor.fetchall()}
+                for col_name, col_type in columns.items():
+                    # Unquoted identifiers are stored in lower case
+                    if col_name.lower() not in existing_columns:
+                        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {col_name} {col_type};")
+                        logger.info("Column '%s' added to table '%s'.", col_name, table_name)
+
+
+    def __create_partitions(self, table_schema):
+        """Create the partitions of a LIST-partitioned table that don't exist yet, and its default partition."""
+        table_name = table_schema['table_name']
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                existing_partitions = set(self.__get_partitions(cursor, table_name))
+                for suffix, values in table_schema.get('partitions', {}).items():
+                    if suffix in existing_partitions:
+                        continue
+                    # Fails if the default partition already holds rows with these values: move them out first
+                    cursor.execute(
+                        f"CREATE TABLE {table_name}_{suffix} PARTITION OF {table_name} FOR VALUES IN %s;",
+                        (tuple(values),)
+                    )
+                    logger.info("Partition '%s_%s' created for table '%s'.", table_name, suffix, table_name)
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name}_default PARTITION OF {table_name} DEFAULT;")
+
+
+    def __upgrade_table(self, table_schema):
+        """Bring a table created by an older schema in line with the conflict target and partitions of the current one."""
+        table_name = table_schema['table_name']
+        if not table_schema.get('partition_by'):
+            return
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT EXISTS (SELECT FROM pg_partitioned_table WHERE partrelid = %s::regclass);", (table_name,))
+                is_partitioned = cursor.fetchone()[0]
+                if not is_partitioned:
+                    # Converting a table into a partitioned one means copying all its rows, that's left to a migration.
+                    # The upserts only need a unique index matching their conflict target.
+                    logger.warning("Table '%s' is not partitioned. Recreate it to partition it by %s.", table_name, table_schema['partition_by'][1])
+                    cursor.execute(
+                        f"CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_conflict_target_key "
+                        f"ON {table_name} ({get_conflict_target(table_schema)});"
+                    )
+        if is_partitioned:
+            self.__create_partitions(table_schema)
+
+
+    @staticmethod
+    def __get_partitions(cursor, table_name):
+        """The partitions of a table by their name suffix (the partition name without '<table>_')."""
+        cursor.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            WHERE parent.relname = %s;
+        """, (table_name,))
+        return {row[0][len(table_name) + 1:]: row[0] for row in cursor.fetchall()}
+
+
+    @staticmethod
+    def __get_index_state(cursor, index_name):
+        """True if the index is valid, False if it is invalid (e.g. left by a failed concurrent build), None if it doesn't exist."""
+        cursor.execute("""
+            SELECT pg_index.indisvalid FROM pg_class
+            JOIN pg_index ON pg_index.indexrelid = pg_class.oid
+            WHERE pg_class.relname = %s;
+        """, (index_name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
+    def create_indexes(self, table_schema, concurrently=DB_CREATE_INDEXES_CONCURRENTLY):
         """
         Creates indexes for the specified table.
 
         Args:
             table_schema (dict): A dictionary representing the table schema, with keys:
                 - table_name (str): The name of the table.
-                - indexes (list): A list of index definitions, where each index is a list of two or three elements:
-                    - Column name
-                    - Index name (optional)
-                    - Index type (optional)
+                - indexes (list): A list of index definitions, where each index is a tuple of one to four elements:
+                    - Column name, or comma-separated column names of a composite index
+                    - Index name (optional, 'idx_<table>_<columns>' by default)
+                    - Index method (optional): 'btree' (default), 'hash', 'brin', 'gin', 'gist'
+                    - Predicate of a partial index (optional), e.g. "status = 'pending'"
+            concurrently (bool): Build the indexes with CREATE INDEX CONCURRENTLY, so the writes to a live table
+                are not blocked while they are built.
 
         Returns:
             None
@@ -151,25 +345,64 @@ class PostgresDB:
             table_name = table_schema['table_name']
             indexes = table_schema.get('indexes', [])
             if not indexes:
-                print("No indexes provided.")
+                logger.info("No indexes provided.")
                 return
-            with self.conn as conn:
-                with conn.cursor() as cursor:
-                    for index in indexes:
-                        # If index name is not provided, generate a default name
-                        if len(index) == 1:
-                            index_name = f"idx_{index[0]}"
-                        else:
-                            index_name = index[1]
-
-                        index_query = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({index[0]});"
-                        cursor.execute(index_query)
-                        print(f"Index '{index_name}' created for column '{index[0]}' in table '{table_name}'.")
+            if not concurrently:
+                # The indexes are created in a single transaction
+                with self.conn as conn, conn.cursor() as cursor:
+                    self.__create_table_indexes(cursor, table_name, indexes, concurrently)
+                return
+
+            # CREATE INDEX CONCURRENTLY can't run inside a transaction block, and `with conn` would open one
+            # even in autocommit mode, so the statements run on a plain cursor
+            autocommit = self.conn.autocommit
+            self.conn.autocommit = True
+            try:
+                with self.conn.cursor() as cursor:
+                    self.__create_table_indexes(cursor, table_name, indexes, concurrently)
+            finally:
+                self.conn.autocommit = autocommit
         except psycopg2.Error as e:
-            print(f"Error during index creation: {e}")
+            logger.error("Error during index creation: %s", e)
 
         except Exception as e:
-            print(f"{type(e).__name__} occurred during index creation: {e}")
+            logger.error("%s occurred during index creation: %s", type(e).__name__, e)
+
+
+    def __create_table_indexes(self, cursor, table_name, indexes, concurrently):
+        partitions = self.__get_partitions(cursor, table_name) if concurrently else {}
+        for index in indexes:
+            index_name, definition = get_index_definition(table_name, index)
+            if self.__get_index_state(cursor, index_name):
+                logger.debug("Index '%s' already exists. Skipping...", index_name)
+                continue
+            if not concurrently:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} {definition};")
+            elif partitions:
+                self.__create_partitioned_index_concurrently(cursor, table_name, partitions, index_name, definition)
+            else:
+                self.__create_index_concurrently(cursor, index_name, f"{table_name} {definition}")
+            logger.info("Index '%s' created in table '%s': %s.", index_name, table_name, definition)
+
+
+    def __create_index_concurrently(self, cursor, index_name, target):
+        """:param target: The part of CREATE INDEX that follows "ON", e.g. "objects USING brin (last_updated)"."""
+        if self.__get_index_state(cursor, index_name) is False:
+            # An interrupted concurrent build leaves an invalid index behind, IF NOT EXISTS would keep it
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name};")
+        cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {target};")
+
+
+    def __create_partitioned_index_concurrently(self, cursor, table_name, partitions, index_name, definition):
+        """
+        A partitioned table can't be indexed concurrently. Instead, an (invalid) index is created on the parent table alone,
+        the index of every partition is built concurrently and attached to it, and once all of them are attached it becomes valid.
+        """
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON ONLY {table_name} {definition};")
+        for suffix, partition in partitions.items():
+            partition_index_name = f"{index_name}_{suffix}"
+            self.__create_index_concurrently(cursor, partition_index_name, f"{partition} {definition}")
+            cursor.execute(f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index_name};")
 
 
     def __check_table_exists(self, table_name):
@@ -184,22 +417,25 @@ class PostgresDB:
                     cursor.execute(f"SELECT EXISTS (SELECT FROM pg_tables WHERE tablename = '{table_name}');")
                     return cursor.fetchone()[0]
         except psycopg2.Error as e:
-            print(f"Error during table existence check: {e}")
+            logger.error("Error during table existence check: %s", e)
 
         except Exception as e:
-            print(f"{type(e).__name__} occurred during table existence check: {e}")
+            logger.error("%s occurred during table existence check: %s", type(e).__name__, e)
         return False
 
 
 
+    @timed('db_write')
     def save_to_db(self, table_name, data):
         """
         Inserts or updates data in the specified table.
+        Tables with a 'content_hash' column are only updated when the content of a row has changed.
         :param table_name: Name of the table.
         :param data: List of dictionaries representing rows to be inserted/updated.
+        :return: Numbers of 'inserted', 'updated' and 'unchanged' rows (None on errors).
         """
         if not data:
-            print("No data to save.")
+            logger.info("No data to save.")
             return
 
         try:
@@ -210,27 +446,54 @@ class PostgresDB:
                 raise ValueError(f"Table '{table_name}' does not exist.")
 
             # Extract columns and values from the first row of data
-            columns = data[0].keys()
+            columns = list(data[0].keys())
             values = [[row[col] for col in columns] for row in data]
 
+            table_schema = next(schema for schema in self.db_schema.values() if schema['table_name'] == table_name)
+            conflict_columns = table_schema.get('conflict_target', ['id'])
+            update_columns = [f"{col} = EXCLUDED.{col}" for col in columns if col not in conflict_columns]
+            where_clause = ""
+            compared_columns = []
+            if 'content_hash' in table_schema['columns'] and 'content_hash' not in columns:
+                # Re-crawled rows with the same content are left alone instead of being rewritten
+                hashed_columns = get_hashed_columns(table_schema)
+                columns.append('content_hash')
+                for row, row_values in zip(data, values):
+                    row_values.append(get_content_hash(row, hashed_columns))
+                update_columns.append("content_hash = EXCLUDED.content_hash")
+                where_clause = f"WHERE {table_name}.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+                compared_columns.append('content_hash')
+            if 'last_updated' in table_schema['columns'] and 'last_updated' not in columns:
+                update_columns.append("last_updated = CURRENT_TIMESTAMP")
+
             insert_query = f"""
                                 INSERT INTO {table_name} ({', '.join(columns)})
                                 VALUES %s
-                                ON CONFLICT (id) DO UPDATE SET
-                                {', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col != 'id'])};
+                                ON CONFLICT ({get_conflict_target(table_schema)}) DO UPDATE SET
+                                {', '.join(update_columns)}
+                                {where_clause};
                             """
+            key_indexes = [columns.index(col) for col in conflict_columns]
+            compared_indexes = [columns.index(col) for col in compared_columns]
+            rows = [
+                (tuple(row[i] for i in key_indexes), tuple(row[i] for i in compared_indexes))
+                for row in values
+            ]
 
             with self.conn as conn:
                 with conn.cursor() as cursor:
+                    existing = get_existing_rows(
+                        cursor, table_name, conflict_columns, [key for key, _ in rows], compared_columns
+                    )
                     execute_values(cursor, insert_query, values)
-                    print(f"Inserted/Updated {len(data)} rows into '{table_name}'.")
+            return count_upsert_results(table_name, rows, existing)
         except psycopg2.Error as e:
-            print(f"Database error during data insertion: {e}")
+            logger.error("Database error during data insertion: %s", e)
         except ValueError as e:
-            print(f"Value error during data insertion: {e}")
+            logger.error("Value error during data insertion: %s", e)
 
         except Exception as e:
-            print(f"{type(e).__name__} occurred during insertion: {e}")
+            logger.error("%s occurred during insertion: %s", type(e).__name__, e)
 
 
     def read_from_db(self, table_name, columns=None):
@@ -256,18 +519,19 @@ class PostgresDB:
                     cursor.execute(query)
                     rows = cursor.fetchall()
                     if not rows:
-                        print(f"No records found in table '{table_name}'.")
+                        logger.info("No records found in table '%s'.", table_name)
                     return rows
         except psycopg2.Error as e:
-            print(f"Error during data read: {e}")
+            logger.error("Error during data read: %s", e)
         except ValueError as e:
-            print(f"Error during data read: {e}")
+            logger.error("Error during data read: %s", e)
         except Exception as e:
-            print(f"{type(e).__name__} occurred during read: {e}")
+            logger.error("%s occurred during read: %s", type(e).__name__, e)
 
 
 class DailyParserDB(PostgresDB):
 
+    @timed('db_read')
     def get_existing_object_ids(self, table_name, category_name):
         """Fetch all existing object IDs for a given category."""
         with self.conn as conn:
@@ -275,6 +539,48 @@ class DailyParserDB(PostgresDB):
                 cursor.execute(f"SELECT id FROM {table_name} WHERE category = %s;", (category_name,))
                 return {row[0] for row in cursor.fetchall()}
 
+    def count_unique_records_by_category(self):
+        """Return the number of objects in 'unique_records' for each category."""
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT category, COUNT(*) FROM unique_records GROUP BY category;")
+                return dict(cursor.fetchall())
+
+    def get_watermarks(self):
+        """Return a dictionary of the newest object ID per category name."""
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT category, newest_id FROM crawl_watermarks;")
+                return dict(cursor.fetchall())
+
+    def save_watermarks(self, watermarks):
+        """Move the crawl watermarks forward. A watermark never goes back."""
+        if not watermarks:
+            return
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                execute_values(cursor, """
+                    INSERT INTO crawl_watermarks (category, newest_id)
+                    VALUES %s
+                    ON CONFLICT (category) DO UPDATE SET
+                        newest_id = GREATEST(crawl_watermarks.newest_id, EXCLUDED.newest_id),
+                        last_updated = CURRENT_TIMESTAMP;
+                """, list(watermarks.items()))
+        logger.info("Saved crawl watermarks for %s.", ', '.join(watermarks))
+
+    @timed('db_read')
+    def get_known_object_ids(self, object_ids, table_names=('objects', 'unique_records')):
+        """Return the IDs from `object_ids` that are already stored in any of the tables."""
+        if not object_ids:
+            return set()
+        known_ids = set()
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                for table_name in table_names:
+                    cursor.execute(f"SELECT id FROM {table_name} WHERE id = ANY(%s);", (list(object_ids),))
+                    known_ids.update(row[0] for row in cursor.fetchall())
+        return known_ids
+
     def remove_assigned_objects_from_unique_records(self, assigned_object_ids, table_name='unique_records'):
         """Batch removal of assigned objects from unique_records."""
         if not assigned_object_ids:
@@ -285,7 +591,7 @@ class DailyParserDB(PostgresDB):
                     DELETE FROM {table_name}
                     WHERE id = ANY(%s);
                 """, (list(assigned_object_ids),))
-            print(f"Removed {len(assigned_object_ids)} objects from '{table_name}'.")
+            logger.info("Removed %s objects from '%s'.", len(assigned_object_ids), table_name)
 
 
     def filter_out_unique_objects_by_category(self, category_name):
@@ -310,32 +616,133 @@ class DailyParserDB(PostgresDB):
 
                     # Ensure that rows are properly fetched
                     if not rows:
-                        print(f"No records found in table '{table_name}' for category '{category_name}'.")
+                        logger.info("No records found in table '%s' for category '%s'.", table_name, category_name)
 
                     # Map rows into a list of dictionaries
                     unique_objects = [dict(zip(columns, row)) for row in rows]
-                    print(f"Fetched {len(unique_objects)} unique objects from the database.")
+                    logger.info("Fetched %s unique objects from the database.", len(unique_objects))
                     return unique_objects
 
         except ValueError as e:
-            print(e)
+            logger.error("%s", e)
         except psycopg2.DatabaseError as e:
-            print(f"Error during data read: {e}")
+            logger.error("Error during data read: %s", e)
         except Exception as e:
-            print(f"Error fetching unique objects: {e}")
+            logger.error("Error fetching unique objects: %s", e)
             return []
 
 
+    @timed('db_write')
+    def claim_unique_objects(self, category_name, limit, user_id=None):
+        """
+        Atomically claim up to `limit` objects of a category from 'unique_records' and move them into 'objects'.
+
+        Rows are locked with FOR UPDATE SKIP LOCKED, so concurrent workers never claim the same objects
+        and never wait for each other, and the cost of a claim doesn't depend on the size of the inventory.
+        The claimed objects are assigned to `user_id` (NULL until the user is saved).
+
+        :param category_name: The category of the objects.
+        :param limit: Maximum number of objects to claim.
+        :param user_id: ID of the user to assign the objects to (optional).
+        :return: A list of the claimed objects (dictionaries), empty if there are none left.
+        """
+        columns = [col for col in self.db_schema['unique_records']['columns'] if col != 'last_updated']
+        column_names = ", ".join(columns)
+        objects_schema = self.db_schema['objects']
+        conflict_columns = objects_schema.get('conflict_target', ['id'])
+        update_clause = ", ".join(f"{col} = EXCLUDED.{col}" for col in columns if col not in conflict_columns)
+
+        # The category condition is repeated in the DELETE, so that only its partition is scanned
+        query = f"""
+            WITH claimed AS (
+                SELECT id FROM unique_records
+                WHERE category = %(category)s
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            ), moved AS (
+                DELETE FROM unique_records
+                USING claimed
+                WHERE unique_records.category = %(category)s AND unique_records.id = claimed.id
+                RETURNING {", ".join(f"unique_records.{col}" for col in columns)}
+            )
+            INSERT INTO objects ({column_names}, user_id)
+            SELECT {column_names}, %(user_id)s FROM moved
+            ON CONFLICT ({get_conflict_target(objects_schema)}) DO UPDATE SET
+                {update_clause},
+                user_id = EXCLUDED.user_id
+            RETURNING {column_names};
+        """
+        try:
+            with self.conn as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, {'category': category_name, 'limit': limit, 'user_id': user_id})
+                    claimed_objects = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            logger.info("Claimed %s objects of category '%s' from 'unique_records'.", len(claimed_objects), category_name)
+            return claimed_objects
+        except psycopg2.Error as e:
+            logger.error("Error during claiming objects: %s", e)
+            return []
+
+    @timed('db_write')
+    def release_claimed_objects(self, claimed_objects):
+        """
+        Move claimed objects that haven't been assigned to a user yet back into 'unique_records',
+        e.g. when the user they were claimed for couldn't be saved.
+        Objects with a user are left alone, so a release never takes objects away from a saved user.
+
+        :param claimed_objects: Objects returned by claim_unique_objects.
+        :return: Number of the released objects.
+        """
+        if not claimed_objects:
+            return 0
+        columns = [col for col in self.db_schema['unique_records']['columns'] if col != 'last_updated']
+        column_names = ", ".join(columns)
+
+        query = f"""
+            WITH released AS (
+                DELETE FROM objects
+                USING unnest(%(ids)s::bigint[], %(categories)s::text[]) AS claimed(id, category)
+                WHERE objects.id = claimed.id AND objects.category = claimed.category AND objects.user_id IS NULL
+                RETURNING {", ".join(f"objects.{col}" for col in columns)}
+            )
+            INSERT INTO unique_records ({column_names})
+            SELECT {column_names} FROM released
+            ON CONFLICT DO NOTHING;
+        """
+        try:
+            with self.conn as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, {
+                        'ids': [obj['id'] for obj in claimed_objects],
+                        'categories': [obj['category'] for obj in claimed_objects],
+                    })
+                    released = cursor.rowcount
+            logger.info("Released %s claimed objects back into 'unique_records'.", released)
+            return released
+        except psycopg2.Error as e:
+            logger.error("Error during releasing claimed objects: %s", e)
+            return 0
+
+    def get_existing_user_keys(self):
+        """Fetch all the usernames and phone numbers that are already taken."""
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT username, phone_number FROM users;")
+                rows = cursor.fetchall()
+        logger.info("Fetched %s existing users.", len(rows))
+        return {row[0] for row in rows}, {row[1] for row in rows}
+
+    @timed('db_write')
     def save_user_and_objects(self, user_data, assigned_objects):
         """Save user and assigned objects, and update the unique records in a single transaction."""
         if not user_data or not assigned_objects:
-            print("No user data or assigned objects provided.")
+            logger.info("No user data or assigned objects provided.")
             return
         try:
             with self.conn as conn:
                 with conn.cursor() as cursor:
                     # Save user data into the 'users' table
-                    print(f"Saving user data into 'users'...")
+                    logger.info("Saving user data into 'users'...")
                     cursor.execute("""
                         INSERT INTO users (username, phone_number, email, first_name, last_name, address, gender)
                         VALUES (%s, %s, %s, %s, %s, %s, %s) 
@@ -351,10 +758,16 @@ class DailyParserDB(PostgresDB):
                         user_data['gender']
                     ))
 
-                    user_id = cursor.fetchone()[0]
+                    row = cursor.fetchone()
+                    if row is None:
+                        # ON CONFLICT DO NOTHING skipped the row: the username or phone number is taken
+                        logger.info("User %s already exists. Skipping...", user_data['username'])
+                        return None
+                    user_id = row[0]
 
                     # Save the assigned objects to the 'objects' table
-                    print(f"Saving {len(assigned_objects)} assigned objects into 'objects'...")
+                    logger.info("Saving %s assigned objects into 'objects'...", len(assigned_objects))
+                    hashed_columns = get_hashed_columns(self.db_schema['objects'])
                     # Prepare the values list for bulk insertion or update
                     values = [
                         (
@@ -363,44 +776,225 @@ class DailyParserDB(PostgresDB):
                             obj['type'], obj['title'],
                             obj['price'],
                             obj['price_for'],
+                            obj.get('price_value'),
+                            obj.get('currency'),
+                            obj.get('price_unit'),
                             obj['location'],
                             obj['photo_URLs'],
                             obj['source_URL'],
+                            get_content_hash(obj, hashed_columns),
                             user_id
                         )
                         for obj in assigned_objects
                     ]
-                    query = """
-                        INSERT INTO objects (id, category, type, title, price, price_for, location, photo_URLs, source_URL, user_id)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (id) DO UPDATE SET
-                            category = EXCLUDED.category,
+                    # Objects claimed by this user are already there: only the changed ones are rewritten
+                    query = f"""
+                        INSERT INTO objects (id, category, type, title, price, price_for, price_value, currency, price_unit, location, photo_URLs, source_URL, content_hash, user_id)
+                        VALUES %s
+                        ON CONFLICT ({get_conflict_target(self.db_schema['objects'])}) DO UPDATE SET
                             type = EXCLUDED.type,
                             title = EXCLUDED.title,
                             price = EXCLUDED.price,
                             price_for = EXCLUDED.price_for,
+                            price_value = EXCLUDED.price_value,
+                            currency = EXCLUDED.currency,
+                            price_unit = EXCLUDED.price_unit,
                             location = EXCLUDED.location,
                             photo_URLs = EXCLUDED.photo_URLs,
                             source_URL = EXCLUDED.source_URL,
-                            user_id = EXCLUDED.user_id;
+                            content_hash = EXCLUDED.content_hash,
+                            user_id = EXCLUDED.user_id,
+                            last_updated = CURRENT_TIMESTAMP
+                        WHERE objects.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+                            OR objects.user_id IS DISTINCT FROM EXCLUDED.user_id;
                     """
-                    cursor.executemany(query, values)
+                    rows = [((value[0], value[1]), (value[-2], value[-1])) for value in values]
+                    existing = get_existing_rows(
+                        cursor, 'objects', ['id', 'category'], [key for key, _ in rows], ['content_hash', 'user_id']
+                    )
+                    execute_values(cursor, query, values)
+                    count_upsert_results('objects', rows, existing)
 
                     # Remove assigned objects from 'unique_records'
-                    print(f"Removing {len(assigned_objects)} assigned objects from 'unique_records'.")
-                    values = [(obj['id'],) for obj in assigned_objects]
+                    logger.info("Removing %s assigned objects from 'unique_records'.", len(assigned_objects))
+                    values = [(obj['id'], obj['category']) for obj in assigned_objects]
                     cursor.executemany("""
                         DELETE FROM unique_records
-                        WHERE id = %s;
+                        WHERE id = %s AND category = %s;
                     """, values)
 
-                    print(f"Successfully saved user {user_data['username']} and assigned {len(assigned_objects)} objects.")
+                    logger.info("Successfully saved user %s and assigned %s objects.", user_data['username'], len(assigned_objects))
                     return user_id
 
         except Exception as e:
-            print(f"Error during transaction: {e}")
+            logger.error("Error during transaction: %s", e)
 
         return None
 
+    def iter_objects_sample(self, categories=None, per_category=None, fraction=1.0, seed=0, itersize=DB_CURSOR_PREFETCH):
+        """
+        Stream a sample of the objects assigned to users through a server-side cursor, `itersize` rows per round trip.
+
+        The objects of every category are ranked by a hash of their ID and the seed, and a sample of a category
+        is a prefix of its ranking, so the sample is random but the same for the same seed and data.
+        Rows come ordered by the rank, which interleaves the categories.
+
+        :param categories: Categories to include (all by default).
+        :param per_category: At most this many objects of every category.
+        :param fraction: At most this share of the objects of every category.
+        :param seed: Seed of the ranking.
+        :return: An iterator of the objects (dictionaries).
+        """
+        columns = [col for col in self.db_schema['objects']['columns'] if col != 'content_hash']
+        column_names = ", ".join(columns)
+        query = f"""
+            SELECT {column_names} FROM (
+                SELECT {column_names},
+                    row_number() OVER (PARTITION BY category ORDER BY md5(%(seed)s || ':' || id::text)) AS sample_rank,
+                    count(*) OVER (PARTITION BY category) AS category_count
+                FROM objects
+                WHERE user_id IS NOT NULL AND (%(categories)s::text[] IS NULL OR category = ANY(%(categories)s))
+            ) ranked
+            WHERE (%(per_category)s::bigint IS NULL OR sample_rank <= %(per_category)s)
+                AND sample_rank <= ceil(%(fraction)s * category_count)
+            ORDER BY sample_rank, category;
+        """
+        params = {
+            'seed': str(seed),
+            'categories': list(categories) if categories else None,
+            'per_category': per_category,
+            'fraction': fraction,
+        }
+        with self.conn as conn:
+            # A named cursor is a server-side one: rows are fetched in chunks instead of all at once
+            with conn.cursor(name='objects_sample') as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield dict(zip(columns, row))
 
 
+class CrawlQueueDB(DailyParserDB):
+    """
+    A Postgres-backed queue of crawl tasks (one task per API page) shared by several worker processes.
+
+    Workers lease tasks with FOR UPDATE SKIP LOCKED, so a task is never handed out twice,
+    and leases that are not completed in time go back to the queue.
+    """
+
+    TASK_COLUMNS = ['id', 'category_id', 'page_offset', 'page_limit', 'last_stamp', 'location', 'attempts']
+
+    def enqueue_tasks(self, tasks):
+        """
+        Add page tasks to the queue. Tasks that are already queued are skipped.
+
+        :param tasks: A list of dictionaries with 'category_id', 'page_offset', 'page_limit', 'last_stamp' and 'location'.
+        :return: Number of new tasks.
+        """
+        if not tasks:
+            return 0
+        values = [
+            (task['category_id'], task['page_offset'], task['page_limit'], task['last_stamp'], str(task['location']))
+            for task in tasks
+        ]
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                rows = execute_values(cursor, """
+                    INSERT INTO crawl_tasks (category_id, page_offset, page_limit, last_stamp, location)
+                    VALUES %s
+                    ON CONFLICT (category_id, page_offset, last_stamp) DO NOTHING
+                    RETURNING id;
+                """, values, fetch=True)
+        logger.info("Enqueued %s of %s crawl tasks.", len(rows), len(tasks))
+        return len(rows)
+
+    def lease_task(self, worker_id, lease_seconds, max_attempts):
+        """
+        Lease the oldest pending task. Tasks whose lease has expired are leased again as well,
+        so the tasks of a crashed worker are picked up without a running monitor.
+
+        :param worker_id: ID of the worker taking the task.
+        :param lease_seconds: For how long the task belongs to the worker.
+        :param max_attempts: Tasks that have been attempted this many times are not handed out anymore.
+        :return: The task as a dictionary or None if there are no pending tasks.
+        """
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    UPDATE crawl_tasks
+                    SET status = 'leased',
+                        lease_owner = %s,
+                        lease_expires_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+                        attempts = attempts + 1,
+                        last_updated = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM crawl_tasks
+                        WHERE (status = 'pending' OR (status = 'leased' AND lease_expires_at < CURRENT_TIMESTAMP))
+                            AND attempts < %s
+                        ORDER BY id
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING {', '.join(self.TASK_COLUMNS)};
+                """, (worker_id, lease_seconds, max_attempts))
+                row = cursor.fetchone()
+        return dict(zip(self.TASK_COLUMNS, row)) if row else None
+
+    def complete_task(self, task_id, worker_id, items_fetched, items_saved):
+        """
+        Mark a leased task as done. A worker whose lease has expired and was given to another worker
+        can't complete the task anymore.
+
+        :return: True if the task has been completed.
+        """
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE crawl_tasks
+                    SET status = 'done', items_fetched = %s, items_saved = %s, error = NULL,
+                        lease_owner = NULL, lease_expires_at = NULL, last_updated = CURRENT_TIMESTAMP
+                    WHERE id = %s AND status = 'leased' AND lease_owner = %s;
+                """, (items_fetched, items_saved, task_id, worker_id))
+                return cursor.rowcount == 1
+
+    def fail_task(self, task_id, worker_id, error, max_attempts):
+        """Return a leased task to the queue, or mark it as failed once it has used up its attempts."""
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE crawl_tasks
+                    SET status = CASE WHEN attempts < %s THEN 'pending' ELSE 'failed' END,
+                        error = %s, lease_owner = NULL, lease_expires_at = NULL, last_updated = CURRENT_TIMESTAMP
+                    WHERE id = %s AND status = 'leased' AND lease_owner = %s;
+                """, (max_attempts, error, task_id, worker_id))
+                return cursor.rowcount == 1
+
+    def release_expired_leases(self, max_attempts):
+        """
+        Put the tasks of workers that didn't report back in time back into the queue,
+        or mark them as failed once they have used up their attempts.
+        """
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE crawl_tasks
+                    SET status = CASE WHEN attempts < %s THEN 'pending' ELSE 'failed' END,
+                        lease_owner = NULL, lease_expires_at = NULL,
+                        error = 'Lease expired', last_updated = CURRENT_TIMESTAMP
+                    WHERE status = 'leased' AND lease_expires_at < CURRENT_TIMESTAMP;
+                """, (max_attempts,))
+                released = cursor.rowcount
+        if released:
+            logger.info("Released %s expired leases.", released)
+        return released
+
+    def get_queue_stats(self):
+        """Return the number of tasks and fetched items per task status."""
+        with self.conn as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT status, COUNT(*), COALESCE(SUM(items_saved), 0)
+                    FROM crawl_tasks
+                    GROUP BY status;
+                """)
+                return {status: {'tasks': count, 'items_saved': saved} for status, count, saved in cursor.fetchall()}
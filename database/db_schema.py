@@ -1,4 +1,10 @@
 
+from core.utilities.enums import CategoryType
+
+
+# A list partition per category ('<table>_<category>'), other categories go to '<table>_default'
+CATEGORY_PARTITIONS = {category.verbose_name: [category.verbose_name] for category in CategoryType}
+
 DB_SCHEMA = {
     'users': {
         'table_name': 'users',
@@ -21,41 +27,101 @@ DB_SCHEMA = {
     'objects': {
         'table_name': 'objects',
         'columns': {
-            "id": "BIGINT PRIMARY KEY",
-            "category": "VARCHAR(64)",
+            "id": "BIGINT",
+            "category": "VARCHAR(64) NOT NULL",
             "type": "VARCHAR(64)",
             "title": "VARCHAR(256)",
             "price": "TEXT",
             "price_for": "VARCHAR(64)",
+            "price_value": "NUMERIC(14, 2)", # Parsed from 'price', NULL if it has no number
+            "currency": "CHAR(3)", # ISO 4217 code
+            "price_unit": "VARCHAR(16)", # 'sale', 'day', 'month', 'm2', ... (see core.utilities.prices)
             "location": "VARCHAR(256)",
             "photo_URLs": "TEXT[]",
             "source_URL": "VARCHAR(256)",
+            "content_hash": "CHAR(32)", # Hash of the content columns, an upsert of unchanged content is skipped
             "last_updated": "TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
             'user_id': 'BIGINT'
         },
-        'unique_constraints': ['source_URL'],
+        # The partition key has to be a part of the primary key and of the unique constraints
+        'primary_key': ['id', 'category'],
+        'partition_by': ('LIST', 'category'),
+        'partitions': CATEGORY_PARTITIONS,
+        'conflict_target': ['id', 'category'],
+        'unique_constraints': ['source_URL', 'category'],
         'foreign_keys': [
             ('user_id', 'users', 'id')
         ],
-        'indexes': [('user_id', 'idx_user_id'),('category', 'idx_category')]
+        'indexes': [
+            ('user_id', 'idx_objects_user_id', 'hash'), # Only ever compared for equality
+            ('last_updated', 'idx_objects_last_updated', 'brin'),
+            ('price_unit, price_value', 'idx_objects_price') # Price ranges of a category (partition)
+        ]
     },
     'unique_records': {
         'table_name': 'unique_records',
         'columns': {
-            "id": "BIGINT PRIMARY KEY",
-            "category": "VARCHAR(64)",
+            "id": "BIGINT",
+            "category": "VARCHAR(64) NOT NULL",
             "type": "VARCHAR(64)",
             "title": "VARCHAR(256)",
             "price": "TEXT",
             "price_for": "VARCHAR(64)",
+            "price_value": "NUMERIC(14, 2)", # Parsed from 'price', NULL if it has no number
+            "currency": "CHAR(3)", # ISO 4217 code
+            "price_unit": "VARCHAR(16)", # 'sale', 'day', 'month', 'm2', ... (see core.utilities.prices)
             "location": "VARCHAR(256)",
             "photo_URLs": "TEXT[]",
-            "source_URL": "VARCHAR(256) UNIQUE",
+            "source_URL": "VARCHAR(256)",
+            "content_hash": "CHAR(32)", # Hash of the content columns, an upsert of unchanged content is skipped
             "last_updated": "TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
         },
-        'unique_constraints': ['source_URL'],
+        'primary_key': ['id', 'category'],
+        'partition_by': ('LIST', 'category'),
+        'partitions': CATEGORY_PARTITIONS,
+        'conflict_target': ['id', 'category'],
+        'unique_constraints': ['source_URL', 'category'],
+        'foreign_keys': [],
+        'indexes': [
+            ('last_updated', 'idx_unique_records_last_updated', 'brin'),
+            ('price_unit, price_value', 'idx_unique_records_price')
+        ]
+    },
+    'crawl_tasks': {
+        'table_name': 'crawl_tasks',
+        'columns': {
+            "id": "BIGSERIAL PRIMARY KEY",
+            "category_id": "INTEGER",
+            "page_offset": "INTEGER",
+            "page_limit": "INTEGER",
+            "last_stamp": "BIGINT",
+            "location": "VARCHAR(64)",
+            "status": "VARCHAR(16) DEFAULT 'pending'", # pending -> leased -> done/failed
+            "attempts": "INTEGER DEFAULT 0",
+            "lease_owner": "VARCHAR(128) NULL",
+            "lease_expires_at": "TIMESTAMP NULL",
+            "items_fetched": "INTEGER NULL",
+            "items_saved": "INTEGER NULL",
+            "error": "TEXT NULL",
+            "last_updated": "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+        },
+        'unique_constraints': ['category_id', 'page_offset', 'last_stamp'],
+        'foreign_keys': [],
+        'indexes': [
+            ('id', 'idx_crawl_tasks_pending', 'btree', "status = 'pending'"), # The next task to lease
+            ('status, lease_expires_at', 'idx_crawl_tasks_lease_expiry') # Expired leases
+        ]
+    },
+    'crawl_watermarks': {
+        'table_name': 'crawl_watermarks',
+        'columns': {
+            "category": "VARCHAR(64) PRIMARY KEY",
+            "newest_id": "BIGINT", # The newest object ID seen by a crawl that caught up with the previous one
+            "last_updated": "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+        },
+        'unique_constraints': [],
         'foreign_keys': [],
-        'indexes': [('category','idx_category')]
+        'indexes': []
     }
 }
 
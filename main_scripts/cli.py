@@ -0,0 +1,143 @@
+"""
+A single entry point of the scripts: python -m main_scripts.cli <command> [options].
+
+Every command imports its script, and with it selenium, pandas, aiohttp, Faker, etc., only when it runs,
+so `--help`, `import-time` and short cron-driven commands don't pay for the dependencies of the others.
+Keep the imports at the top of this module to the standard library.
+"""
+import argparse
+import importlib
+import subprocess
+import sys
+from pathlib import Path
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Command -> the module of its script
+COMMAND_MODULES = {
+    'collect': 'main_scripts.initial_dataset_collector',
+    'daily': 'main_scripts.mock_user_data_scraper',
+    'download': 'main_scripts.download_photos',
+    'replenish': 'main_scripts.replenish_inventory',
+    'crawl': 'main_scripts.distributed_crawl',
+    'duplicates': 'main_scripts.find_duplicates',
+    'export': 'main_scripts.export_dataset',
+}
+
+
+def run_script(module, argv=()):
+    """Run the `main` of a script as if it was started with `python -m <module> <argv>`."""
+    sys.argv = [module, *argv]
+    importlib.import_module(module).main()
+
+
+def run_download(args):
+    from main_scripts.download_photos import download_photos_from_file, replay_failed_downloads
+
+    if args.source_file:
+        download_photos_from_file(args.source_file, args.batch_size, args.user_id)
+    else:
+        replay_failed_downloads(args.batch_size)
+
+
+def measure_import_time(modules):
+    """
+    Import the modules in a fresh interpreter with `-X importtime`.
+
+    :return: A list of (module, self time, cumulative time, nesting level) in microseconds, in import order.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+        capture_output=True, text=True, cwd=BASE_DIR
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Couldn't import {', '.join(modules)}:\n{result.stderr.strip().splitlines()[-1]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative_time, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_time), int(cumulative_time), level))
+    return imports
+
+
+def report_import_time(args):
+    commands = args.commands or ['cli', *COMMAND_MODULES]
+    unknown = [command for command in commands if command != 'cli' and command not in COMMAND_MODULES]
+    if unknown:
+        raise SystemExit(f"Unknown commands: {', '.join(unknown)}. Choose from: cli, {', '.join(COMMAND_MODULES)}.")
+    over_budget = []
+    for command in commands:
+        module = 'main_scripts.cli' if command == 'cli' else COMMAND_MODULES[command]
+        imports = measure_import_time([module])
+        # Top-level entries include everything they imported
+        total_ms = sum(cumulative for _, _, cumulative, level in imports if level == 0) / 1000
+        print(f"{command} ({module}): {total_ms:.0f} ms, {len(imports)} modules")
+        top = sorted((entry for entry in imports if entry[0] != module), key=lambda entry: entry[2], reverse=True)
+        for name, self_time, cumulative_time, _ in top[:args.top]:
+            print(f"  {cumulative_time / 1000:8.1f} ms  {self_time / 1000:8.1f} ms self  {name}")
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            over_budget.append(command)
+
+    if over_budget:
+        print(f"Over the budget of {args.budget_ms} ms: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m main_scripts.cli", description="Avito parser scripts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("collect", help="Collect the initial dataset from the API into a CSV file.")
+    subparsers.add_parser("daily", help="Generate the day's mock users, assign objects to them and download the photos.")
+    subparsers.add_parser("replenish", help="Keep the stock of unique objects of every category replenished.")
+
+    download_parser = subparsers.add_parser(
+        "download", help="Download the photos of the records in a CSV file, or replay the failed downloads."
+    )
+    download_parser.add_argument("--source-file", help="A CSV file in the 'data' folder (replays the dead letters if not set).")
+    download_parser.add_argument("--batch-size", type=int, default=10)
+    download_parser.add_argument("--user-id", type=int)
+
+    for command, help_text in (
+            ("crawl", "Distributed crawl, e.g. `crawl plan --total-goal 12000` (see distributed_crawl.py)."),
+            ("duplicates", "Report or remove near-duplicate photos (see find_duplicates.py)."),
+            ("export", "Export the objects and their photos as WebDataset shards (see export_dataset.py)."),
+    ):
+        # The options, --help included, are passed on to the script
+        subparsers.add_parser(command, help=help_text, add_help=False)
+
+    import_time_parser = subparsers.add_parser(
+        "import-time", help="Report the import time of the commands (python -X importtime)."
+    )
+    import_time_parser.add_argument("commands", nargs="*", metavar="COMMAND",
+                                    help="Commands to measure (all by default; 'cli' is this module alone).")
+    import_time_parser.add_argument("--top", type=int, default=10, help="Slowest imports to show per command.")
+    import_time_parser.add_argument("--budget-ms", type=float,
+                                    help="Exit with code 1 if a command takes longer to import.")
+
+    args, script_args = parser.parse_known_args()
+    if script_args and args.command not in ("crawl", "duplicates", "export"):
+        parser.error(f"unrecognized arguments: {' '.join(script_args)}")
+
+    if args.command == "import-time":
+        report_import_time(args)
+    elif args.command == "download":
+        run_download(args)
+    elif args.command in ("crawl", "duplicates", "export"):
+        run_script(COMMAND_MODULES[args.command], script_args)
+    else:
+        run_script(COMMAND_MODULES[args.command])
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        # Imported here to keep `--help` and `import-time` free of the settings and the logging setup
+        from core.utilities.log import get_logger
+
+        get_logger(__name__).info("Manual shutdown...")
@@ -0,0 +1,89 @@
+import argparse
+import multiprocessing
+
+from core.browsers import UndetectedChromeBrowser
+from core.crawl_queue import CrawlCoordinator, CrawlWorker
+from core.parsers import BaseParser
+from core.settings import BASE_URL, LIMIT, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, DB_NAME, DB_SCHEMA
+from core.utilities.other_functions import runtime_counter
+from core.utilities.proxy_pool import ProxyPool
+from database.db import CrawlQueueDB
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def get_db():
+    """Connect to the database and create the tables and indexes that don't exist yet."""
+    db = CrawlQueueDB(
+        host=DB_HOST,
+        user=DB_USER,
+        port=DB_PORT,
+        password=DB_PASSWORD,
+        db_name=DB_NAME,
+        db_schema=DB_SCHEMA
+    )
+    for schema in DB_SCHEMA.values():
+        db.create_table(schema)
+        db.create_indexes(schema)
+    return db
+
+
+def run_worker(headless=True):
+    """Run a crawl worker with its own browser and database connection until the queue is empty."""
+    browser = UndetectedChromeBrowser(headless=headless, proxy_pool=ProxyPool())
+    driver = browser.get_driver()
+    try:
+        worker = CrawlWorker(BaseParser(browser, base_url=BASE_URL), get_db())
+        worker.run(driver)
+    finally:
+        driver.quit()
+
+
+@runtime_counter
+def main():
+    parser = argparse.ArgumentParser(description="Crawl Avito with several worker processes sharing a Postgres task queue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = subparsers.add_parser("plan", help="Put page tasks into the queue.")
+    plan_parser.add_argument("--total-goal", type=int, required=True, help="Total number of objects to fetch.")
+    plan_parser.add_argument("--limit", type=int, default=LIMIT, help="Number of objects per API call.")
+
+    subparsers.add_parser("monitor", help="Release expired leases and report progress until the queue is done.")
+
+    worker_parser = subparsers.add_parser("worker", help="Run a worker on this host.")
+    worker_parser.add_argument("--no-headless", action="store_true")
+
+    local_parser = subparsers.add_parser("local", help="Plan tasks and run several local worker processes.")
+    local_parser.add_argument("--total-goal", type=int, required=True, help="Total number of objects to fetch.")
+    local_parser.add_argument("--limit", type=int, default=LIMIT, help="Number of objects per API call.")
+    local_parser.add_argument("--workers", type=int, default=2, help="Number of worker processes.")
+
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(headless=not args.no_headless)
+        return
+
+    coordinator = CrawlCoordinator(get_db())
+    if args.command in ("plan", "local"):
+        coordinator.plan(total_goal=args.total_goal, limit=args.limit)
+
+    if args.command == "monitor":
+        coordinator.monitor()
+    elif args.command == "local":
+        # Every worker is a separate process with its own browser, as it would be on separate hosts
+        workers = [multiprocessing.Process(target=run_worker, name=f"crawl-worker-{i}") for i in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        coordinator.monitor(should_stop=lambda: not any(worker.is_alive() for worker in workers))
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("Manual shutdown...")
@@ -1,8 +1,27 @@
 import asyncio
 
-from core.downloader import Downloader
-from core.settings import MINIO_ROOT_USER, MINIO_ROOT_PASSWORD, MINIO_ENDPOINT
+from core.downloader import Downloader, DownloadPipeline
+from core.settings import MINIO_ROOT_USER, MINIO_ROOT_PASSWORD, MINIO_ENDPOINT, PROCESS_IMAGES, HASH_IMAGES
+from core.utilities.images import ImageProcessor
 from core.utilities.minio import MinioClient
+from core.utilities.phash_index import PerceptualHashIndex
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def get_image_processor():
+    """Return an image post-processor if post-processing is enabled in the settings."""
+    return ImageProcessor() if PROCESS_IMAGES else None
+
+
+def get_hash_index():
+    """
+    Return the perceptual-hash index of the saved photos if hashing is enabled in the settings.
+    It's loaded from disk, so the new hashes are added to the saved ones instead of replacing them.
+    """
+    return PerceptualHashIndex.load() if HASH_IMAGES else None
 
 
 # Main function to run the batch download
@@ -18,8 +37,75 @@ def download_and_save_photos(batch_size, source, user_id):
             password=MINIO_ROOT_PASSWORD
     ),
             user_id=user_id,
+            processor=get_image_processor(),
+            hash_index=get_hash_index(),
 
     ).run()
     )
 
 
+def create_photo_pipeline(batch_size, proxy_pool=None):
+    """
+    Create a long-lived pipeline that downloads the photos of the submitted users' objects
+    and saves them in the storage bucket while the caller keeps parsing.
+
+    :param proxy_pool: A ProxyPool shared with the browser (a new one from the settings by default).
+    """
+    return DownloadPipeline(
+        Downloader(
+            batch_size=batch_size,
+            output_storage=MinioClient(
+                endpoint=MINIO_ENDPOINT,
+                root_user=MINIO_ROOT_USER,
+                password=MINIO_ROOT_PASSWORD
+            ),
+            user_id=None,
+            processor=get_image_processor(),
+            hash_index=get_hash_index(),
+            proxy_pool=proxy_pool,
+        )
+    )
+
+
+def download_photos_from_file(source_file, batch_size, user_id=None):
+    """Download the photos of the records in a CSV file from the 'data' folder and save them in the storage bucket."""
+
+    asyncio.run(
+        Downloader(
+            batch_size=batch_size,
+            source_file=source_file,
+            output_storage=MinioClient(
+                endpoint=MINIO_ENDPOINT,
+                root_user=MINIO_ROOT_USER,
+                password=MINIO_ROOT_PASSWORD
+            ),
+            user_id=user_id,
+            processor=get_image_processor(),
+            hash_index=get_hash_index(),
+        ).run()
+    )
+
+
+def replay_failed_downloads(batch_size=1):
+    """Retry the image downloads collected in the dead-letter file and save them in the storage bucket."""
+
+    asyncio.run(
+        Downloader(
+            batch_size=batch_size,
+            output_storage=MinioClient(
+                endpoint=MINIO_ENDPOINT,
+                root_user=MINIO_ROOT_USER,
+                password=MINIO_ROOT_PASSWORD
+            ),
+            user_id=None,
+            processor=get_image_processor(),
+            hash_index=get_hash_index(),
+        ).run(replay=True)
+    )
+
+
+if __name__ == "__main__":
+    try:
+        replay_failed_downloads()
+    except KeyboardInterrupt:
+        logger.info("Manual shutdown...")
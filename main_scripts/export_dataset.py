@@ -0,0 +1,92 @@
+import argparse
+import os
+import time
+
+from core.dataset_export import DatasetExporter
+from core.settings import (
+    DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, DB_NAME, DB_SCHEMA, MINIO_ENDPOINT, MINIO_ROOT_USER, MINIO_ROOT_PASSWORD,
+    BUCKET_NAME, PROCESS_IMAGES, IMAGE_FORMAT, EXPORT_DIR, EXPORT_OBJECTS_PER_SHARD, EXPORT_SHARD_WRITERS,
+    EXPORT_FETCH_WORKERS, EXPORT_FETCH_AHEAD
+)
+from core.utilities.enums import CategoryType
+from core.utilities.images import IMAGE_EXTENSIONS
+from core.utilities.log import get_logger
+from core.utilities.minio import MinioClient
+from core.utilities.other_functions import runtime_counter
+from database.db import DailyParserDB
+
+
+logger = get_logger(__name__)
+
+
+@runtime_counter
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the users' objects and their photos from Postgres and MinIO as WebDataset tar shards."
+    )
+    parser.add_argument("--output-dir", help="Directory of the shards (a new one in data/datasets by default).")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted export in --output-dir with the same settings.")
+    parser.add_argument("--categories", nargs="+", choices=[category.verbose_name for category in CategoryType],
+                        help="Export only these categories.")
+    parser.add_argument("--per-category", type=int,
+                        help="Stratified sample: at most this many objects of every category.")
+    parser.add_argument("--fraction", type=float, default=1.0,
+                        help="Stratified sample: at most this share of the objects of every category.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sampling and of the order of the objects.")
+    parser.add_argument("--objects-per-shard", type=int, default=EXPORT_OBJECTS_PER_SHARD)
+    parser.add_argument("--shard-writers", type=int, default=EXPORT_SHARD_WRITERS, help="Shards written in parallel.")
+    parser.add_argument("--fetch-workers", type=int, default=EXPORT_FETCH_WORKERS,
+                        help="Threads fetching the photos from MinIO.")
+    parser.add_argument("--fetch-ahead", type=int, default=EXPORT_FETCH_AHEAD,
+                        help="Photos a shard writer fetches ahead.")
+    parser.add_argument("--bucket", default=BUCKET_NAME)
+    parser.add_argument("--variant", default='',
+                        help="Suffix of the photo variant, e.g. '-256' for the thumbnails of post-processed photos.")
+    args = parser.parse_args()
+
+    if args.resume and not args.output_dir:
+        parser.error("--resume needs the --output-dir of the export to resume")
+    if not 0 < args.fraction <= 1:
+        parser.error("--fraction must be in (0, 1]")
+    output_dir = args.output_dir or os.path.join(EXPORT_DIR, time.strftime('%Y%m%d-%H%M%S'))
+
+    db = DailyParserDB(
+        host=DB_HOST,
+        user=DB_USER,
+        port=DB_PORT,
+        password=DB_PASSWORD,
+        db_name=DB_NAME,
+        db_schema=DB_SCHEMA
+    )
+    exporter = DatasetExporter(
+        db=db,
+        storage=MinioClient(
+            endpoint=MINIO_ENDPOINT,
+            root_user=MINIO_ROOT_USER,
+            password=MINIO_ROOT_PASSWORD,
+            max_connections=args.fetch_workers
+        ),
+        output_dir=output_dir,
+        bucket_name=args.bucket,
+        objects_per_shard=args.objects_per_shard,
+        shard_writers=args.shard_writers,
+        fetch_workers=args.fetch_workers,
+        fetch_ahead=args.fetch_ahead,
+        extension=IMAGE_EXTENSIONS[IMAGE_FORMAT] if PROCESS_IMAGES else 'jpg',
+        suffix=args.variant,
+    )
+    try:
+        totals = exporter.run(args.categories, args.per_category, args.fraction, args.seed, args.resume)
+    except ValueError as e:
+        parser.error(str(e))
+    logger.info("Samples per category: %s", totals['categories'])
+    if totals['shards']:
+        logger.info("Shards: %s", os.path.join(output_dir, f"shard-{{000000..{totals['shards'] - 1:06d}}}.tar"))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("Manual shutdown...")
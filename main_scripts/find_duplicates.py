@@ -0,0 +1,104 @@
+import argparse
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from core.settings import (
+    MINIO_ENDPOINT, MINIO_ROOT_USER, MINIO_ROOT_PASSWORD, BUCKET_NAME, PHASH_MAX_DISTANCE, IMAGE_PROCESS_WORKERS
+)
+from core.utilities.images import compute_image_hash
+from core.utilities.minio import MinioClient
+from core.utilities.other_functions import runtime_counter
+from core.utilities.phash_index import PerceptualHashIndex
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# Originals are stored as image-<counter>.<ext>, resized variants as image-<counter>-<size>.<ext>
+ORIGINAL_IMAGE_KEY = re.compile(r"image-\d+\.\w+$")
+VARIANT_IMAGE_KEY = re.compile(r"^(.*image-\d+)-[^/.]+\.\w+$")
+CHUNK_SIZE = 1000
+
+
+def update_index(client, index, bucket_name, workers):
+    """
+    Hash the images of the bucket that are not in the index yet and drop the ones that are gone.
+
+    :return: The list of all the keys in the bucket.
+    """
+    stored_keys = list(client.list_image_keys(bucket_name))
+    known_keys = set(index.keys)
+    new_keys = [key for key in stored_keys if ORIGINAL_IMAGE_KEY.search(key) and key not in known_keys]
+    logger.info("%s objects in '%s', %s images to hash.", len(stored_keys), bucket_name, len(new_keys))
+
+    with ThreadPoolExecutor(max_workers=16) as downloads, ProcessPoolExecutor(max_workers=workers) as hashing:
+        # Go chunk by chunk so that only a limited number of images is held in memory
+        for start in range(0, len(new_keys), CHUNK_SIZE):
+            chunk = new_keys[start:start + CHUNK_SIZE]
+            images = list(downloads.map(lambda key: client.get_image(bucket_name, key), chunk))
+            for key, image_hash in zip(chunk, hashing.map(compute_image_hash, images, chunksize=16)):
+                if image_hash is not None:
+                    index.add(key, image_hash)
+                else:
+                    logger.warning("Couldn't decode %s. Skipping.", key)
+            logger.info("Hashed %s/%s images.", min(start + CHUNK_SIZE, len(new_keys)), len(new_keys))
+
+    index.remove(known_keys - set(stored_keys))
+    return stored_keys
+
+
+def group_variants(stored_keys):
+    """Map the key of an original image without its extension ('.../image-1') to the keys of its resized variants."""
+    variants = {}
+    for stored_key in stored_keys:
+        match = VARIANT_IMAGE_KEY.match(stored_key)
+        if match:
+            variants.setdefault(match.group(1), []).append(stored_key)
+    return variants
+
+
+def remove_duplicates(client, index, bucket_name, clusters, stored_keys):
+    """Keep the first image of every cluster and remove the others together with their resized variants."""
+    duplicates = [key for cluster in clusters for key in cluster[1:]]
+    variants = group_variants(stored_keys)
+    for key in duplicates:
+        for stored_key in [key, *variants.get(key.rsplit('.', 1)[0], [])]:
+            client.remove_image(bucket_name, stored_key)
+    index.remove(duplicates)
+    logger.info("Removed %s near-duplicate images.", len(duplicates))
+
+
+@runtime_counter
+def main():
+    parser = argparse.ArgumentParser(description="Report or remove near-duplicate photos in the MinIO bucket.")
+    parser.add_argument("--bucket", default=BUCKET_NAME)
+    parser.add_argument("--max-distance", type=int, default=PHASH_MAX_DISTANCE,
+                        help="Maximum Hamming distance between near-duplicates (out of 64 bits).")
+    parser.add_argument("--workers", type=int, default=IMAGE_PROCESS_WORKERS, help="Number of hashing processes.")
+    parser.add_argument("--remove", action="store_true",
+                        help="Remove all the images of a cluster but the first one.")
+    args = parser.parse_args()
+
+    client = MinioClient(endpoint=MINIO_ENDPOINT, root_user=MINIO_ROOT_USER, password=MINIO_ROOT_PASSWORD)
+    index = PerceptualHashIndex.load()
+    stored_keys = update_index(client, index, args.bucket, args.workers)
+
+    clusters = index.find_clusters(args.max_distance)
+    logger.info(
+        "Found %d clusters of near-duplicates (%d of %d images).",
+        len(clusters), sum(len(cluster) for cluster in clusters), len(index)
+    )
+    for cluster in clusters:
+        logger.info("Keeping %s, near-duplicates: %s", cluster[0], ', '.join(cluster[1:]))
+
+    if args.remove and clusters:
+        remove_duplicates(client, index, args.bucket, clusters, stored_keys)
+    index.save()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("Manual shutdown...")
@@ -5,33 +5,44 @@ import psycopg2
 from core.browsers import UndetectedChromeBrowser
 from core.parsers import BaseParser
 from core.utilities.csv import PandasHelper
+from core.utilities.memory import PROFILER
 from core.utilities.other_functions import runtime_counter
-from core.settings import  LIMIT, BASE_URL
+from core.utilities.proxy_pool import ProxyPool
+from core.utilities.watermarks import FileWatermarkStore
+from core.settings import  LIMIT, BASE_URL, DELTA_CRAWL
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
 
 
 @runtime_counter
 def main():
     try:
-        browser = UndetectedChromeBrowser()
-        parser = BaseParser(browser, base_url=BASE_URL)
-        data = parser.run(driver=browser.get_driver(), total_goal=1200, limit=LIMIT)
-
-        # Save data to a CSV file
+        browser = UndetectedChromeBrowser(proxy_pool=ProxyPool())
+        parser = BaseParser(browser, base_url=BASE_URL, watermark_store=FileWatermarkStore())
         output_filename = "experiment1.csv"
-        df = pd.DataFrame(data)
         helper = PandasHelper()
-        helper.save_data_to_csv_file(
-            df, output_filename,create_new_file=False)
+
+        def save(objects):
+            # Append to the CSV file: a flush costs the same however much has been saved before
+            with PROFILER.stage('dataframe'):
+                df = pd.DataFrame(objects)
+            helper.append_data_to_csv_file(df, output_filename)
+
+        # Over the memory budget the parser hands over what it holds to `save` and carries on
+        data = parser.run(driver=browser.get_driver(), total_goal=1200, limit=LIMIT, delta=DELTA_CRAWL, flush=save)
+        save(data)
 
 
     except psycopg2.OperationalError as e:
-        print(f"Database connection error: {e}")
+        logger.error("Database connection error: %s", e)
     except Exception as e:
-        print(f"{type(e).__name__}: {e}")
+        logger.error("%s: %s", type(e).__name__, e)
 
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print("Manual shutdown...")
\ No newline at end of file
+        logger.info("Manual shutdown...")
\ No newline at end of file
@@ -5,12 +5,17 @@ from core.browsers import ChromeBrowser
 from core.utilities.minio import MinioClient
 from database.db import PostgresDB, DailyParserDB
 
-from core.parsers import DailyParser, generate_user_data
+from core.parsers import DailyParser
 from core.settings import BASE_URL, LIMIT, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, DB_NAME, DB_SCHEMA, USER_COUNT_RANGE, \
-    OBJECT_COUNT_RANGE, MINIO_ENDPOINT, MINIO_ROOT_USER, MINIO_ROOT_PASSWORD
+    OBJECT_COUNT_RANGE, MINIO_ENDPOINT, MINIO_ROOT_USER, MINIO_ROOT_PASSWORD, USER_FACTORY_SEED
 from core.utilities.other_functions import runtime_counter
-from main_scripts.download_photos import download_and_save_photos
-from main_scripts.refactoring_mock_users_script import DailyParserTest
+from core.utilities.proxy_pool import ProxyPool
+from core.utilities.user_factory import MockUserFactory
+from main_scripts.download_photos import create_photo_pipeline
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
 
 
 @runtime_counter
@@ -27,26 +32,35 @@ def main():
     # Initialize the database
     # Create tables
     for table_name, schema in DB_SCHEMA.items():
-        print(f"Creating table: {table_name}")
+        logger.info("Creating table: %s", table_name)
         db.create_table(schema)
 
     # Create indexes
     for table_name, schema in DB_SCHEMA.items():
-        print(f"Creating indexes for table: {table_name}")
+        logger.info("Creating indexes for table: %s", table_name)
         db.create_indexes(schema)
 
-    print("Database initialized.")
-    print("*" * 50)
+    logger.info("Database initialized.")
 
-    browser = ChromeBrowser(headless=True)
+    # The browser and the photo downloader draw from the same proxies
+    proxy_pool = ProxyPool()
+    browser = ChromeBrowser(headless=True, proxy_pool=proxy_pool)
     driver = browser.get_driver()
 
     # App configuration
     user_count = random.randint(*USER_COUNT_RANGE)
-    print(f"Total number of today's users: {user_count}")
+    logger.info("Total number of today's users: %s", user_count)
     total_goal = random.randint(*OBJECT_COUNT_RANGE)
-    print(f"Total number of objects per category per user: {total_goal}")
-    print("*" * 50)
+    logger.info("Total number of objects per category per user: %s", total_goal)
+
+    # Generate all the users of the day at once, unique against the ones already in the database
+    existing_usernames, existing_phone_numbers = db.get_existing_user_keys()
+    user_factory = MockUserFactory(
+        seed=USER_FACTORY_SEED,
+        existing_usernames=existing_usernames,
+        existing_phone_numbers=existing_phone_numbers
+    )
+    users = user_factory.generate(user_count)
 
     # Initialize and run the daily parser
     parser = DailyParser(
@@ -55,29 +69,32 @@ def main():
         base_url=BASE_URL,
         user_count=user_count
     )
-    print("Starting the daily parser...")
-    print("*" * 50)
-    for _ in range(user_count):
-        user_data = generate_user_data()
-        username = user_data['username']
-        print(f"Generating user {username}...")
+    logger.info("Starting the daily parser...")
+    # Photos are downloaded in the background by a single pipeline while the next users are parsed
+    with create_photo_pipeline(batch_size=total_goal, proxy_pool=proxy_pool) as pipeline:
+        for user_data in users:
+            username = user_data['username']
+            logger.info("Generating user %s...", username)
 
-        assigned_objects = parser.run(
-            driver=driver,
-            total_goal=total_goal,
-            limit=LIMIT
-        )
-        user_id = db.save_user_and_objects(user_data, assigned_objects)
-        print(f"Done with object assignment for user {username}.")
-        print("*" * 50)
-        download_and_save_photos(batch_size=total_goal,source=assigned_objects,user_id=user_id)
-        print(f"Done for user {username}.")
-        print("*" * 50)
+            assigned_objects = parser.run(
+                driver=driver,
+                total_goal=total_goal,
+                limit=LIMIT
+            )
+            user_id = db.save_user_and_objects(user_data, assigned_objects)
+            logger.info("Done with object assignment for user %s.", username)
+            if user_id is None:
+                # The claimed objects go back to the inventory, so that the next users get them
+                db.release_claimed_objects(assigned_objects)
+                logger.warning("User %s hasn't been saved. Skipping photo download.", username)
+                continue
+            pipeline.submit(assigned_objects, user_id)
+            logger.info("Photos of user %s have been queued for download.", username)
 
 if __name__ == "__main__":
         try:
             main()
         except KeyboardInterrupt:
-            print("Manual shutdown...")
+            logger.info("Manual shutdown...")
         except Exception as e:
-            print(f"Unexpected error occurred: {e}")
+            logger.error("Unexpected error occurred: %s", e)
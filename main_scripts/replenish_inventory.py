@@ -0,0 +1,40 @@
+from core.browsers import ChromeBrowser
+from core.parsers import InventoryReplenisher
+from core.utilities.proxy_pool import ProxyPool
+from core.settings import BASE_URL, LIMIT, DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, DB_NAME, DB_SCHEMA
+from database.db import DailyParserDB
+from core.utilities.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def main():
+    # PostgresDB instance
+    db = DailyParserDB(
+        host=DB_HOST,
+        user=DB_USER,
+        port=DB_PORT,
+        password=DB_PASSWORD,
+        db_name=DB_NAME,
+        db_schema=DB_SCHEMA
+    )
+    for schema in DB_SCHEMA.values():
+        db.create_table(schema)
+        db.create_indexes(schema)
+
+    browser = ChromeBrowser(headless=True, proxy_pool=ProxyPool())
+    driver = browser.get_driver()
+    try:
+        replenisher = InventoryReplenisher(db=db, browser=browser, base_url=BASE_URL)
+        logger.info("Starting the inventory replenisher...")
+        replenisher.run_forever(driver=driver, limit=LIMIT)
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("Manual shutdown...")
@@ -0,0 +1,155 @@
+"""
+Tests against a scratch Postgres database: set TEST_DB_NAME (and the DB_* settings) to run them.
+The tables of the schema are created in it and truncated before every test.
+"""
+import pytest
+
+from core.settings import DB_HOST, DB_USER, DB_PORT, DB_PASSWORD, TEST_DB_NAME
+from core.utilities.enums import CategoryType
+from database.db_schema import DB_SCHEMA
+
+
+pytestmark = pytest.mark.skipif(not TEST_DB_NAME, reason="Set TEST_DB_NAME to run the Postgres tests.")
+
+CATEGORY = next(iter(CategoryType)).verbose_name
+
+
+@pytest.fixture(scope='module')
+def schema_db():
+    from database.db import CrawlQueueDB
+
+    db = CrawlQueueDB(
+        host=DB_HOST, user=DB_USER, port=DB_PORT, password=DB_PASSWORD, db_name=TEST_DB_NAME, db_schema=DB_SCHEMA
+    )
+    if db.conn is None:
+        pytest.skip(f"Couldn't connect to the test database '{TEST_DB_NAME}'.")
+    for schema in DB_SCHEMA.values():
+        db.create_table(schema)
+        db.create_indexes(schema)
+    yield db
+    db.conn.close()
+
+
+@pytest.fixture
+def db(schema_db):
+    with schema_db.conn as conn, conn.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(DB_SCHEMA)} CASCADE;")
+    return schema_db
+
+
+def make_object(object_id, category=CATEGORY, **values):
+    return {
+        'id': object_id,
+        'category': category,
+        'type': 'item',
+        'title': f"Object {object_id}",
+        'price': '1 200 ₽',
+        'price_for': 'на продажу',
+        'price_value': 1200.0,
+        'currency': 'RUB',
+        'price_unit': 'sale',
+        'location': 'Москва',
+        'photo_URLs': [f"https://example.com/{object_id}.jpg"],
+        'source_URL': f"https://example.com/{object_id}",
+        **values,
+    }
+
+
+def make_user(username):
+    return {
+        'username': username,
+        'phone_number': f"+7{abs(hash(username)) % 10 ** 10:010d}",
+        'email': f"{username}@example.com",
+        'first_name': 'Test',
+        'last_name': 'User',
+        'address': 'Москва',
+        'gender': 'F',
+    }
+
+
+def test_save_to_db_counts_upserts_into_partitions(db):
+    objects = [make_object(1), make_object(2)]
+    assert db.save_to_db('unique_records', objects) == {'inserted': 2, 'updated': 0, 'unchanged': 0}
+
+    changed = [make_object(1), make_object(2, title="Renamed"), make_object(3)]
+    assert db.save_to_db('unique_records', changed) == {'inserted': 1, 'updated': 1, 'unchanged': 1}
+
+    with db.conn as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT title FROM unique_records WHERE id = 2 AND category = %s;", (CATEGORY,))
+        assert cursor.fetchone()[0] == "Renamed"
+
+
+def test_save_to_db_keeps_the_same_id_in_other_categories_apart(db):
+    other_category = list(CategoryType)[1].verbose_name
+    objects = [make_object(1), make_object(1, category=other_category)]
+    assert db.save_to_db('unique_records', objects) == {'inserted': 2, 'updated': 0, 'unchanged': 0}
+
+
+def test_save_user_and_objects_assigns_claimed_objects(db):
+    db.save_to_db('unique_records', [make_object(1), make_object(2)])
+    claimed = db.claim_unique_objects(CATEGORY, 10)
+    assert sorted(obj['id'] for obj in claimed) == [1, 2]
+
+    user_id = db.save_user_and_objects(make_user('tester'), claimed)
+    assert user_id is not None
+    with db.conn as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id, user_id FROM objects ORDER BY id;")
+        assert cursor.fetchall() == [(1, user_id), (2, user_id)]
+        cursor.execute("SELECT count(*) FROM unique_records;")
+        assert cursor.fetchone()[0] == 0
+
+
+def test_indexes_of_partitioned_tables_are_built_concurrently(schema_db):
+    with schema_db.conn as conn, conn.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS idx_objects_price;")
+    schema_db.create_indexes(DB_SCHEMA['objects'], concurrently=True)
+    with schema_db.conn as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT pg_index.indisvalid FROM pg_index
+            JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+            WHERE pg_class.relname = 'idx_objects_price';
+        """)
+        assert cursor.fetchone() == (True,)
+
+
+def test_claims_never_overlap(db):
+    db.save_to_db('unique_records', [make_object(object_id) for object_id in range(1, 6)])
+    first = db.claim_unique_objects(CATEGORY, 3)
+    second = db.claim_unique_objects(CATEGORY, 3)
+    assert len(first) == 3 and len(second) == 2
+    assert not {obj['id'] for obj in first} & {obj['id'] for obj in second}
+    assert db.claim_unique_objects(CATEGORY, 3) == []
+
+
+def test_release_claimed_objects_of_an_unsaved_user(db):
+    db.save_to_db('unique_records', [make_object(1), make_object(2), make_object(3)])
+    owned = db.claim_unique_objects(CATEGORY, 1)
+    user_id = db.save_user_and_objects(make_user('owner'), owned)
+    claimed = db.claim_unique_objects(CATEGORY, 10)
+
+    # The username is taken: the user isn't saved and the objects go back to the inventory
+    assert db.save_user_and_objects(make_user('owner'), claimed) is None
+    assert db.release_claimed_objects(claimed + owned) == 2
+    with db.conn as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM unique_records ORDER BY id;")
+        assert [row[0] for row in cursor.fetchall()] == sorted(obj['id'] for obj in claimed)
+        cursor.execute("SELECT id, user_id FROM objects;")
+        assert cursor.fetchall() == [(owned[0]['id'], user_id)]
+
+
+def test_expired_leases_are_leased_again(db):
+    task = {'category_id': next(iter(CategoryType)).category_id, 'page_limit': 50, 'last_stamp': 0, 'location': 'Москва'}
+    db.enqueue_tasks([{**task, 'page_offset': 0}, {**task, 'page_offset': 50}])
+    crashed = db.lease_task('crashed', lease_seconds=-1, max_attempts=2)
+
+    # Without a monitor releasing it, the expired lease goes to the next worker
+    assert db.lease_task('worker', lease_seconds=60, max_attempts=2)['id'] == crashed['id']
+    assert not db.complete_task(crashed['id'], 'crashed', 0, 0)
+    assert db.complete_task(crashed['id'], 'worker', 0, 0)
+
+    # Until the task has used up its attempts
+    expired = db.lease_task('crashed', lease_seconds=-1, max_attempts=2)
+    assert db.lease_task('crashed', lease_seconds=-1, max_attempts=2)['id'] == expired['id']
+    assert db.lease_task('worker', lease_seconds=60, max_attempts=2) is None
+    assert db.release_expired_leases(max_attempts=2) == 1
+    assert db.get_queue_stats()['failed']['tasks'] == 1
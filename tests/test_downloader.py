@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from core.downloader import Downloader
+from core.utilities.retry import RetryPolicy, DeadLetterFile
+
+
+class FailingDownloader(Downloader):
+    """Fails the first batch right away while the others are still running."""
+
+    def __init__(self, records, tmp_path, **kwargs):
+        super().__init__(
+            batch_size=1, user_id=1, output_storage=object(), dead_letters=DeadLetterFile(str(tmp_path / 'dead.jsonl')),
+            max_concurrent_batches=2, **kwargs
+        )
+        self.records = records
+        self.finished = []
+
+    async def get_objects_from_source(self):
+        for record in self.records:
+            yield record
+
+    async def run_batch_downloads(self, batch):
+        if batch[0]['id'] == 1:
+            raise RuntimeError("batch 1 failed")
+        await asyncio.sleep(0.05)
+        self.finished.append(batch[0]['id'])
+
+
+def test_manage_batch_tasks_raises_the_error_of_a_finished_batch(tmp_path):
+    downloader = FailingDownloader([{'id': 1}, {'id': 2}, {'id': 3}], tmp_path)
+    with pytest.raises(RuntimeError, match="batch 1 failed"):
+        asyncio.run(downloader.manage_batch_tasks())
+    # The other batches still run to the end
+    assert sorted(downloader.finished) == [2, 3]
+
+
+def test_consume_queue_raises_the_error_of_a_finished_batch(tmp_path):
+    downloader = FailingDownloader([], tmp_path)
+
+    async def main():
+        queue = asyncio.Queue()
+        for record_id in (1, 2):
+            queue.put_nowait([{'id': record_id, 'user_id': 1}])
+        queue.put_nowait(None)
+        await downloader.consume_queue(queue)
+
+    with pytest.raises(RuntimeError, match="batch 1 failed"):
+        asyncio.run(main())
+    assert downloader.finished == [2]
+
+
+class StatusSession:
+    """Answers every request with the same status code."""
+
+    def __init__(self, status):
+        self.status = status
+        self.headers = {}
+
+    def get(self, url, proxy=None):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+@pytest.mark.parametrize('status, dead_lettered', [(404, False), (410, False), (503, True), (403, True)])
+def test_only_failures_that_may_recover_are_dead_lettered(tmp_path, status, dead_lettered):
+    dead_letters = DeadLetterFile(str(tmp_path / 'dead.jsonl'))
+    downloader = Downloader(
+        batch_size=1, user_id=1, output_storage=object(), dead_letters=dead_letters,
+        retry_policy=RetryPolicy(max_attempts=1)
+    )
+    downloader.session = StatusSession(status)
+    record = {'id': 1, 'category': 'electronics', 'user_id': 1}
+
+    assert asyncio.run(downloader.download_image(record, "https://example.com/1.jpg", 1)) == (None, None)
+    assert (tmp_path / 'dead.jsonl').exists() == dead_lettered
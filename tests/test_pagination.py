@@ -0,0 +1,104 @@
+import json
+
+from core.pagination import PaginationPlanner
+from core.settings import EMPTY_PAGES_TO_EXHAUST
+from core.utilities.enums import CategoryType
+
+
+CATEGORY, OTHER_CATEGORY = list(CategoryType)[:2]
+
+
+def make_planner(**kwargs):
+    return PaginationPlanner(**{'limit': 300, 'min_limit': 50, 'max_limit': 500, 'target_latency': 5, 'stats_file': None, **kwargs})
+
+
+def test_next_page_covers_the_wanted_items():
+    planner = make_planner()
+    assert planner.next_page(CATEGORY, 100) == (0, 100)
+    assert planner.next_page(CATEGORY, 10) == (0, 50)
+    assert planner.next_page(CATEGORY, 10000) == (0, 300)
+
+
+def test_next_page_counts_on_the_useful_ratio():
+    planner = make_planner()
+    planner.record(CATEGORY, 300, 300, 150)
+    # Half of the items were new, so twice as many are asked for
+    assert planner.next_page(CATEGORY, 100) == (300, 200)
+
+
+def test_offset_moves_by_the_returned_items():
+    planner = make_planner()
+    planner.record_page(CATEGORY, 300, 120)
+    planner.record_page(CATEGORY, 120, 120)
+    assert planner.next_page(CATEGORY, 1000)[0] == 240
+    assert planner.next_page(OTHER_CATEGORY, 1000)[0] == 0
+
+
+def test_limit_is_capped_at_the_largest_returned_page():
+    planner = make_planner()
+    planner.record_page(CATEGORY, 300, 120)
+    assert planner.next_page(CATEGORY, 1000) == (120, 120)
+
+
+def test_limit_shrinks_on_slow_pages_and_grows_on_fast_ones():
+    planner = make_planner()
+    planner.record_page(CATEGORY, 300, 300, latency=10)
+    assert planner.get_state(CATEGORY).limit == 225
+
+    planner = make_planner()
+    planner.record_page(CATEGORY, 300, 300, latency=1)
+    assert planner.get_state(CATEGORY).limit == 375
+    for _ in range(5):
+        planner.record_page(CATEGORY, 500, 500, latency=1)
+    assert planner.get_state(CATEGORY).limit == 500
+
+
+def test_category_is_exhausted_after_empty_pages():
+    planner = make_planner()
+    for _ in range(EMPTY_PAGES_TO_EXHAUST - 1):
+        planner.record_page(CATEGORY, 300, 0)
+    assert not planner.is_exhausted(CATEGORY)
+    planner.record_page(CATEGORY, 300, 0)
+    assert planner.is_exhausted(CATEGORY)
+
+
+def test_next_request_goes_round_robin_and_skips_exhausted_categories():
+    planner = make_planner()
+    categories = [CATEGORY, OTHER_CATEGORY]
+    category, _, _ = planner.next_request(categories, 1000)
+    planner.record_page(category, 300, 300)
+    assert planner.next_request(categories, 1000)[0] != category
+
+    for _ in range(EMPTY_PAGES_TO_EXHAUST):
+        planner.record_page(OTHER_CATEGORY, 300, 0)
+    assert planner.next_request(categories, 1000)[0] == CATEGORY
+    assert planner.next_request(categories, 1000, skip={CATEGORY.verbose_name}) is None
+    assert planner.next_request(categories, 0) is None
+
+
+def test_stats_are_saved_and_loaded(tmp_path):
+    stats_file = tmp_path / 'stats' / 'pagination.json'
+    planner = make_planner(stats_file=str(stats_file))
+    planner.record(CATEGORY, 300, 120, 60, latency=1)
+    planner.save_stats()
+    assert json.loads(stats_file.read_text())[CATEGORY.verbose_name]['limit'] == 120
+
+    planner = make_planner(stats_file=str(stats_file))
+    # The page size and the yield carry over, the offset starts again
+    assert planner.next_page(CATEGORY, 30) == (0, 60)
+
+
+
+def test_fixed_limit_is_never_tuned():
+    planner = make_planner(fixed_limit=True)
+    planner.record(CATEGORY, 300, 120, 10, latency=20)
+    assert planner.next_page(CATEGORY, 10) == (120, 300)
+
+
+def test_fixed_limit_ignores_the_stats_file(tmp_path):
+    stats_file = tmp_path / 'pagination.json'
+    stats_file.write_text(json.dumps({CATEGORY.verbose_name: {'limit': 120, 'useful_ratio': 0.5}}))
+    planner = make_planner(stats_file=str(stats_file), fixed_limit=True)
+    assert planner.next_page(CATEGORY, 30) == (0, 300)
+    planner.save_stats()
+    assert json.loads(stats_file.read_text())[CATEGORY.verbose_name]['limit'] == 120
@@ -0,0 +1,61 @@
+import numpy as np
+
+from core.utilities import phash_index
+from core.utilities.phash_index import PerceptualHashIndex, hamming_distances
+
+
+def make_index(tmp_path, hashes):
+    index = PerceptualHashIndex(str(tmp_path / 'phash_index.npz'))
+    for key, image_hash in hashes.items():
+        index.add(key, image_hash)
+    return index
+
+
+def test_hamming_distances():
+    queries = np.array([0, 0xFF], dtype=np.uint64)
+    hashes = np.array([0, 1, 0xF0, 2 ** 64 - 1], dtype=np.uint64)
+    assert hamming_distances(queries, hashes).tolist() == [[0, 1, 4, 64], [8, 7, 4, 56]]
+
+
+def test_search_returns_matches_within_the_distance_sorted(tmp_path):
+    index = make_index(tmp_path, {'a': 0b1111, 'b': 0b0111, 'c': 0b0000, 'd': 2 ** 64 - 1})
+    assert index.search([0b1111], max_distance=4) == [[('a', 0), ('b', 1), ('c', 4)]]
+    assert index.search([0b1111, 2 ** 63], max_distance=0) == [[('a', 0)], []]
+
+
+def test_search_of_an_empty_index(tmp_path):
+    assert make_index(tmp_path, {}).search([1, 2]) == [[], []]
+
+
+def test_search_in_chunks(tmp_path, monkeypatch):
+    # One query per chunk of the distance matrix
+    monkeypatch.setattr(phash_index, 'SEARCH_CHUNK_CELLS', 3)
+    index = make_index(tmp_path, {'a': 0, 'b': 1, 'c': 0b111 << 40})
+    assert index.search([0, 0b111 << 40, 3], max_distance=1) == [[('a', 0), ('b', 1)], [('c', 0)], [('b', 1)]]
+
+
+def test_find_clusters(tmp_path):
+    index = make_index(tmp_path, {'a': 0b0000, 'b': 0b0001, 'c': 0b0011, 'd': 2 ** 64 - 1, 'e': 2 ** 64 - 2, 'f': 0xFFFF << 16})
+    # 'a' and 'c' are two bits apart, but they are chained by 'b'
+    assert sorted(index.find_clusters(max_distance=1)) == [['a', 'b', 'c'], ['d', 'e']]
+
+
+def test_remove(tmp_path):
+    index = make_index(tmp_path, {'a': 0, 'b': 1, 'c': 2})
+    index.remove(['b'])
+    assert index.keys == ['a', 'c']
+    assert index.hashes.tolist() == [0, 2]
+    assert index.search([1], max_distance=1) == [[('a', 1)]]
+
+
+def test_save_and_load(tmp_path):
+    index = make_index(tmp_path, {'user-1/object-1/image-1.jpg': 2 ** 64 - 1, 'user-1/object-1/image-2.jpg': 5})
+    index.save()
+    loaded = PerceptualHashIndex.load(index.path)
+    assert loaded.keys == index.keys
+    assert loaded.hashes.dtype == np.uint64
+    assert loaded.hashes.tolist() == [2 ** 64 - 1, 5]
+
+
+def test_load_without_a_file(tmp_path):
+    assert len(PerceptualHashIndex.load(str(tmp_path / 'missing.npz'))) == 0
@@ -0,0 +1,84 @@
+import random
+import threading
+
+import pytest
+
+from core.pagination import PaginationPlanner
+from core.prefetch import Page, PagePrefetcher
+from core.utilities.enums import CategoryType
+
+
+def consume(prefetcher, process=lambda page: None, timeout=10):
+    """Iterate over the pages in another thread, so that a hung prefetcher fails the test instead of blocking it."""
+    pages = []
+    errors = []
+
+    def run():
+        try:
+            with prefetcher:
+                for page in prefetcher:
+                    process(page)
+                    pages.append(page)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "The prefetcher didn't finish"
+    if errors:
+        raise errors[0]
+    return pages
+
+
+def test_ends_when_the_pending_floats_dont_add_up_to_zero():
+    # 0.1 + 0.2 + 0.3 - 0.1 - 0.2 - 0.3 != 0
+    expected = iter([0.1, 0.2, 0.3])
+    requests = iter(range(3))
+
+    pages = consume(PagePrefetcher(
+        lambda pending: next(requests, None),
+        lambda request: Page(None, request, 1, [], next(expected)),
+        depth=3,
+    ))
+    assert [page.offset for page in pages] == [0, 1, 2]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_ends_when_every_category_is_exhausted(seed):
+    rng = random.Random(seed)
+    categories = list(CategoryType)
+    sizes = {category: rng.randint(0, 2000) for category in categories}
+    planner = PaginationPlanner(limit=300, min_limit=50, max_limit=500, stats_file=None)
+
+    def fetch(request):
+        category, offset, limit = request
+        items = max(0, min(limit, sizes[category] - offset))
+        planner.record_page(category, limit, items)
+        return Page(category, offset, limit, list(range(items)), planner.expected_useful(category, items))
+
+    def process(page):
+        planner.record_yield(page.category, len(page.objects), round(len(page.objects) * rng.random()))
+
+    pages = consume(PagePrefetcher(
+        lambda pending: planner.next_request(categories, 10 ** 6 - pending), fetch, depth=rng.randint(1, 4)
+    ), process)
+    assert all(planner.is_exhausted(category) for category in categories)
+    for category in categories:
+        assert sum(len(page.objects) for page in pages if page.category == category) == sizes[category]
+
+
+def test_raises_the_errors_of_the_fetch_thread():
+    def fetch(request):
+        raise ValueError("fetch failed")
+
+    with pytest.raises(ValueError, match="fetch failed"):
+        consume(PagePrefetcher(lambda pending: 0, fetch, depth=2))
+
+
+def test_fetches_in_the_consumers_thread_without_depth():
+    requests = iter(range(3))
+    pages = consume(PagePrefetcher(
+        lambda pending: next(requests, None), lambda request: Page(None, request, 1, [], 1), depth=0
+    ))
+    assert [page.offset for page in pages] == [0, 1, 2]
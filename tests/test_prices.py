@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from core.utilities.prices import add_price_columns, map_distinct, normalize_prices
+
+
+@pytest.mark.parametrize('price, price_for, expected', [
+    ("1 200 000 ₽", "на продажу", (1200000.0, 'RUB', 'sale')),
+    ("2 500,50 руб.", "за сутки", (2500.5, 'RUB', 'day')),
+    ("35 000 ₽", "в месяц", (35000.0, 'RUB', 'month')),
+    ("$1,200", "", (1200.0, 'USD', None)),
+    ("$1,200.50", "", (1200.5, 'USD', None)),
+    ("1.200.000 €", "", (1200000.0, 'EUR', None)),
+    ("1.200,50 €", "", (1200.5, 'EUR', None)),
+    ("1,5 ₽", "", (1.5, 'RUB', None)),
+    ("990 €", "за м²", (990.0, 'EUR', 'm2')),
+    ("Цена не указана", None, (None, None, None)),
+    ("Договорная", "за услугу", (None, None, 'service')),
+    ("500 ₽", "за что-то новое", (500.0, 'RUB', None)),
+    (None, None, (None, None, None)),
+])
+def test_normalize_prices(price, price_for, expected):
+    [obj] = normalize_prices([{'price': price, 'price_for': price_for}])
+    assert (obj['price_value'], obj['currency'], obj['price_unit']) == expected
+
+
+def test_normalize_prices_keeps_other_keys_and_order():
+    objects = [{'id': 1, 'price': "100 ₽", 'price_for': None}, {'id': 2, 'price': "200 $", 'price_for': "в час"}]
+    assert normalize_prices(objects) is objects
+    assert [(obj['id'], obj['price_value'], obj['currency'], obj['price_unit']) for obj in objects] == [
+        (1, 100.0, 'RUB', None),
+        (2, 200.0, 'USD', 'hour'),
+    ]
+
+
+def test_normalize_prices_of_an_empty_page():
+    assert normalize_prices([]) == []
+
+
+def test_map_distinct_returns_none_for_missing_and_unknown_values():
+    mapped = map_distinct(pd.Series(['₽', 'USD', 'xyz', None, '₽']), {'₽': 'RUB', 'usd': 'USD'})
+    assert mapped.tolist() == ['RUB', 'USD', None, None, 'RUB']
+
+
+def test_add_price_columns():
+    df = add_price_columns(pd.DataFrame({'price': ["1 000 ₽", "Договорная"], 'price_for': ["за сутки", None]}))
+    assert df['price_value'].iloc[0] == 1000.0
+    assert pd.isna(df['price_value'].iloc[1])
+    assert df['currency'].iloc[0] == 'RUB'
+    assert df['price_unit'].iloc[0] == 'day'
@@ -0,0 +1,144 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, UTC
+from email.utils import format_datetime
+
+import pytest
+
+from core.utilities.retry import RetryPolicy, CircuitBreaker, DeadLetterFile
+
+
+@pytest.mark.parametrize('value, expected', [
+    ("120", 120.0),
+    ("0.5", 0.5),
+    ("-3", 0.0),
+    (None, None),
+    ("", None),
+    ("soon", None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert RetryPolicy.parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    retry_at = datetime.now(UTC) + timedelta(seconds=60)
+    delay = RetryPolicy.parse_retry_after(format_datetime(retry_at, usegmt=True))
+    assert 55 <= delay <= 60
+
+
+def test_parse_retry_after_http_date_in_the_past():
+    assert RetryPolicy.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_get_delay_is_bounded_by_the_backoff():
+    policy = RetryPolicy(base_delay=1, max_delay=10)
+    for attempt in range(1, 8):
+        assert 0 <= policy.get_delay(attempt) <= min(10, 2 ** (attempt - 1))
+
+
+def test_get_delay_honors_retry_after_up_to_max_delay():
+    policy = RetryPolicy(base_delay=1, max_delay=10)
+    assert policy.get_delay(1, retry_after=5) >= 5
+    assert policy.get_delay(1, retry_after=60) == 10
+
+
+def test_circuit_opens_after_consecutive_failures(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('core.utilities.retry.time.monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=30)
+
+    breaker.record_failure('cdn')
+    breaker.record_failure('cdn')
+    assert not breaker.is_open('cdn')
+    breaker.record_failure('cdn')
+    assert breaker.is_open('cdn')
+    assert not breaker.is_open('other')
+
+    now[0] += 31
+    assert not breaker.is_open('cdn')
+    # Half-open: the first failure after the cooldown opens the circuit again
+    breaker.record_failure('cdn')
+    assert breaker.is_open('cdn')
+
+
+def test_circuit_closes_on_success(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('core.utilities.retry.time.monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30)
+
+    breaker.record_failure('cdn')
+    breaker.record_success('cdn')
+    breaker.record_failure('cdn')
+    assert not breaker.is_open('cdn')
+
+
+def test_circuit_cooldown_honors_retry_after(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('core.utilities.retry.time.monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=30)
+
+    breaker.record_failure('cdn', retry_after=120)
+    now[0] += 60
+    assert breaker.is_open('cdn')
+    now[0] += 61
+    assert not breaker.is_open('cdn')
+
+
+def write_dead_letters(dead_letters, urls):
+    async def write():
+        for counter, url in enumerate(urls, 1):
+            await dead_letters.write({'id': 1, 'category': 'electronics', 'user_id': 1}, url, counter, "Status code 503")
+    asyncio.run(write())
+
+
+def read_urls(path):
+    with open(path) as f:
+        return [json.loads(line)['url'] for line in f]
+
+
+def test_replay_removes_the_entries_once_it_has_finished(tmp_path):
+    dead_letters = DeadLetterFile(str(tmp_path / 'dead.jsonl'))
+    write_dead_letters(dead_letters, ["https://example.com/1.jpg", "https://example.com/2.jpg"])
+
+    async def replay():
+        async with dead_letters.replay() as entries:
+            assert [entry['url'] for entry in entries] == ["https://example.com/1.jpg", "https://example.com/2.jpg"]
+            # The entries are kept on disk while they are being replayed
+            assert read_urls(f"{dead_letters.path}.replaying") == [entry['url'] for entry in entries]
+            await dead_letters.write(entries[1], entries[1]['url'], entries[1]['counter'], "Status code 503")
+
+    asyncio.run(replay())
+    assert not (tmp_path / 'dead.jsonl.replaying').exists()
+    # Only the entry that failed again is left
+    assert read_urls(dead_letters.path) == ["https://example.com/2.jpg"]
+
+
+def test_interrupted_replay_is_merged_into_the_next_one(tmp_path):
+    dead_letters = DeadLetterFile(str(tmp_path / 'dead.jsonl'))
+    write_dead_letters(dead_letters, ["https://example.com/1.jpg", "https://example.com/2.jpg"])
+
+    async def crash():
+        async with dead_letters.replay() as entries:
+            # Written back before the crash, so it is in both files
+            await dead_letters.write(entries[0], entries[0]['url'], entries[0]['counter'], "Status code 503")
+            raise RuntimeError("crashed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(crash())
+    assert (tmp_path / 'dead.jsonl.replaying').exists()
+    write_dead_letters(dead_letters, ["https://example.com/3.jpg"])
+
+    async def replay():
+        async with dead_letters.replay() as entries:
+            return sorted(entry['url'] for entry in entries)
+
+    assert asyncio.run(replay()) == ["https://example.com/1.jpg", "https://example.com/2.jpg", "https://example.com/3.jpg"]
+    assert not (tmp_path / 'dead.jsonl').exists() and not (tmp_path / 'dead.jsonl.replaying').exists()
+
+
+def test_replay_without_a_file(tmp_path):
+    async def replay():
+        async with DeadLetterFile(str(tmp_path / 'dead.jsonl')).replay() as entries:
+            return entries
+
+    assert asyncio.run(replay()) == []